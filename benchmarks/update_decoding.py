@@ -0,0 +1,172 @@
+"""
+Микробенчмарк разбора апдейтов webhook (CPU на один апдейт)
+
+Запуск из корня проекта:
+    python -m benchmarks.update_decoding [итераций]
+
+Сравнивает:
+    baseline   - json.loads + Update(**dict) (как было в webhook)
+    validate   - Update.model_validate_json (разбор средствами pydantic)
+    fast_path  - decode_update (orjson + model_validate, отбрасывание ненужных типов)
+"""
+import json
+import sys
+import time
+from aiogram.types import Update
+from src.web.update_decoding import decode_update, orjson
+
+# Типы апдейтов, на которые есть хендлеры у бота
+UPDATE_TYPES = frozenset({"message", "callback_query", "pre_checkout_query"})
+
+USER = {
+    "id": 123456789,
+    "is_bot": False,
+    "first_name": "Иван",
+    "last_name": "Петров",
+    "username": "ivan_petrov",
+    "language_code": "ru",
+}
+CHAT = {
+    "id": 123456789,
+    "first_name": "Иван",
+    "last_name": "Петров",
+    "username": "ivan_petrov",
+    "type": "private",
+}
+
+
+def _photo_sizes():
+    return [
+        {
+            "file_id": f"AgACAgIAAxkBAAIBZ2Zk{size}Qm9vVZ8Jm3hKq1s0vT5yP9wAAJz2DEbGk3hS0q7c4k5uT0AAQADAgADeQADNQQ",
+            "file_unique_id": f"AQADc9gxGxpN4Ut{size}",
+            "file_size": size * 97,
+            "width": size,
+            "height": size * 3 // 4,
+        }
+        for size in (90, 320, 800, 1280)
+    ]
+
+
+PAYLOADS = {
+    "command": {
+        "update_id": 100000001,
+        "message": {
+            "message_id": 501,
+            "from": USER,
+            "chat": CHAT,
+            "date": 1718000000,
+            "text": "/start",
+            "entities": [{"offset": 0, "length": 6, "type": "bot_command"}],
+        },
+    },
+    "photo": {
+        "update_id": 100000002,
+        "message": {
+            "message_id": 502,
+            "from": USER,
+            "chat": CHAT,
+            "date": 1718000001,
+            "media_group_id": "13724529876312345",
+            "photo": _photo_sizes(),
+            "caption": "Улучшить, пожалуйста",
+        },
+    },
+    "video": {
+        "update_id": 100000003,
+        "message": {
+            "message_id": 503,
+            "from": USER,
+            "chat": CHAT,
+            "date": 1718000002,
+            "video": {
+                "duration": 94,
+                "width": 1920,
+                "height": 1080,
+                "file_name": "IMG_2041.MOV",
+                "mime_type": "video/quicktime",
+                "thumbnail": _photo_sizes()[1],
+                "file_id": "BAACAgIAAxkBAAIBaGZkQm9vVZ8Jm3hKq1s0vT5yP9wAAi5JAAIaTeFLwq7c4k5uT0AeBA",
+                "file_unique_id": "AgADLkkAAhpN4Us",
+                "file_size": 187654321,
+            },
+        },
+    },
+    "callback": {
+        "update_id": 100000004,
+        "callback_query": {
+            "id": "530279127581234567",
+            "from": USER,
+            "chat_instance": "-6029435172783011234",
+            "data": "vid_model:prob-4",
+            "message": {
+                "message_id": 504,
+                "from": {"id": 7000000001, "is_bot": True, "first_name": "Topaz AI", "username": "topaz_ai_bot"},
+                "chat": CHAT,
+                "date": 1718000003,
+                "text": "🎬 Выберите модель обработки видео",
+                "reply_markup": {
+                    "inline_keyboard": [
+                        [{"text": f"Модель {index}", "callback_data": f"vid_model:model-{index}"}]
+                        for index in range(8)
+                    ] + [[{"text": "❌ Отмена", "callback_data": "cancel"}]],
+                },
+            },
+        },
+    },
+    "my_chat_member": {
+        "update_id": 100000005,
+        "my_chat_member": {
+            "chat": CHAT,
+            "from": USER,
+            "date": 1718000004,
+            "old_chat_member": {"user": {"id": 7000000001, "is_bot": True, "first_name": "Topaz AI"}, "status": "member"},
+            "new_chat_member": {"user": {"id": 7000000001, "is_bot": True, "first_name": "Topaz AI"}, "status": "kicked", "until_date": 0},
+        },
+    },
+}
+
+
+def _baseline(raw: bytes):
+    return Update(**json.loads(raw))
+
+
+def _validate(raw: bytes):
+    return Update.model_validate_json(raw)
+
+
+def _fast_path(raw: bytes):
+    return decode_update(raw, UPDATE_TYPES)
+
+
+def _measure(decoder, raw: bytes, iterations: int) -> float:
+    """Микросекунд CPU на один апдейт"""
+    decoder(raw)
+    start = time.process_time()
+    for _ in range(iterations):
+        decoder(raw)
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    decoders = {"baseline": _baseline, "validate": _validate, "fast_path": _fast_path}
+    corpus = {name: json.dumps(payload, ensure_ascii=False).encode() for name, payload in PAYLOADS.items()}
+
+    print(f"orjson: {'yes' if orjson else 'no (json fallback)'}, iterations: {iterations}")
+    print(f"{'payload':<16}{'bytes':>7}" + "".join(f"{name:>12}" for name in decoders) + "   (µs CPU/update)")
+
+    totals = dict.fromkeys(decoders, 0.0)
+    for name, raw in corpus.items():
+        row = f"{name:<16}{len(raw):>7}"
+        for decoder_name, decoder in decoders.items():
+            micros = _measure(decoder, raw, iterations)
+            totals[decoder_name] += micros
+            row += f"{micros:>12.1f}"
+        print(row)
+
+    print(f"{'mean':<16}{'':>7}" + "".join(f"{totals[name] / len(corpus):>12.1f}" for name in decoders))
+
+
+if __name__ == "__main__":
+    main()
@@ -52,6 +52,9 @@ CREATE TABLE IF NOT EXISTS tasks (
     cost FLOAT NOT NULL,
     model VARCHAR(100) NOT NULL,
     input_file_id VARCHAR(255),
+    input_file_unique_id VARCHAR(255),
+    parent_task_id INT NULL,
+    output_file_id VARCHAR(255),
     output_file_url TEXT,
     topaz_request_id VARCHAR(255),
     parameters TEXT,
@@ -62,7 +65,30 @@ CREATE TABLE IF NOT EXISTS tasks (
     INDEX idx_user_id (user_id),
     INDEX idx_status (status),
     INDEX idx_topaz_request_id (topaz_request_id),
-    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    INDEX idx_tasks_input_unique_model (input_file_unique_id, model),
+    INDEX idx_parent_task_id (parent_task_id),
+    INDEX idx_tasks_status_updated (status, updated_at),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (parent_task_id) REFERENCES tasks(id) ON DELETE SET NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Task timings table (время этапов обработки для оценки ETA)
+CREATE TABLE IF NOT EXISTS task_timings (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    task_id INT NOT NULL UNIQUE,
+    task_type VARCHAR(50) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    duration_seconds FLOAT NULL,
+    pixels BIGINT NULL,
+    input_size BIGINT NULL,
+    download_seconds FLOAT NULL,
+    upload_seconds FLOAT NULL,
+    processing_seconds FLOAT NULL,
+    delivery_seconds FLOAT NULL,
+    total_seconds FLOAT NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_task_timings_model_created (model, created_at),
+    FOREIGN KEY (task_id) REFERENCES tasks(id) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Broadcasts table
@@ -0,0 +1,8 @@
+-- Объединение дублирующихся задач (одинаковый файл + модель + параметры)
+ALTER TABLE tasks
+    ADD COLUMN input_file_unique_id VARCHAR(255) NULL AFTER input_file_id,
+    ADD COLUMN parent_task_id INT NULL AFTER input_file_unique_id,
+    ADD COLUMN output_file_id VARCHAR(255) NULL AFTER parent_task_id,
+    ADD INDEX idx_tasks_input_unique_model (input_file_unique_id, model),
+    ADD INDEX idx_parent_task_id (parent_task_id),
+    ADD CONSTRAINT fk_tasks_parent FOREIGN KEY (parent_task_id) REFERENCES tasks(id) ON DELETE SET NULL;
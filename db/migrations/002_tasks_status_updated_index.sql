@@ -0,0 +1,3 @@
+-- Индекс для поиска зависших задач (status = 'processing' AND updated_at < ...)
+ALTER TABLE tasks
+    ADD INDEX idx_tasks_status_updated (status, updated_at);
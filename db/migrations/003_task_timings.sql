@@ -0,0 +1,18 @@
+-- Тайминги этапов задач для оценки времени обработки (ProcessingTimeEstimator)
+CREATE TABLE IF NOT EXISTS task_timings (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    task_id INT NOT NULL UNIQUE,
+    task_type VARCHAR(50) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    duration_seconds FLOAT NULL,
+    pixels BIGINT NULL,
+    input_size BIGINT NULL,
+    download_seconds FLOAT NULL,
+    upload_seconds FLOAT NULL,
+    processing_seconds FLOAT NULL,
+    delivery_seconds FLOAT NULL,
+    total_seconds FLOAT NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_task_timings_model_created (model, created_at),
+    FOREIGN KEY (task_id) REFERENCES tasks(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
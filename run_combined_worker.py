@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Прямой запуск комбинированного ARQ worker (image + video в одном процессе)
+Обходит проблему с uvloop event loop в Python 3.11+
+"""
+import asyncio
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+async def main():
+    from src.workers.combined import run_combined_worker
+    
+    logger.info("✅ Starting combined worker...")
+    
+    # SIGTERM: перестаем брать задачи в обеих очередях, текущие завершаем или передаем
+    await run_combined_worker()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("🛑 Combined worker stopped by user")
+    except Exception as e:
+        logger.error(f"❌ Combined worker error: {e}", exc_info=True)
+        raise
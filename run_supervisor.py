@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Запуск супервизора комбинированных воркеров
+Держит от SUPERVISOR_MIN_PROCESSES до SUPERVISOR_MAX_PROCESSES процессов по глубине очередей
+"""
+import asyncio
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+async def main():
+    from src.workers.supervisor import run_supervisor
+    
+    logger.info("✅ Starting worker supervisor...")
+    await run_supervisor()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("🛑 Supervisor stopped by user")
+    except Exception as e:
+        logger.error(f"❌ Supervisor error: {e}", exc_info=True)
+        raise
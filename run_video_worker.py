@@ -16,21 +16,37 @@ async def main():
     from arq import Worker
     from src.workers.settings import get_redis_settings
     from src.workers.video_worker import WorkerSettings
+    from src.workers.drain import install_drain_handlers
+    from src.core.config import settings
     
     logger.info("✅ Starting video worker...")
     
     worker = Worker(
         functions=WorkerSettings.functions,
+        cron_jobs=WorkerSettings.cron_jobs,
         redis_settings=get_redis_settings(),
         max_jobs=WorkerSettings.max_jobs,
         job_timeout=WorkerSettings.job_timeout,
         keep_result=WorkerSettings.keep_result,
+        max_tries=WorkerSettings.max_tries,
         on_startup=WorkerSettings.on_startup,
         on_shutdown=WorkerSettings.on_shutdown,
         queue_name=WorkerSettings.queue_name,
+        handle_signals=False,
+        job_completion_wait=settings.WORKER_DRAIN_TIMEOUT,
     )
     
-    await worker.main()
+    # SIGTERM: перестаем брать задачи, текущие завершаем или передаем
+    install_drain_handlers(worker)
+    
+    # main_task нужен ARQ, чтобы остановить цикл воркера по сигналу
+    worker.main_task = asyncio.ensure_future(worker.main())
+    try:
+        await worker.main_task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await worker.close()
 
 if __name__ == "__main__":
     try:
@@ -4,7 +4,9 @@ from aiogram.types import (
     InlineKeyboardMarkup, 
     InlineKeyboardButton
 )
-from src.services.pricing import GENERATION_PACKAGES, IMAGE_MODELS, VIDEO_MODELS
+from typing import List
+from src.services.pricing import GENERATION_PACKAGES, IMAGE_MODELS, VIDEO_MODELS, COMPARE_MODELS
+from src.core.config import settings
 
 
 def main_keyboard() -> ReplyKeyboardMarkup:
@@ -63,12 +65,12 @@ def email_keyboard(package_id: str) -> InlineKeyboardMarkup:
     ])
 
 
-def image_models_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура выбора модели для фото"""
+def image_models_keyboard(photos: int = 1) -> InlineKeyboardMarkup:
+    """Клавиатура выбора модели для фото (для альбома - цена за все фото)"""
     buttons = []
     
     for model_key, model_info in IMAGE_MODELS.items():
-        text = f"{model_info['description']} — {int(model_info['cost'])} ген."
+        text = f"{model_info['description']} — {int(model_info['cost'] * photos)} ген."
         buttons.append([
             InlineKeyboardButton(
                 text=text,
@@ -76,30 +78,83 @@ def image_models_keyboard() -> InlineKeyboardMarkup:
             )
         ])
     
+    if photos == 1:
+        buttons.append([InlineKeyboardButton(text="🔀 Сравнить модели", callback_data="img_compare")])
     buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def video_models_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура выбора модели для видео"""
+def image_compare_keyboard(selected: List[str]) -> InlineKeyboardMarkup:
+    """Выбор моделей для сравнения на одном фото"""
+    buttons = []
+    
+    for model_key in COMPARE_MODELS:
+        model_info = IMAGE_MODELS[model_key]
+        mark = "✅" if model_key in selected else "▫️"
+        buttons.append([
+            InlineKeyboardButton(
+                text=f"{mark} {model_info['description']} — {int(model_info['cost'])} ген.",
+                callback_data=f"img_compare_toggle:{model_key}"
+            )
+        ])
+    
+    total = sum(IMAGE_MODELS[model_key]["cost"] for model_key in selected)
+    if len(selected) >= 2:
+        buttons.append([InlineKeyboardButton(
+            text=f"🚀 Сравнить {len(selected)} модели — {int(total)} ген.",
+            callback_data="img_compare_run"
+        )])
+    buttons.append([InlineKeyboardButton(text="◀️ Назад", callback_data="img_models")])
+    buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def video_models_keyboard(preview: bool = False) -> InlineKeyboardMarkup:
+    """
+    Клавиатура выбора модели для видео
+
+    preview=True - выбор модели для бесплатного превью
+    """
     buttons = []
     
     for model_key, model_info in VIDEO_MODELS.items():
-        cost_per_min = model_info['cost_per_minute']
-        text = f"{model_info['description']} — {int(cost_per_min)} ген./мин"
+        if preview:
+            text = f"👁 {model_info['description']}"
+            callback_data = f"vid_preview:{model_key}"
+        else:
+            cost_per_min = model_info['cost_per_minute']
+            text = f"{model_info['description']} — {int(cost_per_min)} ген./мин"
+            callback_data = f"vid_model:{model_key}"
         buttons.append([
             InlineKeyboardButton(
                 text=text,
-                callback_data=f"vid_model:{model_key}"
+                callback_data=callback_data
             )
         ])
     
+    if preview:
+        buttons.append([InlineKeyboardButton(text="◀️ Назад", callback_data="vid_models")])
+    else:
+        buttons.append([InlineKeyboardButton(
+            text=f"👁 Сначала превью ({settings.VIDEO_PREVIEW_SECONDS} сек, бесплатно)",
+            callback_data="vid_preview_models"
+        )])
     buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+def video_eta_keyboard(model_key: str) -> InlineKeyboardMarkup:
+    """Подтверждение постановки видео в длинную очередь"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Поставить в очередь", callback_data=f"vid_confirm:{model_key}")],
+        [InlineKeyboardButton(text="◀️ Другая модель", callback_data="vid_models")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")],
+    ])
+
+
 def cancel_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура отмены"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -2,9 +2,10 @@ from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, TelegramObject
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.db.engine import async_session_maker
+from src.db.engine import LazySession
 from src.db.models import User
 from src.services.users import UserService
+from src.services.user_cache import user_cache
 from sqlalchemy import select
 from aiogram.fsm.context import FSMContext
 import logging
@@ -16,7 +17,8 @@ logger = logging.getLogger(__name__)
 class DatabaseMiddleware(BaseMiddleware):
     """
     Middleware для подключения к БД
-    ✅ Создает async сессию для каждого запроса
+    ✅ Сессия ленивая: соединение из пула берется при первом запросе к БД
+    ✅ Commit только если были изменения, иначе сессия просто закрывается
     ✅ Автоматически закрывает сессию после обработки
     """
     
@@ -26,18 +28,22 @@ class DatabaseMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any]
     ) -> Any:
-        async with async_session_maker() as session:
-            data["session"] = session
-            try:
-                result = await handler(event, data)
-                # Коммитим только если не было ошибок
+        session = LazySession()
+        data["session"] = session
+        try:
+            result = await handler(event, data)
+            # Коммитим только если не было ошибок и было что коммитить
+            if session.has_changes:
                 await session.commit()
-                return result
-            except Exception as e:
-                # Откатываем транзакцию при ошибке
+            return result
+        except Exception as e:
+            # Откатываем транзакцию при ошибке
+            if session.created:
                 await session.rollback()
-                logger.error(f"Error in handler, rolled back: {e}", exc_info=True)
-                raise
+            logger.error(f"Error in handler, rolled back: {e}", exc_info=True)
+            raise
+        finally:
+            await session.close()
 
 
 class UserMiddleware(BaseMiddleware):
@@ -46,6 +52,7 @@ class UserMiddleware(BaseMiddleware):
     ✅ Автоматически создает пользователя при первом обращении
     ✅ Обновляет данные пользователя (username, имя)
     ✅ Добавляет пользователя в data["user"]
+    ✅ Пользователь из кэша (LRU + Redis), если профиль в Telegram не менялся - без SELECT
     """
     
     async def __call__(
@@ -74,17 +81,25 @@ class UserMiddleware(BaseMiddleware):
             return await handler(event, data)
         
         try:
-            # ✅ Получаем или создаем пользователя
-            user = await UserService.get_or_create_user(
-                session=session,
-                telegram_id=telegram_user.id,
-                username=telegram_user.username,
-                first_name=telegram_user.first_name,
-                last_name=telegram_user.last_name
-            )
+            user = await user_cache.get(session, telegram_user.id)
+            if user is not None and not self._profile_matches(user, telegram_user):
+                # Профиль изменился - читаем актуальную строку вместо кэшированной
+                session.expunge(user)
+                user = None
             
-            # Flush чтобы пользователь был доступен в handler
-            await session.flush()
+            if user is None:
+                # ✅ Получаем или создаем пользователя
+                user = await UserService.get_or_create_user(
+                    session=session,
+                    telegram_id=telegram_user.id,
+                    username=telegram_user.username,
+                    first_name=telegram_user.first_name,
+                    last_name=telegram_user.last_name
+                )
+                
+                # Flush чтобы пользователь был доступен в handler
+                await session.flush()
+                await user_cache.put(session, user)
             
             data["user"] = user
             
@@ -95,6 +110,19 @@ class UserMiddleware(BaseMiddleware):
         return await handler(event, data)
 
 
+    @staticmethod
+    def _profile_matches(user: User, telegram_user) -> bool:
+        """Те же правила, что в get_or_create_user: пустые поля не перезаписываются"""
+        return all(
+            not value or getattr(user, name) == value
+            for name, value in (
+                ("username", telegram_user.username),
+                ("first_name", telegram_user.first_name),
+                ("last_name", telegram_user.last_name),
+            )
+        )
+
+
 class ClearStateOnCommandMiddleware(BaseMiddleware):
     """
     Middleware для очистки состояния при вводе команд
@@ -111,7 +139,9 @@ class ClearStateOnCommandMiddleware(BaseMiddleware):
         "/balance",
         "/bots",
         "/stats",
-        "/broadcast"
+        "/broadcast",
+        "/dlq",
+        "/dlq_replay"
     }
     
     async def __call__(
@@ -237,13 +267,13 @@ class ThrottlingMiddleware(BaseMiddleware):
         if len(self.user_requests[user_id]) >= self.rate_limit:
             logger.warning(f"Rate limit exceeded for user {user_id}")
             
-            # Отправляем предупреждение только для Message
+            # Предупреждение возвращаем методом - уйдет в ответе webhook
             if isinstance(event, Message):
-                await event.answer(
+                return event.answer(
                     "⚠️ Слишком много запросов. Подождите немного."
                 )
             elif isinstance(event, CallbackQuery):
-                await event.answer(
+                return event.answer(
                     "⚠️ Слишком много запросов",
                     show_alert=True
                 )
@@ -1,20 +1,28 @@
 from aiogram import Router, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from src.db.models import User, Broadcast
+from src.db.models import User, Broadcast, Task, TaskStatus
 from src.bot.states import BroadcastStates
 from src.core.config import settings
 from src.db.engine import async_session_maker
+from src.services.estimator import processing_estimator
+from src.services.result_cache import result_cache
+from src.services.dead_letters import dead_letters
+from src.services.generation import GenerationService
+from src.services.users import UserService
 from src.services.telegram_safe import safe_send_text, safe_send_photo, safe_send_video  # ✅ ДОБАВЛЕНО
 import asyncio
+import html
 import logging
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+DLQ_PREVIEW_SIZE = 20
+
 
 @router.message(Command("broadcast"))
 async def cmd_broadcast(message: Message, state: FSMContext):
@@ -148,10 +156,124 @@ async def cmd_stats(message: Message):
         active_users = [u for u in users if u.balance > 0]
         total_balance = sum(u.balance for u in users)
         
+        # Время обработки по моделям (p50/p95)
+        await processing_estimator.ensure_fresh()
+        timing_lines = [
+            f"• {model}: p50 {p50 / 60:.1f} мин, p95 {p95 / 60:.1f} мин ({count})"
+            for model, (count, p50, p95) in processing_estimator.percentiles().items()
+        ]
+        timings_text = "\n".join(timing_lines) if timing_lines else "нет данных"
+        
+        cache_stats = await result_cache.stats()
+        
         await message.answer(
             f"📊 <b>Статистика бота</b>\n\n"
             f"👥 Всего пользователей: {len(users)}\n"
             f"⚡ Активных: {len(active_users)}\n"
-            f"💰 Общий баланс: {int(total_balance)} ген.",
+            f"💰 Общий баланс: {int(total_balance)} ген.\n\n"
+            f"⏱ <b>Время обработки:</b>\n{timings_text}\n\n"
+            f"♻️ <b>Кэш результатов:</b>\n"
+            f"• Попаданий: {cache_stats['hits']} из {cache_stats['hits'] + cache_stats['misses']} "
+            f"({cache_stats['hit_rate'] * 100:.1f}%)\n"
+            f"• Записей: {cache_stats['entries']}",
             parse_mode="HTML"
-        )
\ No newline at end of file
+        )
+
+@router.message(Command("dlq"))
+async def cmd_dlq(message: Message):
+    """Dead-letter очередь: задачи, упавшие после всех повторов"""
+    if message.from_user.id not in settings.admin_list:
+        return
+    
+    total = await dead_letters.count()
+    entries = await dead_letters.list(limit=DLQ_PREVIEW_SIZE)
+    
+    if not entries:
+        await message.answer("✅ Dead-letter очередь пуста")
+        return
+    
+    lines = [
+        f"• #{entry['task_id']} {entry['function']} [{entry['kind']}, попыток: {entry['tries']}]\n"
+        f"  {html.escape(entry['error'][:120])}"
+        for entry in entries
+    ]
+    
+    await message.answer(
+        f"☠️ <b>Dead-letter очередь: {total}</b>\n\n"
+        + "\n".join(lines)
+        + "\n\nПерезапуск: /dlq_replay [количество]",
+        parse_mode="HTML"
+    )
+
+
+@router.message(Command("dlq_replay"))
+async def cmd_dlq_replay(message: Message, command: CommandObject):
+    """Перезапуск задач из dead-letter очереди (пачкой, самые старые первыми)"""
+    if message.from_user.id not in settings.admin_list:
+        return
+    
+    limit = None
+    if command.args:
+        if not command.args.strip().isdigit():
+            await message.answer("Использование: /dlq_replay [количество]")
+            return
+        limit = int(command.args.strip())
+    
+    entries = await dead_letters.list(limit=limit)
+    if not entries:
+        await message.answer("✅ Dead-letter очередь пуста")
+        return
+    
+    replayed = 0
+    skipped = 0
+    
+    async with async_session_maker() as session:
+        for entry in entries:
+            task = await session.get(Task, entry["task_id"])
+            user = await session.get(User, task.user_id) if task else None
+            
+            if not task or not user or task.status != TaskStatus.FAILED:
+                # Задача удалена или уже перезапущена - запись больше не нужна
+                await dead_letters.remove(entry["task_id"])
+                skipped += 1
+                continue
+            
+            # При окончательной ошибке генерации вернули - списываем снова
+            deducted = await UserService.deduct_credits(
+                session=session,
+                user=user,
+                amount=task.cost,
+                description="Повторная обработка задачи",
+                reference_type="task_reserve",
+                reference_id=task.id
+            )
+            if not deducted:
+                await session.rollback()
+                skipped += 1
+                continue
+            
+            task.status = TaskStatus.PENDING
+            task.error_message = None
+            task.topaz_request_id = None
+            task.parent_task_id = None
+            await session.commit()
+            
+            if entry["function"] == "process_video_task":
+                await GenerationService.enqueue_video_task(*entry["args"])
+            elif entry["function"] == "process_image_batch":
+                await GenerationService.enqueue_image_batch(*entry["args"])
+            else:
+                await GenerationService.enqueue_image_task(*entry["args"])
+            
+            await dead_letters.remove(entry["task_id"])
+            replayed += 1
+    
+    logger.info(f"DLQ replay: replayed={replayed}, skipped={skipped}, admin={message.from_user.id}")
+    
+    await message.answer(
+        f"♻️ <b>Перезапуск DLQ</b>\n\n"
+        f"✅ Перезапущено: {replayed}\n"
+        f"⏭ Пропущено: {skipped}\n"
+        f"☠️ Осталось: {await dead_letters.count()}",
+        parse_mode="HTML"
+    )
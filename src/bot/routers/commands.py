@@ -5,7 +5,6 @@ from aiogram.fsm.context import FSMContext
 from src.db.models import User
 from src.bot.keyboards import main_keyboard
 from src.core.config import settings
-from src.services.telegram_safe import safe_send_text
 
 router = Router()
 
@@ -22,11 +21,12 @@ async def cmd_start(message: Message, user: User):
         f"Выберите действие:"
     )
     
-    await safe_send_text(
-        bot=message.bot,
-        chat_id=message.chat.id,
-        text=text,
-        reply_markup=main_keyboard()
+    # Метод возвращается, а не вызывается: уйдет в ответе webhook
+    # (ошибки отправки, в т.ч. бот заблокирован, обрабатывает UpdateExecutor)
+    return message.answer(
+        text,
+        reply_markup=main_keyboard(),
+        disable_web_page_preview=True
     )
 
 
@@ -51,12 +51,7 @@ async def cmd_help(message: Message):
         f"💬 Поддержка: @{settings.SUPPORT_USERNAME}"
     )
     
-    await safe_send_text(
-        bot=message.bot,
-        chat_id=message.chat.id,
-        text=text,
-        parse_mode="HTML"
-    )
+    return message.answer(text, parse_mode="HTML", disable_web_page_preview=True)
 
 
 @router.message(Command("bots"))
@@ -71,12 +66,7 @@ async def cmd_bots(message: Message):
         f"💬 Поддержка: @{settings.SUPPORT_USERNAME}"
     )
     
-    await safe_send_text(
-        bot=message.bot,
-        chat_id=message.chat.id,
-        text=text,
-        parse_mode="HTML"
-    )
+    return message.answer(text, parse_mode="HTML", disable_web_page_preview=True)
 
 
 @router.message(F.text == "💰 Баланс")
@@ -92,9 +82,4 @@ async def cmd_balance(message: Message, user: User):
         f"💳 Пополнить: /buy"
     )
     
-    await safe_send_text(
-        bot=message.bot,
-        chat_id=message.chat.id,
-        text=text,
-        parse_mode="HTML"
-    )
\ No newline at end of file
+    return message.answer(text, parse_mode="HTML", disable_web_page_preview=True)
@@ -3,19 +3,22 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.db.models import User, TaskType
-from src.bot.keyboards import image_models_keyboard, cancel_keyboard
+from src.bot.keyboards import image_models_keyboard, image_compare_keyboard, cancel_keyboard
 from src.bot.states import ImageStates
 from src.services.generation import GenerationService
-from src.services.pricing import IMAGE_MODELS
+from src.services.pricing import IMAGE_MODELS, COMPARE_MODELS
 from src.utils.file_validator import file_validator
 from src.services.rate_limiter import rate_limiter
 from src.services.telegram_safe import safe_send_text, safe_answer, safe_edit_text
 from src.services.users import UserService
+from src.services.albums import album_collector
 import logging
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+MAX_ALBUM_PHOTOS = 10  # лимит sendMediaGroup
+
 
 @router.message(F.text == "📸 Улучшить фото")
 async def image_enhance_start(message: Message, state: FSMContext):
@@ -41,6 +44,82 @@ async def image_enhance_start(message: Message, state: FSMContext):
     await state.set_state(ImageStates.waiting_for_image)
 
 
+@router.message(ImageStates.waiting_for_image, F.photo, F.media_group_id)
+async def album_received(message: Message, state: FSMContext, user: User):
+    """Альбом получен - собираем все фото и показываем один выбор модели"""
+    photo = message.photo[-1]
+    
+    is_leader = await album_collector.add(
+        message.chat.id,
+        message.media_group_id,
+        {
+            "message_id": message.message_id,
+            "file_id": photo.file_id,
+            "file_unique_id": photo.file_unique_id,
+            "file_size": photo.file_size
+        }
+    )
+    if not is_leader:
+        # Фото заберет первый апдейт альбома
+        return
+    
+    items = await album_collector.collect(message.chat.id, message.media_group_id)
+    
+    allowed, remaining = await rate_limiter.check_limit(
+        user.telegram_id,
+        "image_upload",
+        30,
+        3600
+    )
+    
+    if not allowed:
+        await safe_send_text(
+            bot=message.bot,
+            chat_id=message.chat.id,
+            text=(
+                f"⏱ <b>Слишком много запросов</b>\n\n"
+                f"Подождите {remaining // 60} минут перед следующей загрузкой"
+            ),
+            parse_mode="HTML"
+        )
+        return
+    
+    valid_items = [
+        item for item in items
+        if file_validator.validate_image_size(item["file_size"] or 0)[0]
+    ][:MAX_ALBUM_PHOTOS]
+    
+    if not valid_items:
+        await safe_send_text(
+            bot=message.bot,
+            chat_id=message.chat.id,
+            text="❌ Фото в альбоме слишком большие (максимум 20 МБ)"
+        )
+        return
+    
+    await state.update_data(album=[
+        {"file_id": item["file_id"], "file_unique_id": item["file_unique_id"]}
+        for item in valid_items
+    ])
+    
+    skipped = len(items) - len(valid_items)
+    text = (
+        f"✅ <b>Альбом принят: {len(valid_items)} фото</b>\n\n"
+        + (f"⚠️ Пропущено фото: {skipped}\n\n" if skipped else "")
+        + "Выберите модель обработки (цена за все фото):"
+    )
+    
+    await safe_send_text(
+        bot=message.bot,
+        chat_id=message.chat.id,
+        text=text,
+        reply_markup=image_models_keyboard(photos=len(valid_items)),
+        parse_mode="HTML"
+    )
+    
+    await state.set_state(ImageStates.selecting_model)
+
+
 @router.message(ImageStates.waiting_for_image, F.photo)
 async def image_received(message: Message, state: FSMContext, user: User):
     """Фото получено - проверка и выбор модели"""
@@ -77,7 +156,7 @@ async def image_received(message: Message, state: FSMContext, user: User):
         )
         return
     
-    await state.update_data(file_id=photo.file_id)
+    await state.update_data(file_id=photo.file_id, file_unique_id=photo.file_unique_id)
     
     text = (
         "✅ <b>Фото принято</b>\n\n"
@@ -108,6 +187,16 @@ async def wrong_content_type(message: Message):
     )
 
 
+def _image_parameters(model_info: dict) -> dict:
+    """Параметры задачи для одного фото: endpoint, модель Topaz и ее настройки из IMAGE_MODELS"""
+    return {
+        "face_enhancement": True,
+        "face_enhancement_strength": 0.8,
+        **model_info["params"],
+        "endpoint": model_info["endpoint"]
+    }
+
+
 @router.callback_query(ImageStates.selecting_model, F.data.startswith("img_model:"))
 async def process_image_model(
     callback: CallbackQuery,
@@ -123,6 +212,12 @@ async def process_image_model(
         return
     
     model_info = IMAGE_MODELS[model_name]
+    
+    data = await state.get_data()
+    if data.get("album"):
+        await _start_album_task(callback, state, session, user, model_name, data["album"])
+        return
+    
     cost = model_info["cost"]
     
     # Проверка баланса
@@ -138,24 +233,33 @@ async def process_image_model(
         await state.clear()
         return
     
-    data = await state.get_data()
     file_id = data.get("file_id")
     
-    # Создаем задачу
-    task = await GenerationService.create_task(
+    # Создаем задачу (повторное нажатие вернет уже существующую)
+    task, created = await GenerationService.create_task(
         session=session,
         user=user,
         task_type=TaskType.IMAGE_ENHANCE,
         model=model_name,
         cost=cost,
         input_file_id=file_id,
-        parameters={
-            "endpoint": model_info["endpoint"],
-            "face_enhancement": True,
-            "face_enhancement_strength": 0.8
-        }
+        parameters=_image_parameters(model_info),
+        input_file_unique_id=data.get("file_unique_id")
     )
     
+    if not created:
+        await safe_edit_text(
+            message=callback.message,
+            text=(
+                "⏳ <b>Это фото уже обрабатывается</b>\n\n"
+                "Повторно генерации не списаны, результат придет один раз."
+            ),
+            parse_mode="HTML"
+        )
+        await state.clear()
+        await safe_answer(callback)
+        return
+    
     # 🔥 КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: РЕЗЕРВИРУЕМ БАЛАНС СРАЗУ
     success = await UserService.deduct_credits(
         session=session,
@@ -205,4 +309,250 @@ async def process_image_model(
     logger.info(
         f"Image task created: task_id={task.id}, user={user.telegram_id}, "
         f"model={model_name}, balance_reserved=True"
-    )
\ No newline at end of file
+    )
+
+
+async def _start_album_task(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    user: User,
+    model_name: str,
+    album: list
+):
+    """Одна задача и один резерв генераций на весь альбом"""
+    model_info = IMAGE_MODELS[model_name]
+    cost = model_info["cost"] * len(album)
+    file_ids = [item["file_id"] for item in album]
+    
+    if user.balance < cost:
+        await safe_answer(
+            callback,
+            f"❌ Недостаточно генераций!\n\n"
+            f"Требуется: {int(cost)}\n"
+            f"У вас: {int(user.balance)}\n\n"
+            f"Используйте /buy",
+            show_alert=True
+        )
+        await state.clear()
+        return
+    
+    task, _ = await GenerationService.create_task(
+        session=session,
+        user=user,
+        task_type=TaskType.IMAGE_ENHANCE,
+        model=model_name,
+        cost=cost,
+        input_file_id=file_ids[0],
+        parameters=dict(_image_parameters(model_info), files=file_ids)
+    )
+    
+    success = await UserService.deduct_credits(
+        session=session,
+        user=user,
+        amount=cost,
+        description=f"Резерв: обработка альбома ({len(album)} фото, {model_name})",
+        reference_type="task_reserve",
+        reference_id=task.id
+    )
+    
+    if not success:
+        await safe_answer(callback, "❌ Недостаточно генераций!", show_alert=True)
+        await session.delete(task)
+        await session.commit()
+        await state.clear()
+        return
+    
+    await session.commit()
+    
+    await safe_edit_text(
+        message=callback.message,
+        text=(
+            f"⏳ <b>Обработка альбома началась...</b>\n\n"
+            f"📊 Модель: {model_info['description']}\n"
+            f"🖼 Фото: {len(album)}\n"
+            f"💰 Зарезервировано: {int(cost)} ген.\n\n"
+            f"Обычно занимает 20-60 секунд"
+        ),
+        parse_mode="HTML"
+    )
+    
+    await GenerationService.enqueue_image_batch(
+        task_id=task.id,
+        user_telegram_id=user.telegram_id,
+        image_file_ids=file_ids
+    )
+    
+    await state.clear()
+    await safe_answer(callback)
+    
+    logger.info(
+        f"Image batch task created: task_id={task.id}, user={user.telegram_id}, "
+        f"model={model_name}, photos={len(album)}"
+    )
+
+
+@router.callback_query(ImageStates.selecting_model, F.data == "img_models")
+async def show_image_models(callback: CallbackQuery):
+    """Вернуться к выбору модели"""
+    await safe_edit_text(
+        message=callback.message,
+        text="Выберите модель обработки:",
+        reply_markup=image_models_keyboard(),
+        parse_mode="HTML"
+    )
+    await safe_answer(callback)
+
+
+@router.callback_query(ImageStates.selecting_model, F.data == "img_compare")
+async def show_image_compare(callback: CallbackQuery, state: FSMContext):
+    """Сравнение моделей: выбор моделей"""
+    data = await state.get_data()
+    if data.get("album"):
+        await safe_answer(callback, "Сравнение доступно только для одного фото", show_alert=True)
+        return
+    
+    selected = data.get("compare") or list(COMPARE_MODELS)
+    await state.update_data(compare=selected)
+    
+    await safe_edit_text(
+        message=callback.message,
+        text=(
+            "🔀 <b>Сравнение моделей</b>\n\n"
+            "Фото обработается всеми выбранными моделями, результаты придут одним альбомом.\n\n"
+            "Выберите модели:"
+        ),
+        reply_markup=image_compare_keyboard(selected),
+        parse_mode="HTML"
+    )
+    await safe_answer(callback)
+
+
+@router.callback_query(ImageStates.selecting_model, F.data.startswith("img_compare_toggle:"))
+async def toggle_image_compare(callback: CallbackQuery, state: FSMContext):
+    """Сравнение моделей: включить/выключить модель"""
+    model_name = callback.data.split(":")[1]
+    if model_name not in COMPARE_MODELS:
+        await safe_answer(callback, "❌ Модель не найдена", show_alert=True)
+        return
+    
+    data = await state.get_data()
+    selected = data.get("compare") or []
+    if model_name in selected:
+        selected.remove(model_name)
+    else:
+        selected.append(model_name)
+    # Порядок результатов - как в списке моделей
+    selected = [model_key for model_key in COMPARE_MODELS if model_key in selected]
+    await state.update_data(compare=selected)
+    
+    await safe_edit_text(
+        message=callback.message,
+        text=(
+            "🔀 <b>Сравнение моделей</b>\n\n"
+            "Фото обработается всеми выбранными моделями, результаты придут одним альбомом.\n\n"
+            "Выберите модели:"
+        ),
+        reply_markup=image_compare_keyboard(selected),
+        parse_mode="HTML"
+    )
+    await safe_answer(callback)
+
+
+@router.callback_query(ImageStates.selecting_model, F.data == "img_compare_run")
+async def run_image_compare(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    user: User
+):
+    """
+    Сравнение моделей: одна задача и один резерв на все модели
+    ✅ Фото скачивается один раз, модели идут в Topaz параллельно
+    ✅ Результаты - одним альбомом (process_image_batch)
+    """
+    data = await state.get_data()
+    selected = [model_key for model_key in data.get("compare") or [] if model_key in COMPARE_MODELS]
+    file_id = data.get("file_id")
+    
+    if len(selected) < 2 or not file_id:
+        await safe_answer(callback, "Выберите хотя бы две модели", show_alert=True)
+        return
+    
+    cost = sum(IMAGE_MODELS[model_key]["cost"] for model_key in selected)
+    
+    if user.balance < cost:
+        await safe_answer(
+            callback,
+            f"❌ Недостаточно генераций!\n\n"
+            f"Требуется: {int(cost)}\n"
+            f"У вас: {int(user.balance)}\n\n"
+            f"Используйте /buy",
+            show_alert=True
+        )
+        await state.clear()
+        return
+    
+    task, _ = await GenerationService.create_task(
+        session=session,
+        user=user,
+        task_type=TaskType.IMAGE_ENHANCE,
+        model="compare",
+        cost=cost,
+        input_file_id=file_id,
+        parameters={
+            "files": [file_id],
+            "compare": [
+                {
+                    "model": model_key,
+                    "description": IMAGE_MODELS[model_key]["description"],
+                    "cost": IMAGE_MODELS[model_key]["cost"],
+                    "parameters": _image_parameters(IMAGE_MODELS[model_key])
+                }
+                for model_key in selected
+            ]
+        }
+    )
+    
+    success = await UserService.deduct_credits(
+        session=session,
+        user=user,
+        amount=cost,
+        description=f"Резерв: сравнение моделей ({len(selected)})",
+        reference_type="task_reserve",
+        reference_id=task.id
+    )
+    
+    if not success:
+        await safe_answer(callback, "❌ Недостаточно генераций!", show_alert=True)
+        await session.delete(task)
+        await session.commit()
+        await state.clear()
+        return
+    
+    await session.commit()
+    
+    await safe_edit_text(
+        message=callback.message,
+        text=(
+            f"⏳ <b>Сравнение началось...</b>\n\n"
+            f"📊 Моделей: {len(selected)}\n"
+            f"💰 Зарезервировано: {int(cost)} ген.\n\n"
+            f"Обычно занимает 20-60 секунд"
+        ),
+        parse_mode="HTML"
+    )
+    
+    await GenerationService.enqueue_image_batch(
+        task_id=task.id,
+        user_telegram_id=user.telegram_id,
+        image_file_ids=[file_id]
+    )
+    
+    await state.clear()
+    await safe_answer(callback)
+    
+    logger.info(
+        f"Image compare task created: task_id={task.id}, user={user.telegram_id}, "
+        f"models={','.join(selected)}, cost={cost}"
+    )
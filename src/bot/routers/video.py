@@ -3,7 +3,7 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.db.models import User, TaskType
-from src.bot.keyboards import video_models_keyboard, cancel_keyboard
+from src.bot.keyboards import video_models_keyboard, video_eta_keyboard, cancel_keyboard
 from src.bot.states import VideoStates
 from src.services.generation import GenerationService
 from src.services.pricing import VIDEO_MODELS
@@ -27,7 +27,7 @@ async def video_enhance_start(message: Message, state: FSMContext):
     text = (
         "🎬 <b>Отправьте видео для улучшения</b>\n\n"
         "⚠️ <b>Ограничения:</b>\n"
-        "• Максимум 2 ГБ\n"
+        f"• Максимум {file_validator.max_video_size_text()}\n"
         "• До 10 минут длительности\n"
         "• Форматы: MP4, MOV\n\n"
         "💡 Большие видео обрабатываются дольше (5-15 мин)"
@@ -94,6 +94,7 @@ async def video_received(message: Message, state: FSMContext, user: User):
     
     await state.update_data(
         file_id=video.file_id,
+        file_unique_id=video.file_unique_id,
         duration=video.duration,
         duration_minutes=duration_minutes,
         width=video.width,
@@ -142,7 +143,145 @@ async def process_video_model(
 ):
     """Обработка видео с выбранной моделью"""
     model_key = callback.data.split(":")[1]
+    await _start_video_task(callback, state, session, user, model_key, confirmed=False)
+
+
+@router.callback_query(VideoStates.selecting_model, F.data.startswith("vid_confirm:"))
+async def confirm_video_model(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    user: User
+):
+    """Пользователь согласился ждать в очереди"""
+    model_key = callback.data.split(":")[1]
+    await _start_video_task(callback, state, session, user, model_key, confirmed=True)
+
+
+@router.callback_query(VideoStates.selecting_model, F.data == "vid_models")
+async def show_video_models(callback: CallbackQuery):
+    """Вернуться к выбору модели"""
+    await safe_edit_text(
+        message=callback.message,
+        text="Выберите модель обработки:",
+        reply_markup=video_models_keyboard(),
+        parse_mode="HTML"
+    )
+    await safe_answer(callback)
+
+
+@router.callback_query(VideoStates.selecting_model, F.data == "vid_preview_models")
+async def show_video_preview_models(callback: CallbackQuery):
+    """Выбор модели для превью"""
+    await safe_edit_text(
+        message=callback.message,
+        text=(
+            f"👁 <b>Превью</b>\n\n"
+            f"Обработаю {settings.VIDEO_PREVIEW_SECONDS} сек. из вашего видео выбранной моделью - "
+            f"бесплатно, примерно за минуту.\n\n"
+            f"Выберите модель:"
+        ),
+        reply_markup=video_models_keyboard(preview=True),
+        parse_mode="HTML"
+    )
+    await safe_answer(callback)
+
+
+@router.callback_query(VideoStates.selecting_model, F.data.startswith("vid_preview:"))
+async def on_video_preview(callback: CallbackQuery, state: FSMContext, user: User):
+    """
+    Превью: короткий фрагмент выбранной моделью
+    ✅ Бесплатно, но с лимитом в час
+    ✅ Состояние не сбрасываем - после превью можно сразу запустить полную обработку
+    """
+    model_key = callback.data.split(":")[1]
+    if model_key not in VIDEO_MODELS:
+        await safe_answer(callback, "❌ Модель не найдена", show_alert=True)
+        return
+    
+    allowed, remaining = await rate_limiter.check_limit(
+        user.telegram_id,
+        "video_preview",
+        settings.VIDEO_PREVIEW_PER_HOUR,
+        3600
+    )
+    if not allowed:
+        await safe_answer(
+            callback,
+            f"⏱ Лимит превью исчерпан, подождите {max(1, remaining // 60)} мин",
+            show_alert=True
+        )
+        return
+    
+    data = await state.get_data()
+    model_info = VIDEO_MODELS[model_key]
+    
+    await GenerationService.enqueue_video_preview(
+        user_telegram_id=user.telegram_id,
+        video_file_id=data.get("file_id"),
+        file_unique_id=data.get("file_unique_id"),
+        model=model_key,
+        parameters=_video_parameters(data, model_info)
+    )
     
+    await safe_edit_text(
+        message=callback.message,
+        text=(
+            f"👁 <b>Готовлю превью...</b>\n\n"
+            f"📊 Модель: {model_info['description']}\n"
+            f"Пришлю фрагмент примерно через минуту."
+        ),
+        parse_mode="HTML"
+    )
+    await safe_answer(callback)
+    
+    logger.info(f"Video preview requested: user={user.telegram_id}, model={model_key}")
+
+
+def _video_parameters(data: dict, model_info: dict) -> dict:
+    """Параметры запроса в Topaz по данным видео из FSM"""
+    duration_seconds = data.get("duration", 60)
+    width = data.get("width", 1280)
+    height = data.get("height", 720)
+    frame_count = int(duration_seconds * 30)
+    
+    return {
+        "source": {
+            "container": "mp4",
+            "duration": int(duration_seconds),
+            "frameRate": 30,
+            "frameCount": frame_count,
+            "size": data.get("file_size"),
+            "resolution": {
+                "width": width,
+                "height": height
+            }
+        },
+        "output": {
+            "frameRate": model_info.get("output_fps", 30),
+            "audioTransfer": "Copy",
+            "audioCodec": "AAC",
+            "videoEncoder": "H265",  # ← ИСПРАВЛЕНО с H264
+            "videoProfile": "Main",
+            "dynamicCompressionLevel": "Mid",
+            "resolution": {
+                "width": width * 2,
+                "height": height * 2
+            }
+        },
+        "filters": model_info["filters"]
+    }
+
+
+async def _start_video_task(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    user: User,
+    model_key: str,
+    confirmed: bool
+):
+    """Резерв генераций и постановка видео в очередь"""
     if model_key not in VIDEO_MODELS:
         await safe_answer(callback, "❌ Модель не найдена", show_alert=True)
         return
@@ -170,44 +309,83 @@ async def process_video_model(
     # Структура параметров
     width = data.get("width", 1280)
     height = data.get("height", 720)
-    frame_count = int(duration_seconds * 30)
     file_id = data.get("file_id")
+    file_unique_id = data.get("file_unique_id")
+    parameters = _video_parameters(data, model_info)
     
-    # Создаем задачу
-    task = await GenerationService.create_task(
+    # Дубль уже идущей задачи не нагружает очередь - admission не нужен
+    duplicate = await GenerationService.find_duplicate_task(
+        session, file_unique_id, model_key, parameters
+    )
+    
+    # ✅ Admission control: проверяем очередь ДО резерва генераций
+    admission = await GenerationService.check_video_admission(
+        session=session,
+        model=model_key,
+        duration_seconds=duration_seconds,
+        pixels=width * height,
+        confirmed=confirmed or duplicate is not None
+    )
+    
+    if not admission.allowed and not duplicate:
+        await safe_edit_text(
+            message=callback.message,
+            text=(
+                "⚠️ <b>Сервер перегружен</b>\n\n"
+                f"📊 В очереди: {admission.queued} видео\n"
+                f"⏱ Ожидание сейчас: ~{admission.eta_seconds // 60} мин\n\n"
+                "Генерации не списаны. Попробуйте через 15-30 минут."
+            ),
+            parse_mode="HTML"
+        )
+        await state.clear()
+        await safe_answer(callback)
+        return
+    
+    if admission.needs_confirmation:
+        await safe_edit_text(
+            message=callback.message,
+            text=(
+                "⏳ <b>Сейчас большая очередь</b>\n\n"
+                f"📊 В очереди: {admission.queued}, в обработке: {admission.in_flight}\n"
+                f"⏱ Результат будет примерно через {admission.eta_seconds // 60} мин\n\n"
+                "Поставить видео в очередь?"
+            ),
+            reply_markup=video_eta_keyboard(model_key),
+            parse_mode="HTML"
+        )
+        await safe_answer(callback)
+        return
+    
+    # Создаем задачу (повторное нажатие вернет уже существующую)
+    task, created = await GenerationService.create_task(
         session=session,
         user=user,
         task_type=TaskType.VIDEO_ENHANCE,
         model=model_key,
         cost=cost,
         input_file_id=file_id,
-        parameters={
-            "source": {
-                "container": "mp4",
-                "duration": int(duration_seconds),
-                "frameRate": 30,
-                "frameCount": frame_count,
-                "resolution": {
-                    "width": width,
-                    "height": height
-                }
-            },
-            "output": {
-                "frameRate": model_info.get("output_fps", 30),
-                "audioTransfer": "Copy",
-                "audioCodec": "AAC",
-                "videoEncoder": "H265",  # ← ИСПРАВЛЕНО с H264
-                "videoProfile": "Main",
-                "dynamicCompressionLevel": "Mid",
-                "resolution": {
-                    "width": width * 2,
-                    "height": height * 2
-                }
-            },
-            "filters": model_info["filters"]
-        }
+        parameters=parameters,
+        input_file_unique_id=file_unique_id
     )
     
+    if not created:
+        await safe_edit_text(
+            message=callback.message,
+            text=(
+                "⏳ <b>Это видео уже обрабатывается</b>\n\n"
+                f"📊 Модель: {model_info['description']}\n"
+                "Повторно генерации не списаны, результат придет один раз."
+            ),
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="❌ Отменить", callback_data=f"cancel_task:{task.id}")]
+            ]),
+            parse_mode="HTML"
+        )
+        await state.clear()
+        await safe_answer(callback)
+        return
+    
     # 🔥 КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: РЕЗЕРВИРУЕМ БАЛАНС СРАЗУ
     success = await UserService.deduct_credits(
         session=session,
@@ -239,7 +417,7 @@ async def process_video_model(
     # Сообщение пользователю
     text = (
         f"🎬 <b>Обработка началась!</b>\n\n"
-        f"⏳ Это займет несколько минут.\n"
+        f"⏳ Ожидаемое время: ~{max(1, admission.eta_seconds // 60)} мин\n"
         f"📊 Модель: {model_info['description']}\n"
         f"💰 Зарезервировано: {cost} ген.\n\n"
         f"Мы пришлем результат когда всё будет готово.\n"
@@ -14,6 +14,29 @@ class Settings(BaseSettings):
     WEBHOOK_PATH: str = "/tg/webhook"
     WEBHOOK_SECRET: str
 
+    # Фоновая обработка апдейтов webhook (на процесс gunicorn)
+    WEBHOOK_CONCURRENCY: int = 32  # апдейтов разных чатов одновременно
+    WEBHOOK_QUEUE_SIZE: int = 1000  # больше - отвечаем 503, Telegram повторит
+    WEBHOOK_DRAIN_TIMEOUT: int = 20  # секунд на дообработку при остановке
+    WEBHOOK_REPLY_TIMEOUT: float = 0.5  # секунд ждать метод хендлера для ответа webhook (0 - отвечаем сразу)
+
+    # executor - апдейт обрабатывает принявший его процесс
+    # stream - через Redis Streams, обрабатывают все процессы gunicorn (группа потребителей)
+    WEBHOOK_MODE: str = "executor"
+    UPDATE_STREAM_PARTITIONS: int = 16  # апдейты одного чата всегда в одной партиции
+    UPDATE_STREAM_MAXLEN: int = 100000  # на партицию (примерно)
+    UPDATE_STREAM_LEASE: int = 15  # секунд - аренда партиции процессом
+    UPDATE_STREAM_BATCH: int = 100
+
+    # Свой Bot API сервер (telegram-bot-api --local): пусто - облачный api.telegram.org
+    TELEGRAM_API_URL: str = ""
+    TELEGRAM_API_LOCAL: bool = True  # сервер запущен с --local (файлы до 2 ГБ, пути на диске)
+
+    # Результаты больше лимита Bot API - подписанной ссылкой на /results
+    RESULT_LINK_TTL: int = 172800  # секунд (48 ч) - срок ссылки и хранения файла
+    RESULT_LINK_SECRET: str = ""  # пусто - WEBHOOK_SECRET
+    RESULT_LINK_ACCEL_PREFIX: str = ""  # internal location nginx для X-Accel-Redirect
+
     DB_HOST: str
     DB_PORT: int = 3306
     DB_NAME: str
@@ -39,6 +62,72 @@ class Settings(BaseSettings):
     SUPPORT_USERNAME: str = "guardGpt"
     ADMIN_IDS: str = ""
 
+    # Очередь видео: admission control
+    VIDEO_WORKER_MAX_JOBS: int = 6  # верхняя граница, реально ограничивает бюджет байт
+    VIDEO_JOB_TIMEOUT: int = 7200
+    VIDEO_QUEUE_MAX_DEPTH: int = 30
+    VIDEO_ADMISSION_SOFT_ETA: int = 1800  # секунд - выше спрашиваем подтверждение
+    VIDEO_ADMISSION_HARD_ETA: int = 5400  # секунд - выше не принимаем задачи
+    VIDEO_SECONDS_PER_MINUTE: int = 90  # оценка обработки 1 минуты видео
+
+    # Бюджет диска видео-воркера (вход + ожидаемый выход)
+    VIDEO_DISK_BUDGET: int = 20 * 1024 ** 3
+    VIDEO_OUTPUT_SIZE_RATIO: float = 2.0  # выход / вход (апскейл x2, H265)
+    VIDEO_BUDGET_WAIT_TIMEOUT: int = 600  # секунд ожидания бюджета, затем ARQ Retry
+
+    # Длинные видео: параллельная обработка сегментами (нужен ffmpeg)
+    VIDEO_SEGMENT_ENABLED: bool = False
+    VIDEO_SEGMENT_MIN_DURATION: int = 300  # секунд - короче обрабатываем целиком
+    VIDEO_SEGMENT_SECONDS: int = 120  # длина сегмента (режется по ключевым кадрам)
+    VIDEO_SEGMENT_MAX_PARALLEL: int = 4  # одновременных запросов в Topaz на задачу
+
+    # Превью: короткий фрагмент выбранной моделью (бесплатно, быстрая очередь)
+    VIDEO_PREVIEW_SECONDS: int = 5
+    VIDEO_PREVIEW_PER_HOUR: int = 5  # превью на пользователя в час
+    VIDEO_PREVIEW_TIMEOUT: int = 300  # секунд ждать Topaz - дольше слот image worker не держим
+    VIDEO_PREVIEW_KEEP_INPUT: int = 1800  # секунд храним скачанное видео для полной обработки
+
+    # Очистка temp_inputs (janitor в видео-воркере)
+    TEMP_FILE_MAX_AGE: int = 3600  # секунд - свободные файлы старше удаляются
+    TEMP_DIR_QUOTA: int = 30 * 1024 ** 3  # байт - сверх квоты удаляются самые старые
+    TEMP_JANITOR_INTERVAL: int = 60
+    TEMP_JANITOR_RESCAN_INTERVAL: int = 600  # полный проход по каталогу
+
+    TASK_COALESCE_WINDOW: int = 900  # секунд - окно поиска дублирующихся задач
+    TASK_CREATE_LOCK_TTL: int = 30  # секунд - блокировка создания задачи (пользователь + файл + модель)
+
+    STUCK_TASK_TIMEOUT: int = 1800  # секунд без изменений - задача считается зависшей
+    STUCK_TASK_MAX_REQUEUES: int = 3
+    TASK_HEARTBEAT_INTERVAL: int = 60  # секунд между обновлениями updated_at работающей задачи
+
+    WORKER_MAX_TRIES: int = 4  # попыток задачи при временных ошибках (ARQ Retry)
+    WORKER_DRAIN_TIMEOUT: int = 60  # секунд на завершение/передачу задач при остановке воркера
+
+    # Комбинированный воркер (image + video в одном процессе, профиль combined)
+    COMBINED_WORKER_SLOTS: int = 12  # общий лимит задач процесса
+    COMBINED_IMAGE_WEIGHT: float = 1.0
+    COMBINED_VIDEO_WEIGHT: float = 1.0
+    COMBINED_REBALANCE_INTERVAL: int = 10  # секунд между перераспределениями слотов
+
+    # Супервизор комбинированных воркеров
+    SUPERVISOR_MIN_PROCESSES: int = 1
+    SUPERVISOR_MAX_PROCESSES: int = 4
+    SUPERVISOR_SCALE_UP_DEPTH: int = 20  # готовых задач в очередях на один процесс
+    SUPERVISOR_CHECK_INTERVAL: int = 30  # секунд
+    SUPERVISOR_SCALE_SUSTAIN: int = 3  # проверок подряд до масштабирования
+
+    IMAGE_BATCH_CONCURRENCY: int = 4  # параллельных запросов в Topaz на один альбом
+
+    # Кэш пользователей (telegram_id -> строка users) в UserMiddleware
+    USER_CACHE_ENABLED: bool = True
+    USER_CACHE_SIZE: int = 10000  # записей в LRU процесса
+    USER_CACHE_LOCAL_TTL: int = 5  # секунд в LRU процесса
+    USER_CACHE_TTL: int = 300  # секунд в Redis
+
+    # Кэш результатов (хэш входа + модель -> Telegram file_id)
+    RESULT_CACHE_TTL: int = 7 * 86400
+    RESULT_CACHE_MAX_ENTRIES: int = 20000
+
     SERVER_HOST: str = "0.0.0.0"
     SERVER_PORT: int = 8000
 
@@ -1,4 +1,7 @@
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import Session
+from typing import Optional
 from src.core.config import settings
 import logging
 
@@ -20,4 +23,67 @@ async_session_maker = async_sessionmaker(
     expire_on_commit=False
 )
 
+# Счетчики пула для /metrics
+POOL_STATS = {"checkouts": 0}
+
+# session.info: в транзакции были запросы на запись
+WRITES_KEY = "has_writes"
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    POOL_STATS["checkouts"] += 1
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_write_statement(orm_execute_state):
+    # UPDATE/INSERT/DELETE и text() - все, что не SELECT
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info[WRITES_KEY] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    session.info[WRITES_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_soft_rollback")
+def _reset_writes(session, *args):
+    session.info.pop(WRITES_KEY, None)
+
+
+class LazySession:
+    """
+    AsyncSession, создаваемая при первом обращении
+    ✅ Хендлер без БД - ни сессии, ни соединения из пула
+    ✅ has_changes - commit нужен, только если что-то писали
+    """
+
+    def __init__(self, factory: async_sessionmaker = async_session_maker):
+        self._factory = factory
+        self._session: Optional[AsyncSession] = None
+
+    @property
+    def created(self) -> bool:
+        return self._session is not None
+
+    @property
+    def has_changes(self) -> bool:
+        session = self._session
+        if session is None:
+            return False
+        return bool(session.info.get(WRITES_KEY) or session.new or session.dirty or session.deleted)
+
+    def __getattr__(self, name):
+        # Сюда попадают только атрибуты AsyncSession
+        if self._session is None:
+            self._session = self._factory()
+        return getattr(self._session, name)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
 logger.info("Database engine created")
\ No newline at end of file
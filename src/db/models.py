@@ -63,6 +63,10 @@ class Payment(Base):
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index("idx_tasks_input_unique_model", "input_file_unique_id", "model"),
+        Index("idx_tasks_status_updated", "status", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -71,6 +75,9 @@ class Task(Base):
     cost = Column(Float, nullable=False)
     model = Column(String(100), nullable=False)
     input_file_id = Column(String(255), nullable=True)
+    input_file_unique_id = Column(String(255), nullable=True)
+    parent_task_id = Column(Integer, ForeignKey("tasks.id", ondelete="SET NULL"), nullable=True, index=True)  # Задача, чей результат переиспользуем
+    output_file_id = Column(String(255), nullable=True)  # Telegram file_id отправленного результата
     output_file_url = Column(Text, nullable=True)
     topaz_request_id = Column(String(255), nullable=True, index=True)
     parameters = Column(Text, nullable=True)
@@ -80,6 +87,28 @@ class Task(Base):
     completed_at = Column(DateTime, nullable=True)
 
 
+class TaskTiming(Base):
+    """Время этапов обработки завершенных задач (для оценки ETA)"""
+    __tablename__ = "task_timings"
+    __table_args__ = (
+        Index("idx_task_timings_model_created", "model", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False, unique=True)
+    task_type = Column(SQLEnum(TaskType), nullable=False)
+    model = Column(String(100), nullable=False)
+    duration_seconds = Column(Float, nullable=True)  # Длительность видео (для фото NULL)
+    pixels = Column(BigInteger, nullable=True)  # Ширина * высота входа
+    input_size = Column(BigInteger, nullable=True)
+    download_seconds = Column(Float, nullable=True)
+    upload_seconds = Column(Float, nullable=True)
+    processing_seconds = Column(Float, nullable=True)
+    delivery_seconds = Column(Float, nullable=True)
+    total_seconds = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+
+
 class Broadcast(Base):
     __tablename__ = "broadcasts"
 
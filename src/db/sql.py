@@ -0,0 +1,10 @@
+from sqlalchemy import func, text
+
+
+def seconds_ago(seconds: int):
+    """
+    Момент N секунд назад по часам MySQL
+    ✅ created_at/updated_at ставит сервер (NOW()) в своем часовом поясе -
+       границу считаем там же, а не через datetime.utcnow()
+    """
+    return func.now() - text("INTERVAL :seconds SECOND").bindparams(seconds=int(seconds))
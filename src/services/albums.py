@@ -0,0 +1,78 @@
+import asyncio
+import json
+import logging
+from typing import List
+import redis.asyncio as aioredis
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ITEMS_KEY = "album:{chat_id}:{media_group_id}:items"
+LEADER_KEY = "album:{chat_id}:{media_group_id}:leader"
+ALBUM_TTL = 120
+
+# Telegram присылает альбом отдельными апдейтами почти одновременно
+ALBUM_COLLECT_DELAY = 1.0
+
+
+class AlbumCollector:
+    """
+    Сборка альбома (media group) из отдельных апдейтов
+    ✅ Через Redis - апдейты одного альбома могут попасть в разные процессы gunicorn
+    ✅ Первый апдейт становится "ведущим" и после паузы забирает весь альбом
+    ✅ Апдейты альбома обрабатываются параллельно (update_chat_key), иначе остальные фото
+       ждали бы за ведущим и не попали бы в альбом
+    """
+
+    @staticmethod
+    async def _redis() -> aioredis.Redis:
+        return await aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB_CACHE,
+            decode_responses=True
+        )
+
+    async def add(self, chat_id: int, media_group_id: str, item: dict) -> bool:
+        """
+        Добавить фото в альбом
+
+        Returns:
+            True - этот апдейт ведущий и должен вызвать collect()
+        """
+        items_key = ITEMS_KEY.format(chat_id=chat_id, media_group_id=media_group_id)
+        leader_key = LEADER_KEY.format(chat_id=chat_id, media_group_id=media_group_id)
+
+        redis = await self._redis()
+        try:
+            pipe = redis.pipeline()
+            pipe.rpush(items_key, json.dumps(item))
+            pipe.expire(items_key, ALBUM_TTL)
+            pipe.set(leader_key, 1, nx=True, ex=ALBUM_TTL)
+            results = await pipe.execute()
+            return bool(results[-1])
+        finally:
+            await redis.close()
+
+    async def collect(self, chat_id: int, media_group_id: str) -> List[dict]:
+        """Дождаться остальных фото альбома и забрать их (вызывает ведущий)"""
+        await asyncio.sleep(ALBUM_COLLECT_DELAY)
+
+        items_key = ITEMS_KEY.format(chat_id=chat_id, media_group_id=media_group_id)
+        redis = await self._redis()
+        try:
+            pipe = redis.pipeline()
+            pipe.lrange(items_key, 0, -1)
+            pipe.delete(items_key)
+            raw_items, _ = await pipe.execute()
+        finally:
+            await redis.close()
+
+        items = [json.loads(raw) for raw in raw_items]
+        # Порядок как в альбоме пользователя
+        items.sort(key=lambda item: item.get("message_id", 0))
+        logger.info(f"Album collected: chat={chat_id}, group={media_group_id}, photos={len(items)}")
+        return items
+
+
+album_collector = AlbumCollector()
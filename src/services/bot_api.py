@@ -0,0 +1,53 @@
+import logging
+from typing import Union
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import FSInputFile
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Лимиты облачного Bot API
+CLOUD_DOWNLOAD_LIMIT = 20 * 1024 * 1024  # getFile
+CLOUD_UPLOAD_LIMIT = 50 * 1024 * 1024  # sendVideo/sendDocument
+
+# Лимиты локального Bot API сервера
+LOCAL_FILE_LIMIT = 2000 * 1024 * 1024
+
+
+def is_local_mode() -> bool:
+    """Бот работает через свой Bot API сервер (--local)"""
+    return bool(settings.TELEGRAM_API_URL) and settings.TELEGRAM_API_LOCAL
+
+
+def create_bot(**kwargs) -> Bot:
+    """
+    Bot для облачного или своего Bot API сервера
+    ✅ TELEGRAM_API_URL пустой - api.telegram.org как раньше
+    ✅ Свой сервер в режиме --local: файлы до 2 ГБ, getFile отдает путь на общем томе
+    """
+    if settings.TELEGRAM_API_URL:
+        server = TelegramAPIServer.from_base(settings.TELEGRAM_API_URL, is_local=settings.TELEGRAM_API_LOCAL)
+        kwargs["session"] = AiohttpSession(api=server)
+    return Bot(token=settings.BOT_TOKEN, **kwargs)
+
+
+def max_download_size() -> int:
+    """Максимальный размер файла, который бот может скачать"""
+    return LOCAL_FILE_LIMIT if is_local_mode() else CLOUD_DOWNLOAD_LIMIT
+
+
+def max_upload_size() -> int:
+    """Максимальный размер файла, который бот может отправить"""
+    return LOCAL_FILE_LIMIT if is_local_mode() else CLOUD_UPLOAD_LIMIT
+
+
+def local_input_file(path: str) -> Union[str, FSInputFile]:
+    """
+    Файл результата для отправки
+    ✅ Локальный сервер читает файл с общего тома сам (file://) - без загрузки через HTTP
+    """
+    if is_local_mode():
+        return f"file://{path}"
+    return FSInputFile(path)
@@ -0,0 +1,122 @@
+import json
+import logging
+import time
+from typing import List, Optional
+import redis.asyncio as aioredis
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ENTRIES_KEY = "dlq:entries"  # hash: task_id -> JSON
+INDEX_KEY = "dlq:index"  # zset: task_id -> время попадания
+
+
+class DeadLetterQueue:
+    """
+    Dead-letter очередь задач, упавших окончательно
+    ✅ Хранит все, что нужно для повтора (функция, очередь, аргументы)
+    ✅ Админ может посмотреть и перезапустить пачкой
+    """
+
+    @staticmethod
+    async def _redis() -> aioredis.Redis:
+        return await aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB_CACHE,
+            decode_responses=True
+        )
+
+    async def push(
+        self,
+        task_id: int,
+        function: str,
+        queue_name: str,
+        args: list,
+        error: str,
+        kind: str,
+        tries: int
+    ):
+        """Добавить задачу в DLQ"""
+        redis = None
+        try:
+            redis = await self._redis()
+            entry = {
+                "task_id": task_id,
+                "function": function,
+                "queue_name": queue_name,
+                "args": args,
+                "error": error[:500],
+                "kind": kind,
+                "tries": tries,
+                "failed_at": int(time.time())
+            }
+            pipe = redis.pipeline()
+            pipe.hset(ENTRIES_KEY, str(task_id), json.dumps(entry))
+            pipe.zadd(INDEX_KEY, {str(task_id): entry["failed_at"]})
+            await pipe.execute()
+            logger.warning(f"Task moved to DLQ: task={task_id}, kind={kind}, error={error[:200]}")
+        except Exception as e:
+            logger.error(f"DLQ push error: task={task_id}, error={e}")
+        finally:
+            if redis:
+                try:
+                    await redis.close()
+                except Exception:
+                    pass
+
+    async def list(self, limit: Optional[int] = None) -> List[dict]:
+        """Записи DLQ, самые старые первыми"""
+        redis = None
+        try:
+            redis = await self._redis()
+            end = (limit - 1) if limit else -1
+            task_ids = await redis.zrange(INDEX_KEY, 0, end)
+            if not task_ids:
+                return []
+            raw_entries = await redis.hmget(ENTRIES_KEY, task_ids)
+            return [json.loads(raw) for raw in raw_entries if raw]
+        except Exception as e:
+            logger.error(f"DLQ list error: {e}")
+            return []
+        finally:
+            if redis:
+                try:
+                    await redis.close()
+                except Exception:
+                    pass
+
+    async def count(self) -> int:
+        redis = None
+        try:
+            redis = await self._redis()
+            return await redis.zcard(INDEX_KEY)
+        except Exception as e:
+            logger.error(f"DLQ count error: {e}")
+            return 0
+        finally:
+            if redis:
+                try:
+                    await redis.close()
+                except Exception:
+                    pass
+
+    async def remove(self, task_id: int):
+        redis = None
+        try:
+            redis = await self._redis()
+            pipe = redis.pipeline()
+            pipe.hdel(ENTRIES_KEY, str(task_id))
+            pipe.zrem(INDEX_KEY, str(task_id))
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"DLQ remove error: task={task_id}, error={e}")
+        finally:
+            if redis:
+                try:
+                    await redis.close()
+                except Exception:
+                    pass
+
+
+dead_letters = DeadLetterQueue()
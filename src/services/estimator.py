@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.db.engine import async_session_maker
+from src.db.models import Task, TaskTiming
+from src.db.sql import seconds_ago
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = 600  # секунд между переобучениями
+HISTORY_DAYS = 30
+HISTORY_LIMIT = 5000
+MIN_SAMPLES_FOR_FIT = 10
+MIGRATION_HINT = "apply db/migrations/003_task_timings.sql"
+
+
+class StageTimer:
+    """Замер длительности этапов задачи (download, upload, processing, delivery)"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._mark = self.started
+        self.stages: Dict[str, float] = {}
+
+    def lap(self, stage: str):
+        """Закрыть текущий этап и начать следующий"""
+        now = time.monotonic()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._mark)
+        self._mark = now
+
+    @property
+    def total(self) -> float:
+        return time.monotonic() - self.started
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[index]
+
+
+def _solve(matrix: List[List[float]], vector: List[float]) -> Optional[List[float]]:
+    """Метод Гаусса для маленькой системы нормальных уравнений"""
+    n = len(vector)
+    a = [row[:] + [vector[i]] for i, row in enumerate(matrix)]
+
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+        if abs(a[pivot][col]) < 1e-9:
+            return None
+        a[col], a[pivot] = a[pivot], a[col]
+        for row in range(n):
+            if row != col:
+                factor = a[row][col] / a[col][col]
+                for k in range(col, n + 1):
+                    a[row][k] -= factor * a[col][k]
+
+    return [a[i][n] / a[i][i] for i in range(n)]
+
+
+def _features(duration_seconds: Optional[float], pixels: Optional[int]) -> List[float]:
+    """Признаки: свободный член, длительность (мин), длительность * мегапиксели"""
+    minutes = (duration_seconds or 60.0) / 60.0
+    megapixels = (pixels or 0) / 1_000_000
+    return [1.0, minutes, minutes * megapixels]
+
+
+class ModelStats:
+    """
+    Статистика и коэффициенты регрессии для одной модели
+    ✅ По времени обработки в Topaz (processing_seconds) - без скачивания и доставки в Telegram
+    """
+
+    def __init__(self, samples: List[Tuple[Optional[float], Optional[int], float]]):
+        totals = sorted(sample[2] for sample in samples)
+        self.count = len(samples)
+        self.p50 = _percentile(totals, 0.5)
+        self.p95 = _percentile(totals, 0.95)
+        self.coefficients = self._fit(samples)
+
+        # Запасной вариант: медианная скорость (секунд на минуту видео)
+        rates = sorted(total / max(1.0, (duration or 60.0) / 60.0) for duration, _, total in samples)
+        self.seconds_per_minute = _percentile(rates, 0.5)
+
+    @staticmethod
+    def _fit(samples) -> Optional[List[float]]:
+        """Линейная регрессия по МНК: processing ≈ a + b*min + c*min*Mpx"""
+        if len(samples) < MIN_SAMPLES_FOR_FIT:
+            return None
+
+        size = 3
+        xtx = [[0.0] * size for _ in range(size)]
+        xty = [0.0] * size
+        for duration, pixels, total in samples:
+            x = _features(duration, pixels)
+            for i in range(size):
+                xty[i] += x[i] * total
+                for j in range(size):
+                    xtx[i][j] += x[i] * x[j]
+
+        return _solve(xtx, xty)
+
+    def estimate(self, duration_seconds: Optional[float], pixels: Optional[int]) -> float:
+        if self.coefficients:
+            x = _features(duration_seconds, pixels)
+            value = sum(c * f for c, f in zip(self.coefficients, x))
+            if value > 0:
+                return value
+        return self.seconds_per_minute * max(1.0, (duration_seconds or 60.0) / 60.0)
+
+
+class ProcessingTimeEstimator:
+    """
+    Оценка времени обработки по истории task_timings
+    ✅ Отдельная модель на каждую модель Topaz
+    ✅ Переобучается раз в REFRESH_INTERVAL секунд
+    """
+
+    def __init__(self):
+        self._models: Dict[str, ModelStats] = {}
+        self._refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def refresh(self):
+        """Переобучить модели по свежей истории"""
+        since = seconds_ago(HISTORY_DAYS * 86400)
+
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(
+                    TaskTiming.model,
+                    TaskTiming.duration_seconds,
+                    TaskTiming.pixels,
+                    TaskTiming.processing_seconds
+                )
+                .where(
+                    TaskTiming.created_at >= since,
+                    TaskTiming.processing_seconds.isnot(None)
+                )
+                .order_by(TaskTiming.id.desc())
+                .limit(HISTORY_LIMIT)
+            )
+            rows = result.all()
+
+        grouped: Dict[str, list] = {}
+        for model, duration, pixels, processing in rows:
+            grouped.setdefault(model, []).append((duration, pixels, processing))
+
+        self._models = {model: ModelStats(samples) for model, samples in grouped.items()}
+        self._refreshed_at = time.monotonic()
+
+        logger.info(f"Processing time estimator refreshed: models={len(self._models)}, samples={len(rows)}")
+
+    async def ensure_fresh(self):
+        """Переобучить если данные устарели (ошибки не пробрасываем)"""
+        if time.monotonic() - self._refreshed_at < REFRESH_INTERVAL:
+            return
+
+        async with self._lock:
+            if time.monotonic() - self._refreshed_at < REFRESH_INTERVAL:
+                return
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Не долбим БД при ошибке - следующая попытка через интервал
+                self._refreshed_at = time.monotonic()
+                logger.warning(f"Estimator refresh failed, ETA falls back to defaults ({MIGRATION_HINT} if missing): {e}")
+
+    def estimate(
+        self,
+        model: str,
+        duration_seconds: Optional[float] = None,
+        pixels: Optional[int] = None
+    ) -> Optional[int]:
+        """Оценка длительности обработки (секунды) или None если нет истории"""
+        stats = self._models.get(model)
+        if not stats:
+            return None
+        return int(stats.estimate(duration_seconds, pixels))
+
+    def percentiles(self) -> Dict[str, Tuple[int, float, float]]:
+        """Для /stats: модель -> (количество, p50, p95)"""
+        return {
+            model: (stats.count, stats.p50, stats.p95)
+            for model, stats in sorted(self._models.items())
+        }
+
+    @staticmethod
+    async def record(
+        session: AsyncSession,
+        task: Task,
+        timer: StageTimer,
+        duration_seconds: Optional[float] = None,
+        pixels: Optional[int] = None,
+        input_size: Optional[int] = None
+    ):
+        """Сохранить тайминги завершенной задачи"""
+        try:
+            session.add(TaskTiming(
+                task_id=task.id,
+                task_type=task.task_type,
+                model=task.model,
+                duration_seconds=duration_seconds,
+                pixels=pixels,
+                input_size=input_size,
+                download_seconds=timer.stages.get("download"),
+                upload_seconds=timer.stages.get("upload"),
+                processing_seconds=timer.stages.get("processing"),
+                delivery_seconds=timer.stages.get("delivery"),
+                total_seconds=timer.total
+            ))
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            logger.warning(f"Record timings failed ({MIGRATION_HINT} if missing): task={task.id}, error={e}")
+
+
+processing_estimator = ProcessingTimeEstimator()
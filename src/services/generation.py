@@ -1,15 +1,178 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Set, Tuple
+from sqlalchemy import event, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 from src.db.models import User, Task, TaskType, TaskStatus
+from src.db.sql import seconds_ago
+from src.core.config import settings
+from src.services.estimator import processing_estimator
 from arq import create_pool
 from src.workers.settings import get_redis_settings
+import redis.asyncio as aioredis
 import logging
+import json
 
 logger = logging.getLogger(__name__)
 
+VIDEO_QUEUE_NAME = "arq:video_queue"
+IMAGE_QUEUE_NAME = "arq:image_queue"
+
+# Блокировка создания задачи: двойное нажатие не создает две задачи
+CREATE_LOCK_KEY = "task_create_lock:{user_id}:{file_unique_id}:{model}"
+# session.info: блокировки, которые снимаются после commit/rollback
+CREATE_LOCKS_INFO = "task_create_locks"
+_release_tasks: Set[asyncio.Task] = set()
+
+
+@dataclass
+class QueueAdmission:
+    """Решение о приеме видео задачи в очередь"""
+    allowed: bool
+    needs_confirmation: bool
+    eta_seconds: int
+    queued: int
+    in_flight: int
+
+
+def _dump_parameters(parameters: Optional[dict]) -> Optional[str]:
+    """Стабильная сериализация параметров (для сравнения дублей)"""
+    return json.dumps(parameters, sort_keys=True) if parameters else None
+
+
+async def _cache_redis() -> aioredis.Redis:
+    return await aioredis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB_CACHE
+    )
+
+
+async def _release_create_locks(keys: Set[str]):
+    redis = None
+    try:
+        redis = await _cache_redis()
+        await redis.delete(*keys)
+    except Exception as e:
+        logger.error(f"Release task create lock error: {e}")
+    finally:
+        if redis:
+            await redis.close()
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_soft_rollback")
+def _release_create_locks_later(session: Session, *args):
+    """Задача закоммичена (или откатилась) - параллельный запрос может ее увидеть"""
+    keys = session.info.pop(CREATE_LOCKS_INFO, None)
+    if not keys:
+        return
+    try:
+        task = asyncio.get_running_loop().create_task(_release_create_locks(keys))
+    except RuntimeError:
+        # Нет event loop - блокировка истечет по TASK_CREATE_LOCK_TTL
+        return
+    _release_tasks.add(task)
+    task.add_done_callback(_release_tasks.discard)
+
 
 class GenerationService:
     """Сервис для работы с генерациями"""
     
+    @staticmethod
+    async def find_duplicate_task(
+        session: AsyncSession,
+        input_file_unique_id: Optional[str],
+        model: str,
+        parameters: dict = None
+    ) -> Optional[Task]:
+        """Найти такую же задачу (файл + модель + параметры) в ожидании или обработке"""
+        if not input_file_unique_id:
+            return None
+        
+        since = seconds_ago(settings.TASK_COALESCE_WINDOW)
+        result = await session.execute(
+            select(Task)
+            .where(
+                Task.input_file_unique_id == input_file_unique_id,
+                Task.model == model,
+                Task.parameters == _dump_parameters(parameters),
+                Task.status.in_([TaskStatus.PENDING, TaskStatus.PROCESSING]),
+                Task.parent_task_id.is_(None),
+                Task.created_at >= since
+            )
+            .order_by(Task.id)
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+    
+    @staticmethod
+    async def _lock_creation(session: AsyncSession, key: str) -> bool:
+        """
+        Взять блокировку создания задачи до конца транзакции
+
+        Returns:
+            False - такую же задачу сейчас создает параллельный запрос
+        """
+        redis = None
+        try:
+            redis = await _cache_redis()
+            acquired = await redis.set(key, "1", nx=True, ex=settings.TASK_CREATE_LOCK_TTL)
+        except Exception as e:
+            # Redis недоступен - не блокируем создание задач
+            logger.error(f"Task create lock error: {e}")
+            return True
+        finally:
+            if redis:
+                await redis.close()
+        
+        if acquired:
+            session.info.setdefault(CREATE_LOCKS_INFO, set()).add(key)
+        return bool(acquired)
+    
+    @staticmethod
+    async def _wait_for_own_task(
+        session: AsyncSession,
+        user: User,
+        lock_key: str,
+        input_file_unique_id: str,
+        model: str,
+        parameters: dict = None
+    ) -> Optional[Task]:
+        """
+        Дождаться задачи параллельного запроса того же пользователя
+        ✅ Читаем с блокировкой (FOR SHARE) - видим закоммиченное после начала нашей транзакции
+        ✅ Параллельный запрос не создал задачу - берем блокировку сами
+        """
+        deadline = time.monotonic() + settings.TASK_CREATE_LOCK_TTL
+        while time.monotonic() < deadline:
+            result = await session.execute(
+                select(Task)
+                .where(
+                    Task.user_id == user.id,
+                    Task.input_file_unique_id == input_file_unique_id,
+                    Task.model == model,
+                    Task.parameters == _dump_parameters(parameters),
+                    Task.status.in_([TaskStatus.PENDING, TaskStatus.PROCESSING]),
+                    Task.created_at >= seconds_ago(settings.TASK_COALESCE_WINDOW)
+                )
+                .order_by(Task.id)
+                .limit(1)
+                .with_for_update(read=True)
+            )
+            task = result.scalar_one_or_none()
+            if task:
+                return task
+            
+            if await GenerationService._lock_creation(session, lock_key):
+                return None
+            await asyncio.sleep(0.25)
+        
+        logger.warning(f"Task create lock wait timed out: {lock_key}")
+        return None
+    
     @staticmethod
     async def create_task(
         session: AsyncSession,
@@ -18,10 +181,46 @@ class GenerationService:
         model: str,
         cost: float,
         input_file_id: str = None,
-        parameters: dict = None
-    ) -> Task:
-        """Создать задачу"""
-        import json
+        parameters: dict = None,
+        input_file_unique_id: str = None
+    ) -> Tuple[Task, bool]:
+        """
+        Создать задачу
+        ✅ Повторное нажатие того же пользователя возвращает существующую задачу
+        ✅ Такая же задача другого пользователя привязывается к первой (один запуск Topaz)
+        ✅ Параллельные нажатия сериализуются блокировкой в Redis до commit первого запроса
+
+        Returns:
+            (task, created) - created=False если вернули уже существующую задачу
+        """
+        if input_file_unique_id:
+            lock_key = CREATE_LOCK_KEY.format(user_id=user.id, file_unique_id=input_file_unique_id, model=model)
+            if not await GenerationService._lock_creation(session, lock_key):
+                own_task = await GenerationService._wait_for_own_task(
+                    session, user, lock_key, input_file_unique_id, model, parameters
+                )
+                if own_task:
+                    logger.info(f"Concurrent duplicate task coalesced: task_id={own_task.id}, user_id={user.id}")
+                    return own_task, False
+        
+        duplicate = await GenerationService.find_duplicate_task(
+            session, input_file_unique_id, model, parameters
+        )
+        
+        if duplicate and duplicate.user_id != user.id:
+            # Пользователь мог уже привязаться к чужой задаче (двойное нажатие)
+            result = await session.execute(
+                select(Task).where(
+                    Task.parent_task_id == duplicate.id,
+                    Task.user_id == user.id,
+                    Task.status.in_([TaskStatus.PENDING, TaskStatus.PROCESSING])
+                ).limit(1)
+            )
+            duplicate = result.scalar_one_or_none() or duplicate
+        
+        if duplicate and duplicate.user_id == user.id:
+            logger.info(f"Duplicate task coalesced: task_id={duplicate.id}, user_id={user.id}")
+            return duplicate, False
         
         task = Task(
             user_id=user.id,
@@ -30,13 +229,124 @@ class GenerationService:
             model=model,
             cost=cost,
             input_file_id=input_file_id,
-            parameters=json.dumps(parameters) if parameters else None
+            input_file_unique_id=input_file_unique_id,
+            parent_task_id=duplicate.id if duplicate else None,
+            parameters=_dump_parameters(parameters)
         )
         
         session.add(task)
         await session.flush()
         
-        return task
+        if duplicate:
+            logger.info(f"Task attached to running task: task_id={task.id}, parent={duplicate.id}")
+        
+        return task, True
+    
+    @staticmethod
+    def estimate_video_seconds(model: str, duration_seconds: float, pixels: int = None) -> int:
+        """
+        Оценка времени обработки видео (секунды)
+        ✅ По истории обработки модели, иначе - по VIDEO_SECONDS_PER_MINUTE
+        """
+        estimate = processing_estimator.estimate(model, duration_seconds, pixels)
+        if estimate is not None:
+            return estimate
+        
+        duration_minutes = max(1.0, duration_seconds / 60.0)
+        return int(duration_minutes * settings.VIDEO_SECONDS_PER_MINUTE)
+    
+    @staticmethod
+    async def get_video_queue_depth() -> int:
+        """Количество задач в очереди ARQ (еще не взятых воркером)"""
+        redis = None
+        try:
+            redis = await aioredis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB
+            )
+            return await redis.zcard(VIDEO_QUEUE_NAME)
+        except Exception as e:
+            logger.error(f"Queue depth error: {e}")
+            return 0
+        finally:
+            if redis:
+                try:
+                    await redis.close()
+                except Exception:
+                    pass
+    
+    @staticmethod
+    async def check_video_admission(
+        session: AsyncSession,
+        model: str,
+        duration_seconds: float,
+        pixels: int = None,
+        confirmed: bool = False
+    ) -> QueueAdmission:
+        """
+        Проверка нагрузки перед постановкой видео в очередь
+        ✅ Учитывает глубину очереди ARQ и задачи в обработке
+        ✅ Считает честный ETA для новой задачи
+        """
+        await processing_estimator.ensure_fresh()
+        queued = await GenerationService.get_video_queue_depth()
+        
+        # Задачи старше job_timeout считаем зависшими и не учитываем
+        since = seconds_ago(settings.VIDEO_JOB_TIMEOUT)
+        result = await session.execute(
+            select(Task.status, Task.model, Task.parameters).where(
+                Task.task_type == TaskType.VIDEO_ENHANCE,
+                Task.status.in_([TaskStatus.PENDING, TaskStatus.PROCESSING]),
+                Task.created_at >= since
+            )
+        )
+        
+        backlog_seconds = 0
+        in_flight = 0
+        for status, task_model, parameters in result.all():
+            params = json.loads(parameters) if parameters else {}
+            source = params.get("source", {})
+            resolution = source.get("resolution", {})
+            estimate = GenerationService.estimate_video_seconds(
+                task_model,
+                source.get("duration", 60),
+                resolution.get("width", 0) * resolution.get("height", 0) or None
+            )
+            
+            if status == TaskStatus.PROCESSING:
+                in_flight += 1
+                # В среднем задача в обработке выполнена наполовину
+                estimate //= 2
+            
+            backlog_seconds += estimate
+        
+        workers = max(1, settings.VIDEO_WORKER_MAX_JOBS)
+        own_seconds = GenerationService.estimate_video_seconds(model, duration_seconds, pixels)
+        eta_seconds = backlog_seconds // workers + own_seconds
+        
+        allowed = (
+            queued < settings.VIDEO_QUEUE_MAX_DEPTH
+            and eta_seconds <= settings.VIDEO_ADMISSION_HARD_ETA
+        )
+        needs_confirmation = (
+            allowed
+            and not confirmed
+            and eta_seconds > settings.VIDEO_ADMISSION_SOFT_ETA
+        )
+        
+        logger.info(
+            f"Video admission: queued={queued}, in_flight={in_flight}, "
+            f"eta={eta_seconds}s, allowed={allowed}, confirm={needs_confirmation}"
+        )
+        
+        return QueueAdmission(
+            allowed=allowed,
+            needs_confirmation=needs_confirmation,
+            eta_seconds=eta_seconds,
+            queued=queued,
+            in_flight=in_flight
+        )
     
     @staticmethod
     async def enqueue_image_task(task_id: int, user_telegram_id: int, image_file_id: str):
@@ -48,11 +358,26 @@ class GenerationService:
             task_id,
             user_telegram_id,
             image_file_id,
-            _queue_name="arq:image_queue"  # ✅ УКАЗЫВАЕМ ОЧЕРЕДЬ
+            _queue_name=IMAGE_QUEUE_NAME  # ✅ УКАЗЫВАЕМ ОЧЕРЕДЬ
         )
         
         logger.info(f"Image task enqueued: task_id={task_id}")
     
+    @staticmethod
+    async def enqueue_image_batch(task_id: int, user_telegram_id: int, image_file_ids: List[str]):
+        """Поставить задачу обработки альбома в очередь ARQ"""
+        redis = await create_pool(get_redis_settings())
+        
+        await redis.enqueue_job(
+            "process_image_batch",
+            task_id,
+            user_telegram_id,
+            image_file_ids,
+            _queue_name=IMAGE_QUEUE_NAME
+        )
+        
+        logger.info(f"Image batch enqueued: task_id={task_id}, photos={len(image_file_ids)}")
+    
     @staticmethod
     async def enqueue_video_task(task_id: int, user_telegram_id: int, video_file_id: str):
         """Поставить задачу обработки видео в очередь ARQ"""
@@ -63,7 +388,33 @@ class GenerationService:
             task_id,
             user_telegram_id,
             video_file_id,
-            _queue_name="arq:video_queue"  # ✅ УКАЗЫВАЕМ ОЧЕРЕДЬ
+            _queue_name=VIDEO_QUEUE_NAME  # ✅ УКАЗЫВАЕМ ОЧЕРЕДЬ
+        )
+        
+        logger.info(f"Video task enqueued: task_id={task_id}")
+    
+    @staticmethod
+    async def enqueue_video_preview(
+        user_telegram_id: int,
+        video_file_id: str,
+        file_unique_id: str,
+        model: str,
+        parameters: dict
+    ):
+        """
+        Поставить превью видео в очередь ARQ
+        ✅ Быстрая очередь (image worker) - превью не ждет длинные видео
+        """
+        redis = await create_pool(get_redis_settings())
+        
+        await redis.enqueue_job(
+            "process_video_preview",
+            user_telegram_id,
+            video_file_id,
+            file_unique_id,
+            model,
+            parameters,
+            _queue_name=IMAGE_QUEUE_NAME
         )
         
-        logger.info(f"Video task enqueued: task_id={task_id}")
\ No newline at end of file
+        logger.info(f"Video preview enqueued: user={user_telegram_id}, model={model}")
@@ -94,6 +94,9 @@ IMAGE_MODELS = {
     }
 }
 
+# Модели для сравнения на одном фото (синхронные endpoint'ы)
+COMPARE_MODELS = ["enhance_standard", "enhance_high_fidelity", "sharpen_standard", "denoise_normal"]
+
 # ✅ Увеличенные лимиты для больших видео
 VIDEO_MODELS = {
     "proteus_4x": {
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, Optional
+import redis.asyncio as aioredis
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "result_cache"
+INDEX_KEY = f"{KEY_PREFIX}:index"  # zset: ключ -> время добавления
+HITS_KEY = f"{KEY_PREFIX}:hits"
+MISSES_KEY = f"{KEY_PREFIX}:misses"
+
+
+def content_hasher():
+    """Хэш содержимого входного файла (обновляется по мере скачивания)"""
+    return hashlib.sha256()
+
+
+class ResultCache:
+    """
+    Кэш результатов: хэш входа + модель + параметры -> Telegram file_id результата
+    ✅ Повторный вход отправляется сразу, без вызова Topaz
+    ✅ Вытеснение по возрасту (TTL) и по количеству записей
+    """
+
+    @staticmethod
+    def _key(content_hash: str, model: str, parameters: Optional[str]) -> str:
+        params_hash = hashlib.sha256((parameters or "").encode()).hexdigest()[:16]
+        return f"{KEY_PREFIX}:{model}:{params_hash}:{content_hash}"
+
+    @staticmethod
+    async def _redis() -> aioredis.Redis:
+        return await aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB_CACHE
+        )
+
+    async def get(self, content_hash: str, model: str, parameters: Optional[str]) -> Optional[str]:
+        """Получить file_id результата или None"""
+        redis = None
+        try:
+            redis = await self._redis()
+            key = self._key(content_hash, model, parameters)
+            raw = await redis.get(key)
+
+            if raw is None:
+                await redis.incr(MISSES_KEY)
+                return None
+
+            await redis.incr(HITS_KEY)
+            entry = json.loads(raw)
+            logger.info(f"Result cache hit: model={model}, hash={content_hash[:12]}")
+            return entry.get("file_id")
+
+        except Exception as e:
+            logger.error(f"Result cache get error: {e}")
+            return None
+        finally:
+            if redis:
+                try:
+                    await redis.close()
+                except Exception:
+                    pass
+
+    async def put(
+        self,
+        content_hash: str,
+        model: str,
+        parameters: Optional[str],
+        file_id: str,
+        size: int = 0
+    ):
+        """Сохранить file_id результата"""
+        if not file_id:
+            return
+
+        redis = None
+        try:
+            redis = await self._redis()
+            key = self._key(content_hash, model, parameters)
+            now = time.time()
+            entry = json.dumps({"file_id": file_id, "size": size, "created": int(now)})
+
+            pipe = redis.pipeline()
+            pipe.setex(key, settings.RESULT_CACHE_TTL, entry)
+            pipe.zadd(INDEX_KEY, {key: now})
+            # Вытеснение по возрасту: записи с истекшим TTL убираем из индекса
+            pipe.zremrangebyscore(INDEX_KEY, "-inf", now - settings.RESULT_CACHE_TTL)
+            pipe.zcard(INDEX_KEY)
+            results = await pipe.execute()
+
+            # Вытеснение по размеру: удаляем самые старые записи сверх лимита
+            overflow = results[-1] - settings.RESULT_CACHE_MAX_ENTRIES
+            if overflow > 0:
+                evicted = await redis.zpopmin(INDEX_KEY, overflow)
+                if evicted:
+                    await redis.delete(*[member for member, _ in evicted])
+                logger.info(f"Result cache evicted: {overflow} entries")
+
+        except Exception as e:
+            logger.error(f"Result cache put error: {e}")
+        finally:
+            if redis:
+                try:
+                    await redis.close()
+                except Exception:
+                    pass
+
+    async def stats(self) -> Dict[str, float]:
+        """Метрики для /stats"""
+        redis = None
+        try:
+            redis = await self._redis()
+            hits, misses = await redis.mget(HITS_KEY, MISSES_KEY)
+            entries = await redis.zcard(INDEX_KEY)
+            hits = int(hits or 0)
+            misses = int(misses or 0)
+            total = hits + misses
+            return {
+                "hits": hits,
+                "misses": misses,
+                "entries": entries,
+                "hit_rate": hits / total if total else 0.0
+            }
+        except Exception as e:
+            logger.error(f"Result cache stats error: {e}")
+            return {"hits": 0, "misses": 0, "entries": 0, "hit_rate": 0.0}
+        finally:
+            if redis:
+                try:
+                    await redis.close()
+                except Exception:
+                    pass
+
+
+result_cache = ResultCache()
@@ -0,0 +1,88 @@
+import hashlib
+import hmac
+import logging
+import os
+import re
+import time
+import uuid
+from typing import Optional
+from src.core.config import settings
+from src.utils.file_manager import TEMP_DIR
+
+logger = logging.getLogger(__name__)
+
+# Подкаталог общего тома: janitor temp_inputs его не сканирует
+RESULTS_DIR = os.path.join(TEMP_DIR, "results")
+NAME_PATTERN = re.compile(r"^[0-9]+_[0-9a-f]{32}\.mp4$")
+
+
+class ResultLinks:
+    """
+    Результаты больше лимита Bot API - ссылкой на наш FastAPI
+    ✅ Файл переносится из temp в results на том же томе (без копирования)
+    ✅ Ссылка подписана HMAC и истекает через RESULT_LINK_TTL
+    ✅ Просроченные файлы удаляет cron видео-воркера
+    """
+
+    @staticmethod
+    def _secret() -> bytes:
+        return (settings.RESULT_LINK_SECRET or settings.WEBHOOK_SECRET).encode()
+
+    def sign(self, name: str, expires: int) -> str:
+        return hmac.new(self._secret(), f"{name}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+    def verify(self, name: str, expires: int, signature: str) -> bool:
+        """Подпись верна и ссылка не истекла"""
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self.sign(name, expires), signature)
+
+    @staticmethod
+    def path(name: str) -> Optional[str]:
+        """Путь к файлу результата (None - недопустимое имя)"""
+        if not NAME_PATTERN.match(name):
+            return None
+        return os.path.join(RESULTS_DIR, name)
+
+    def publish(self, source_path: str, task_id: int) -> str:
+        """
+        Опубликовать результат
+
+        Returns:
+            подписанная ссылка на скачивание
+        """
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = f"{task_id}_{uuid.uuid4().hex}.mp4"
+        target = os.path.join(RESULTS_DIR, name)
+
+        os.replace(source_path, target)
+        # Срок хранения считаем от публикации
+        os.utime(target)
+
+        expires = int(time.time()) + settings.RESULT_LINK_TTL
+        url = f"{settings.WEBHOOK_URL}/results/{name}?expires={expires}&sig={self.sign(name, expires)}"
+        logger.info(f"Result published: task={task_id}, file={name}")
+        return url
+
+    def cleanup_expired(self) -> int:
+        """Удалить результаты старше RESULT_LINK_TTL (блокирующий - через asyncio.to_thread)"""
+        deadline = time.time() - settings.RESULT_LINK_TTL
+        deleted = 0
+        try:
+            with os.scandir(RESULTS_DIR) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file() and entry.stat().st_mtime < deadline:
+                            os.unlink(entry.path)
+                            deleted += 1
+                    except FileNotFoundError:
+                        pass
+        except FileNotFoundError:
+            pass
+
+        if deleted:
+            logger.info(f"Expired results deleted: {deleted}")
+        return deleted
+
+
+result_links = ResultLinks()
@@ -1,7 +1,7 @@
 import logging
-from typing import Optional, Union
+from typing import List, Optional, Union
 from aiogram import Bot
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InputMediaPhoto, InputMediaVideo
 from aiogram.exceptions import (
     TelegramBadRequest,
     TelegramForbiddenError,
@@ -151,6 +151,35 @@ async def safe_send_video(
         return None
 
 
+async def safe_send_media_group(
+    bot: Bot,
+    chat_id: int,
+    media: List[Union[InputMediaPhoto, InputMediaVideo]],
+) -> Optional[List[Message]]:
+    """
+    Безопасная отправка альбома (до 10 элементов)
+    ✅ Один запрос вместо отдельного сообщения на каждый файл
+    """
+    try:
+        return await bot.send_media_group(chat_id=chat_id, media=media)
+    except TelegramRetryAfter as e:
+        log.warning(f"Rate limit, retry after {e.retry_after}s: chat_id={chat_id}")
+        await asyncio.sleep(e.retry_after)
+        try:
+            return await bot.send_media_group(chat_id=chat_id, media=media)
+        except Exception:
+            return None
+    except TelegramForbiddenError:
+        log.warning(f"Bot blocked by user: chat_id={chat_id}")
+        return None
+    except TelegramBadRequest as e:
+        log.error(f"Bad request sending media group: chat_id={chat_id}, error={e}")
+        return None
+    except Exception as e:
+        log.exception(f"Unexpected error sending media group: chat_id={chat_id}, error={e}")
+        return None
+
+
 async def safe_edit_text(
     message: Message,
     text: str,
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+import redis.asyncio as aioredis
+from sqlalchemy import DateTime, event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+from src.core.config import settings
+from src.db.models import User
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "user_cache"
+# session.info: telegram_id пользователей, измененных в транзакции
+DIRTY_KEY = "user_cache_dirty"
+
+COLUMNS = [column.name for column in User.__table__.columns]
+DATETIME_COLUMNS = {column.name for column in User.__table__.columns if isinstance(column.type, DateTime)}
+
+
+class UserCache:
+    """
+    Кэш строк users по telegram_id: LRU процесса + Redis
+    ✅ Попадание в кэш - пользователь без SELECT (make_transient_to_detached + add)
+    ✅ Любое изменение пользователя (баланс, профиль, email) сбрасывает кэш после commit
+    ✅ LRU процесса живет USER_CACHE_LOCAL_TTL: сброс из другого процесса виден не позже
+    ✅ Баланс в кэше только для показа - списание проверяет баланс в SQL (UserService)
+    """
+
+    def __init__(self):
+        self._local: "OrderedDict[int, tuple]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _key(telegram_id: int) -> str:
+        return f"{KEY_PREFIX}:{telegram_id}"
+
+    @staticmethod
+    async def _redis() -> aioredis.Redis:
+        return await aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB_CACHE
+        )
+
+    @staticmethod
+    def _serialize(user: User) -> Optional[Dict[str, Any]]:
+        state = inspect(user)
+        if state.unloaded:
+            # Например updated_at после UPDATE - не дозагружаем ради кэша
+            return None
+        row = {}
+        for name in COLUMNS:
+            value = state.dict.get(name)
+            row[name] = value.isoformat() if isinstance(value, datetime) else value
+        return row
+
+    @staticmethod
+    def _deserialize(row: Dict[str, Any]) -> User:
+        values = {
+            name: datetime.fromisoformat(value) if name in DATETIME_COLUMNS and value else value
+            for name, value in row.items()
+            if name in COLUMNS
+        }
+        user = User(**values)
+        # Объект считается загруженным из БД: изменения уйдут обычным UPDATE по id
+        make_transient_to_detached(user)
+        return user
+
+    def _get_local(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._local.get(telegram_id)
+        if not entry:
+            return None
+        expires, row = entry
+        if expires < time.monotonic():
+            del self._local[telegram_id]
+            return None
+        self._local.move_to_end(telegram_id)
+        return row
+
+    def _put_local(self, telegram_id: int, row: Dict[str, Any]):
+        self._local[telegram_id] = (time.monotonic() + settings.USER_CACHE_LOCAL_TTL, row)
+        self._local.move_to_end(telegram_id)
+        while len(self._local) > settings.USER_CACHE_SIZE:
+            self._local.popitem(last=False)
+
+    async def get(self, session: AsyncSession, telegram_id: int) -> Optional[User]:
+        """Пользователь из кэша, привязанный к сессии (None - промах)"""
+        if not settings.USER_CACHE_ENABLED:
+            return None
+
+        row = self._get_local(telegram_id)
+        if row is None:
+            redis = None
+            try:
+                redis = await self._redis()
+                raw = await redis.get(self._key(telegram_id))
+            except Exception as e:
+                logger.error(f"User cache get error: {e}")
+                return None
+            finally:
+                if redis:
+                    await redis.close()
+            if not raw:
+                return None
+            row = json.loads(raw)
+            self._put_local(telegram_id, row)
+
+        try:
+            user = self._deserialize(row)
+            session.add(user)
+            return user
+        except Exception as e:
+            logger.error(f"User cache entry is invalid: telegram_id={telegram_id}, error={e}")
+            self.invalidate_local(telegram_id)
+            return None
+
+    async def put(self, session: AsyncSession, user: User):
+        """Закэшировать пользователя, прочитанного из БД"""
+        if not settings.USER_CACHE_ENABLED:
+            return
+        # Изменен в этой транзакции - кэш будет сброшен после commit
+        if user.telegram_id in session.info.get(DIRTY_KEY, ()):
+            return
+
+        row = self._serialize(user)
+        if row is None:
+            return
+
+        self._put_local(user.telegram_id, row)
+        redis = None
+        try:
+            redis = await self._redis()
+            await redis.set(self._key(user.telegram_id), json.dumps(row), ex=settings.USER_CACHE_TTL)
+        except Exception as e:
+            logger.error(f"User cache put error: {e}")
+        finally:
+            if redis:
+                await redis.close()
+
+    def invalidate_local(self, telegram_id: int):
+        self._local.pop(telegram_id, None)
+
+    async def invalidate(self, *telegram_ids: int):
+        for telegram_id in telegram_ids:
+            self.invalidate_local(telegram_id)
+        redis = None
+        try:
+            redis = await self._redis()
+            await redis.delete(*(self._key(telegram_id) for telegram_id in telegram_ids))
+        except Exception as e:
+            logger.error(f"User cache invalidate error: {e}")
+        finally:
+            if redis:
+                await redis.close()
+
+    @staticmethod
+    def mark_dirty(session: AsyncSession, telegram_id: int):
+        """Сбросить кэш пользователя после commit (для UPDATE в обход ORM-объекта)"""
+        session.info.setdefault(DIRTY_KEY, set()).add(telegram_id)
+
+    def invalidate_later(self, telegram_ids: Set[int]):
+        """Сбросить кэш из синхронного кода (события SQLAlchemy)"""
+        for telegram_id in telegram_ids:
+            self.invalidate_local(telegram_id)
+        try:
+            task = asyncio.get_running_loop().create_task(self.invalidate(*telegram_ids))
+        except RuntimeError:
+            # Нет event loop (синхронный код) - Redis-запись истечет по TTL
+            return
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_dirty_users(session: Session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.telegram_id is not None:
+            session.info.setdefault(DIRTY_KEY, set()).add(obj.telegram_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_dirty_users(session: Session):
+    telegram_ids = session.info.pop(DIRTY_KEY, None)
+    if telegram_ids:
+        user_cache.invalidate_later(telegram_ids)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_dirty_users(session: Session, previous_transaction):
+    session.info.pop(DIRTY_KEY, None)
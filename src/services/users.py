@@ -1,6 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
 from src.db.models import User, CreditLedger
+from src.services.user_cache import user_cache
 from typing import Optional
 import logging
 
@@ -76,6 +77,23 @@ class UserService:
         
         return user
     
+    @staticmethod
+    async def _change_balance(session: AsyncSession, user: User, delta: float, minimum: Optional[float] = None) -> bool:
+        """
+        Атомарно изменить баланс в БД и обновить user.balance
+        ✅ balance = balance + delta в SQL: user.balance мог устареть (кэш, другой процесс)
+        ✅ minimum - условие списания (баланс не уйдет в минус)
+        """
+        query = update(User).where(User.id == user.id)
+        if minimum is not None:
+            query = query.where(User.balance >= minimum)
+        result = await session.execute(
+            query.values(balance=User.balance + delta).execution_options(synchronize_session=False)
+        )
+        user_cache.mark_dirty(session, user.telegram_id)
+        await session.refresh(user, attribute_names=["balance"])
+        return result.rowcount > 0
+
     @staticmethod
     async def add_credits(
         session: AsyncSession,
@@ -96,9 +114,7 @@ class UserService:
         try:
             # Обновляем баланс
             old_balance = user.balance
-            user.balance += amount
-            
-            await session.flush()
+            await UserService._change_balance(session, user, amount)
             
             # Записываем в историю
             ledger_entry = CreditLedger(
@@ -143,20 +159,15 @@ class UserService:
             logger.warning(f"Invalid amount for deduct_credits: user_id={user.id}, amount={amount}")
             return False
         
-        # Проверяем баланс
-        if user.balance < amount:
-            logger.warning(
-                f"Insufficient balance: user_id={user.id}, "
-                f"balance={user.balance}, required={amount}"
-            )
-            return False
-        
         try:
-            # Списываем
+            # Списываем с проверкой баланса в том же UPDATE
             old_balance = user.balance
-            user.balance -= amount
-            
-            await session.flush()
+            if not await UserService._change_balance(session, user, -amount, minimum=amount):
+                logger.warning(
+                    f"Insufficient balance: user_id={user.id}, "
+                    f"balance={user.balance}, required={amount}"
+                )
+                return False
             
             # Записываем в историю (отрицательная сумма)
             ledger_entry = CreditLedger(
@@ -0,0 +1,190 @@
+import logging
+import shutil
+import time
+import uuid
+from typing import Dict, Optional
+import redis.asyncio as aioredis
+from src.core.config import settings
+from src.utils.file_manager import TEMP_DIR, MIN_FREE_DISK_GB, DiskManager
+
+logger = logging.getLogger(__name__)
+
+RESERVATIONS_KEY = "disk_ledger:reservations"  # hash: id -> байты, еще не записанные на диск
+EXPIRY_KEY = "disk_ledger:expiry"  # zset: id -> время истечения резерва
+
+# Атомарно: убрать просроченные резервы, проверить место, зарезервировать
+RESERVE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[4])
+for _, id in ipairs(expired) do
+    redis.call('HDEL', KEYS[1], id)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[4])
+
+local reserved = 0
+for _, value in ipairs(redis.call('HVALS', KEYS[1])) do
+    reserved = reserved + tonumber(value)
+end
+
+local requested = tonumber(ARGV[2])
+if tonumber(ARGV[3]) - reserved - requested < tonumber(ARGV[5]) then
+    return 0
+end
+
+redis.call('HSET', KEYS[1], ARGV[1], requested)
+redis.call('ZADD', KEYS[2], ARGV[4] + ARGV[6], ARGV[1])
+return 1
+"""
+
+# Записанные байты уже ушли из свободного места - уменьшаем на них резерв
+CONSUME_SCRIPT = """
+local value = redis.call('HGET', KEYS[1], ARGV[1])
+if not value then
+    return 0
+end
+local left = math.max(tonumber(value) - tonumber(ARGV[2]), 0)
+redis.call('HSET', KEYS[1], ARGV[1], left)
+return left
+"""
+
+
+class InsufficientDiskSpace(Exception):
+    """На общем томе temp_inputs нет места под резерв"""
+
+
+class DiskLedger:
+    """
+    Учет резервов места на общем томе temp_inputs (для всех контейнеров)
+    ✅ Задача резервирует вход + выход до скачивания, освобождает при очистке
+    ✅ Проверка и резерв атомарны (Lua) - два воркера не займут одно место
+    ✅ В резерве - только еще не записанное (consume): записанное уже вычтено из свободного места
+    ✅ Резерв упавшего воркера истекает сам (не дольше job_timeout)
+    """
+
+    @staticmethod
+    async def _redis() -> aioredis.Redis:
+        return await aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB_CACHE
+        )
+
+    @staticmethod
+    def _free_bytes() -> int:
+        return shutil.disk_usage(TEMP_DIR).free
+
+    async def reserve(self, size: int, ttl: int) -> Optional[str]:
+        """
+        Зарезервировать size байт
+
+        Returns:
+            id резерва (для release) или None, если Redis недоступен
+
+        Raises:
+            InsufficientDiskSpace: места с учетом чужих резервов не хватает
+        """
+        reservation_id = uuid.uuid4().hex
+        redis = None
+        try:
+            redis = await self._redis()
+            reserved = await redis.eval(
+                RESERVE_SCRIPT,
+                2,
+                RESERVATIONS_KEY,
+                EXPIRY_KEY,
+                reservation_id,
+                size,
+                self._free_bytes(),
+                int(time.time()),
+                MIN_FREE_DISK_GB * 1024 ** 3,
+                ttl
+            )
+        except Exception as e:
+            # Redis недоступен - как раньше, только локальная проверка
+            logger.error(f"Disk ledger reserve error: {e}")
+            if not DiskManager.check_disk_space():
+                raise InsufficientDiskSpace("Insufficient disk space")
+            return None
+        finally:
+            if redis:
+                try:
+                    await redis.close()
+                except Exception:
+                    pass
+
+        if not reserved:
+            logger.warning(f"Disk reservation refused: size={size >> 20}MB")
+            raise InsufficientDiskSpace(f"Cannot reserve {size >> 20}MB in {TEMP_DIR}")
+
+        logger.debug(f"Disk reserved: id={reservation_id}, size={size >> 20}MB")
+        return reservation_id
+
+    async def consume(self, reservation_id: Optional[str], size: int):
+        """Часть резерва записана на диск (size байт)"""
+        if not reservation_id or size <= 0:
+            return
+
+        redis = None
+        try:
+            redis = await self._redis()
+            await redis.eval(CONSUME_SCRIPT, 1, RESERVATIONS_KEY, reservation_id, size)
+        except Exception as e:
+            logger.error(f"Disk ledger consume error: id={reservation_id}, error={e}")
+        finally:
+            if redis:
+                try:
+                    await redis.close()
+                except Exception:
+                    pass
+
+    async def release(self, reservation_id: Optional[str]):
+        """Освободить резерв (после удаления временных файлов)"""
+        if not reservation_id:
+            return
+
+        redis = None
+        try:
+            redis = await self._redis()
+            pipe = redis.pipeline()
+            pipe.hdel(RESERVATIONS_KEY, reservation_id)
+            pipe.zrem(EXPIRY_KEY, reservation_id)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Disk ledger release error: id={reservation_id}, error={e}")
+        finally:
+            if redis:
+                try:
+                    await redis.close()
+                except Exception:
+                    pass
+
+    async def snapshot(self) -> Dict[str, int]:
+        """Метрики тома temp_inputs: занято, свободно, зарезервировано (еще не записано)"""
+        usage = shutil.disk_usage(TEMP_DIR)
+        reserved = 0
+        reservations = 0
+
+        redis = None
+        try:
+            redis = await self._redis()
+            values = await redis.hvals(RESERVATIONS_KEY)
+            reservations = len(values)
+            reserved = sum(int(value) for value in values)
+        except Exception as e:
+            logger.error(f"Disk ledger snapshot error: {e}")
+        finally:
+            if redis:
+                try:
+                    await redis.close()
+                except Exception:
+                    pass
+
+        return {
+            "total_bytes": usage.total,
+            "used_bytes": usage.used,
+            "free_bytes": usage.free,
+            "reserved_bytes": reserved,
+            "reservations": reservations
+        }
+
+
+disk_ledger = DiskLedger()
@@ -1,8 +1,9 @@
+import asyncio
 import os
 import shutil
 import logging
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Optional, Tuple
 import tempfile
 
 logger = logging.getLogger(__name__)
@@ -10,14 +11,18 @@ logger = logging.getLogger(__name__)
 MAX_VIDEO_SIZE = 2 * 1024 * 1024 * 1024  # 2 GB
 MAX_IMAGE_SIZE = 20 * 1024 * 1024        # 20 MB
 MIN_FREE_DISK_GB = 10  # ✅ Увеличено для больших видео
+TEMP_DIR = "/app/temp_inputs"  # общий том temp_data всех контейнеров
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+DOWNLOAD_TIMEOUT = 1800  # секунд на скачивание файла целиком
+LEDGER_REPORT_SIZE = 64 * 1024 * 1024  # записанные байты отмечаем в disk_ledger пачками
 
 
 class DiskManager:
     @staticmethod
     def check_disk_space() -> bool:
-        """Проверка свободного места"""
+        """Проверка свободного места на томе временных файлов"""
         try:
-            stat = shutil.disk_usage("/app")
+            stat = shutil.disk_usage(TEMP_DIR if os.path.isdir(TEMP_DIR) else "/app")
             free_gb = stat.free / (1024**3)
             if free_gb < MIN_FREE_DISK_GB:
                 logger.critical(f"Low disk space: {free_gb:.1f} GB free")
@@ -33,13 +38,15 @@ class DiskManager:
         if not DiskManager.check_disk_space():
             raise IOError("Insufficient disk space")
         
-        temp_dir = Path("/app/temp_inputs")
+        temp_dir = Path(TEMP_DIR)
         temp_dir.mkdir(exist_ok=True)
         
         fd, path = tempfile.mkstemp(suffix=suffix, dir=str(temp_dir))
         try:
             with os.fdopen(fd, 'wb') as f:
                 f.write(data)
+            from src.utils.temp_janitor import temp_janitor
+            temp_janitor.track(path, len(data))
             return path
         except Exception as e:
             try:
@@ -48,46 +55,157 @@ class DiskManager:
                 pass
             raise e
     
+    @staticmethod
+    def new_temp_path(suffix: str) -> str:
+        """Путь для файла, который создаст внешняя программа (ffmpeg)"""
+        temp_dir = Path(TEMP_DIR)
+        temp_dir.mkdir(exist_ok=True)
+
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=str(temp_dir))
+        os.close(fd)
+        from src.utils.temp_janitor import temp_janitor
+        temp_janitor.track(path, 0)
+        return path
+
+    @staticmethod
+    def adopt_temp_file(path: str):
+        """Взять под учет файл, созданный внешней программой"""
+        from src.utils.temp_janitor import temp_janitor
+        temp_janitor.track(path, os.path.getsize(path))
+
+    @staticmethod
+    async def download_to_temp(
+        bot,
+        file_path: str,
+        suffix: str,
+        hasher=None,
+        reservation: Optional[str] = None
+    ) -> Tuple[str, int]:
+        """
+        Потоковое скачивание файла Telegram во временный файл
+        ✅ Чанки сразу на диск - память не растет с размером файла
+        ✅ Хэш и размер считаются по мере скачивания
+        ✅ Записанное списывается с резерва disk_ledger (reservation)
+
+        Returns:
+            (путь, размер в байтах)
+        """
+        if not DiskManager.check_disk_space():
+            raise IOError("Insufficient disk space")
+
+        if os.path.isabs(file_path):
+            # Локальный Bot API сервер: файл уже на общем томе
+            return await DiskManager._link_local_file(file_path, suffix, hasher, reservation)
+
+        url = bot.session.api.file_url(bot.token, file_path)
+        chunks = bot.session.stream_content(
+            url=url,
+            timeout=DOWNLOAD_TIMEOUT,
+            chunk_size=DOWNLOAD_CHUNK_SIZE,
+            raise_for_status=True
+        )
+        return await DiskManager.stream_to_temp(chunks, suffix, hasher, reservation)
+
+    @staticmethod
+    async def stream_to_temp(
+        chunks: AsyncIterator[bytes],
+        suffix: str,
+        hasher=None,
+        reservation: Optional[str] = None
+    ) -> Tuple[str, int]:
+        """
+        Поток чанков (HTTP-ответ) -> временный файл
+        ✅ Запись и хэш вне event loop
+        ✅ Записанное списывается с резерва disk_ledger (reservation)
+
+        Returns:
+            (путь, размер в байтах)
+        """
+        from src.utils.disk_ledger import disk_ledger
+        path = DiskManager.new_temp_path(suffix)
+        size = 0
+        reported = 0
+        try:
+            with open(path, "wb") as f:
+                def consume(chunk: bytes):
+                    f.write(chunk)
+                    if hasher:
+                        hasher.update(chunk)
+
+                async for chunk in chunks:
+                    await asyncio.to_thread(consume, chunk)
+                    size += len(chunk)
+                    if size - reported >= LEDGER_REPORT_SIZE:
+                        await disk_ledger.consume(reservation, size - reported)
+                        reported = size
+            await disk_ledger.consume(reservation, size - reported)
+        except BaseException:
+            DiskManager.cleanup_file(path)
+            raise
+
+        from src.utils.temp_janitor import temp_janitor
+        temp_janitor.track(path, size)
+        return path, size
+
+    @staticmethod
+    async def _link_local_file(
+        file_path: str,
+        suffix: str,
+        hasher=None,
+        reservation: Optional[str] = None
+    ) -> Tuple[str, int]:
+        """
+        Файл локального Bot API сервера -> временный файл задачи
+        ✅ Символическая ссылка на том сервера (bot_api_data, только чтение) - без копирования:
+           тома разные, жесткая ссылка невозможна
+        ✅ Файл сервера не трогаем - задача удаляет только свою ссылку
+        ✅ Копия в потоке - только если ссылку создать нельзя (с предупреждением в логе)
+        """
+        from src.utils.temp_janitor import temp_janitor
+        path = DiskManager.new_temp_path(suffix)
+        try:
+            os.unlink(path)
+            # Блокировка janitor держалась на удаленном пустом файле - возьмем заново на ссылке
+            temp_janitor.release(path)
+            try:
+                os.symlink(file_path, path)
+            except OSError as e:
+                logger.warning(f"Cannot link Bot API file {file_path}, copying: {e}")
+                await asyncio.to_thread(shutil.copyfile, file_path, path)
+            if hasher:
+                await asyncio.to_thread(DiskManager.hash_file, path, hasher)
+        except BaseException:
+            DiskManager.cleanup_file(path)
+            raise
+
+        size = os.path.getsize(path)
+        # Ссылка не занимает место на томе temp_inputs - в квоту janitor не входит
+        temp_janitor.track(path, 0 if os.path.islink(path) else size)
+        # Ссылка - вход на томе сервера, копия - уже записана: резерв под вход не нужен
+        from src.utils.disk_ledger import disk_ledger
+        await disk_ledger.consume(reservation, size)
+        return path, size
+
+    @staticmethod
+    def hash_file(path: str, hasher) -> str:
+        """Хэш файла по чанкам (блокирующий - вызывать через asyncio.to_thread)"""
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
     @staticmethod
     def cleanup_file(path: Optional[str]):
-        """Безопасное удаление файла"""
-        if path and os.path.exists(path):
+        """Безопасное удаление файла (и ссылки на файл Bot API, даже если он уже удален)"""
+        if path:
+            from src.utils.temp_janitor import temp_janitor
+            temp_janitor.release(path)
+        if path and os.path.lexists(path):
             try:
                 os.unlink(path)
                 logger.debug(f"Cleaned up: {path}")
             except Exception as e:
                 logger.warning(f"Cleanup failed {path}: {e}")
-    
-    @staticmethod
-    def cleanup_old_files(directory: str, max_age_seconds: int = 3600):
-        """Очистка старых файлов"""
-        import time
-        try:
-            temp_dir = Path(directory)
-            if not temp_dir.exists():
-                return
-            
-            now = time.time()
-            deleted = 0
-            freed_mb = 0
-            
-            for file_path in temp_dir.glob("*"):
-                if file_path.is_file():
-                    age = now - file_path.stat().st_mtime
-                    if age > max_age_seconds:
-                        try:
-                            size_mb = file_path.stat().st_size / 1024 / 1024
-                            file_path.unlink()
-                            deleted += 1
-                            freed_mb += size_mb
-                        except Exception as e:
-                            logger.warning(f"Failed to delete {file_path}: {e}")
-            
-            if deleted > 0:
-                logger.info(f"Cleaned {deleted} files ({freed_mb:.1f} MB) from {directory}")
-                
-        except Exception as e:
-            logger.error(f"Cleanup error: {e}")
 
 
 disk_manager = DiskManager()
\ No newline at end of file
@@ -1,5 +1,6 @@
 import logging
 from typing import Tuple, Optional
+from src.services.bot_api import max_download_size
 
 logger = logging.getLogger(__name__)
 
@@ -19,12 +20,23 @@ class FileValidator:
             return False, f"Изображение слишком большое (макс. {max_mb} МБ)"
         return True, None
     
+    @staticmethod
+    def max_video_size() -> int:
+        """Лимит видео с учетом Bot API (облачный скачивает только до 20 МБ)"""
+        return min(FileValidator.MAX_VIDEO_SIZE, max_download_size())
+    
+    @staticmethod
+    def max_video_size_text() -> str:
+        max_size = FileValidator.max_video_size()
+        if max_size >= 1024 * 1024 * 1024:
+            return f"{max_size / 1024 / 1024 / 1024:.0f} ГБ"
+        return f"{max_size // 1024 // 1024} МБ"
+    
     @staticmethod
     def validate_video_size(file_size: int) -> Tuple[bool, Optional[str]]:
         """Валидация размера видео"""
-        if file_size > FileValidator.MAX_VIDEO_SIZE:
-            max_gb = FileValidator.MAX_VIDEO_SIZE // 1024 // 1024 // 1024
-            return False, f"Видео слишком большое (макс. {max_gb} ГБ)"
+        if (file_size or 0) > FileValidator.max_video_size():
+            return False, f"Видео слишком большое (макс. {FileValidator.max_video_size_text()})"
         return True, None
     
     @staticmethod
@@ -0,0 +1,224 @@
+import asyncio
+import fcntl
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Set
+from src.core.config import settings
+from src.utils.file_manager import TEMP_DIR
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TempEntry:
+    size: int
+    mtime: float
+
+
+class TempJanitor:
+    """
+    Очистка временных файлов внутри воркера
+    ✅ Файлы, с которыми работают задачи, не удаляются
+    ✅ Вытеснение по возрасту и по общему объему (квота)
+    ✅ Работает по индексу, каталог пересканируется редко
+
+    Том общий для контейнеров: на файл в работе процесс держит разделяемую
+    блокировку (flock), а janitor удаляет файл, только взяв исключительную.
+    Так не удаляются файлы задач других процессов (image worker, превью),
+    даже если в том процессе janitor не запущен. Дополнительно свои файлы
+    в работе janitor "трогает" (mtime).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._index: Dict[str, TempEntry] = {}
+        self._in_use: Set[str] = set()
+        # Дескрипторы с разделяемой блокировкой файлов в работе
+        self._locks: Dict[str, int] = {}
+        self._last_scan = 0.0
+        self._running = False
+
+    def track(self, path: str, size: int):
+        """Файл создан задачей и используется"""
+        self._index[path] = TempEntry(size=size, mtime=time.time())
+        self._in_use.add(path)
+        if path not in self._locks:
+            self._lock(path)
+
+    def release(self, path: str):
+        """Файл удален задачей"""
+        self._index.pop(path, None)
+        self._in_use.discard(path)
+        fd = self._locks.pop(path, None)
+        if fd is not None:
+            os.close(fd)
+
+    def _lock(self, path: str):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError as e:
+            logger.warning(f"Janitor lock failed {path}: {e}")
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+        except OSError as e:
+            os.close(fd)
+            logger.warning(f"Janitor lock failed {path}: {e}")
+            return
+        self._locks[path] = fd
+
+    def _scan(self) -> Dict[str, TempEntry]:
+        """Полный проход по каталогу: файлы других процессов и сироты"""
+        index: Dict[str, TempEntry] = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    # Ссылки - входы на томе Bot API сервера: учитываем саму ссылку
+                    if not (entry.is_file(follow_symlinks=False) or entry.is_symlink()):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                    index[entry.path] = TempEntry(size=stat.st_size, mtime=stat.st_mtime)
+        except FileNotFoundError:
+            pass
+        return index
+
+    def _merge_scan(self, index: Dict[str, TempEntry]):
+        # Для своих файлов в работе оставляем собственные данные
+        for path in self._in_use:
+            if path in self._index:
+                index[path] = self._index[path]
+        self._index = index
+        self._last_scan = time.time()
+
+    def _touch_in_use(self):
+        now = time.time()
+        for path in list(self._in_use):
+            try:
+                # Ссылку, а не файл сервера (его том только для чтения)
+                os.utime(path, (now, now), follow_symlinks=False)
+                self._index[path].mtime = now
+            except FileNotFoundError:
+                self.release(path)
+            except Exception as e:
+                logger.warning(f"Janitor touch failed {path}: {e}")
+
+    def _evict(self, path: str, min_age: float) -> Optional[int]:
+        """
+        Удалить файл, если его не трогали min_age секунд
+
+        Returns:
+            освобождено байт или None, если файл свежий (в работе у другого процесса)
+        """
+        try:
+            stat = os.lstat(path)
+        except FileNotFoundError:
+            self._index.pop(path, None)
+            return 0
+
+        if time.time() - stat.st_mtime < min_age:
+            self._index[path] = TempEntry(size=stat.st_size, mtime=stat.st_mtime)
+            return None
+
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            # Файл удален или ссылка на уже удаленный файл сервера
+            self._index.pop(path, None)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            return 0
+        except Exception as e:
+            logger.warning(f"Janitor delete failed {path}: {e}")
+            return 0
+
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Файл в работе у задачи (любого процесса)
+                self._index[path] = TempEntry(size=stat.st_size, mtime=stat.st_mtime)
+                return None
+
+            self._index.pop(path, None)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                return 0
+            except Exception as e:
+                logger.warning(f"Janitor delete failed {path}: {e}")
+                return 0
+            return stat.st_size
+        finally:
+            os.close(fd)
+
+    def sweep(self):
+        """Один проход очистки по индексу"""
+        now = time.time()
+        self._touch_in_use()
+
+        deleted = 0
+        freed = 0
+
+        # По возрасту
+        expired = [
+            path for path, entry in self._index.items()
+            if path not in self._in_use and now - entry.mtime > settings.TEMP_FILE_MAX_AGE
+        ]
+        for path in expired:
+            size = self._evict(path, settings.TEMP_FILE_MAX_AGE)
+            if size is not None:
+                freed += size
+                deleted += 1
+
+        # По квоте: самые старые свободные файлы, пока не уложимся
+        total = sum(entry.size for entry in self._index.values())
+        if total > settings.TEMP_DIR_QUOTA:
+            candidates = sorted(
+                (entry.mtime, path) for path, entry in self._index.items()
+                if path not in self._in_use
+            )
+            # Файлы в работе у других процессов их janitor трогает каждый интервал
+            min_age = 2 * settings.TEMP_JANITOR_INTERVAL
+            for _, path in candidates:
+                if total <= settings.TEMP_DIR_QUOTA:
+                    break
+                size = self._evict(path, min_age)
+                if size is None:
+                    continue
+                total -= size
+                freed += size
+                deleted += 1
+            if total > settings.TEMP_DIR_QUOTA:
+                logger.warning(f"Temp quota exceeded by in-use files: {total >> 20}MB")
+
+        if deleted:
+            logger.info(f"Janitor cleaned {deleted} files ({freed >> 20} MB) from {self.directory}")
+
+    async def run(self):
+        """
+        Фоновая задача воркера
+        ✅ Одна на процесс: комбинированный воркер запускает startup обеих очередей
+        """
+        if self._running:
+            return
+        self._running = True
+        logger.info(f"Temp janitor started: {self.directory}")
+        try:
+            while True:
+                try:
+                    if time.time() - self._last_scan >= settings.TEMP_JANITOR_RESCAN_INTERVAL:
+                        # Проход по каталогу блокирующий - выносим из event loop
+                        self._merge_scan(await asyncio.to_thread(self._scan))
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"Janitor error: {e}")
+                await asyncio.sleep(settings.TEMP_JANITOR_INTERVAL)
+        finally:
+            self._running = False
+
+
+temp_janitor = TempJanitor(TEMP_DIR)
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import logging
+import os
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentationError(Exception):
+    """Ошибка ffmpeg при нарезке или склейке видео"""
+
+
+async def _run(*args: str) -> bytes:
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise SegmentationError(f"{args[0]} failed ({process.returncode}): {stderr.decode(errors='ignore')[-500:]}")
+    return stdout
+
+
+async def probe_duration(path: str) -> Optional[float]:
+    """Длительность файла (секунды) через ffprobe"""
+    try:
+        output = await _run(
+            "ffprobe", "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "json",
+            path
+        )
+        return float(json.loads(output)["format"]["duration"])
+    except (SegmentationError, KeyError, ValueError) as e:
+        logger.warning(f"ffprobe failed: {path}, error={e}")
+        return None
+
+
+async def split_video(input_path: str, segment_seconds: int) -> List[str]:
+    """
+    Нарезка видео на сегменты по ключевым кадрам
+    ✅ Без перекодирования (-c copy) - резка только по keyframe
+    ✅ Без звука - звук берется из оригинала один раз при склейке
+    """
+    base, _ = os.path.splitext(input_path)
+    pattern = f"{base}_seg%03d.mp4"
+
+    await _run(
+        "ffmpeg", "-v", "error", "-y",
+        "-i", input_path,
+        "-map", "0:v:0",
+        "-an",
+        "-c", "copy",
+        "-f", "segment",
+        "-segment_time", str(segment_seconds),
+        "-reset_timestamps", "1",
+        pattern
+    )
+
+    directory = os.path.dirname(input_path)
+    prefix = os.path.basename(base) + "_seg"
+    segments = sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.startswith(prefix) and name.endswith(".mp4")
+    )
+    if not segments:
+        raise SegmentationError(f"No segments produced for {input_path}")
+    return segments
+
+
+async def concat_segments(segment_paths: List[str], audio_source: str, output_path: str):
+    """
+    Склейка обработанных сегментов без перекодирования + звук из оригинала
+    """
+    list_path = f"{os.path.splitext(output_path)[0]}_list.txt"
+    with open(list_path, "w") as f:
+        for path in segment_paths:
+            f.write(f"file '{path}'\n")
+
+    try:
+        await _run(
+            "ffmpeg", "-v", "error", "-y",
+            "-f", "concat", "-safe", "0",
+            "-i", list_path,
+            "-i", audio_source,
+            "-map", "0:v",
+            "-map", "1:a?",
+            "-c", "copy",
+            "-shortest",
+            "-movflags", "+faststart",
+            output_path
+        )
+    finally:
+        try:
+            os.unlink(list_path)
+        except FileNotFoundError:
+            pass
+
+
+async def cut_clip(input_path: str, output_path: str, start: float, seconds: float):
+    """
+    Короткий фрагмент видео (для превью)
+    ✅ Без перекодирования - начало фрагмента по ближайшему ключевому кадру
+    """
+    await _run(
+        "ffmpeg", "-v", "error", "-y",
+        "-ss", f"{start:.2f}",
+        "-i", input_path,
+        "-t", f"{seconds:.2f}",
+        "-map", "0:v:0",
+        "-an",
+        "-c", "copy",
+        "-movflags", "+faststart",
+        output_path
+    )
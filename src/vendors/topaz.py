@@ -1,6 +1,6 @@
 import aiohttp
 import asyncio
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, BinaryIO, Union
 from src.core.config import settings
 import logging
 
@@ -80,7 +80,7 @@ class TopazClient:
             )
 
     # IMAGE API
-    async def enhance_image(self, image_data: bytes, model: str = "Standard V2", output_format: str = "jpeg", **params) -> bytes:
+    async def enhance_image(self, image_data: Union[bytes, BinaryIO], model: str = "Standard V2", output_format: str = "jpeg", **params) -> bytes:
         session = await self._get_session()
         form = aiohttp.FormData()
         form.add_field('image', image_data, filename='image.jpg', content_type='image/jpeg')
@@ -99,7 +99,7 @@ class TopazClient:
         except aiohttp.ClientError as e:
             raise TopazAPIError(f"Network error: {e}", user_message="Ошибка сети")
 
-    async def sharpen_image(self, image_data: bytes, model: str = "Standard", output_format: str = "jpeg", **params) -> bytes:
+    async def sharpen_image(self, image_data: Union[bytes, BinaryIO], model: str = "Standard", output_format: str = "jpeg", **params) -> bytes:
         session = await self._get_session()
         form = aiohttp.FormData()
         form.add_field('image', image_data, filename='image.jpg', content_type='image/jpeg')
@@ -118,7 +118,7 @@ class TopazClient:
         except aiohttp.ClientError as e:
             raise TopazAPIError(f"Network error: {e}", user_message="Ошибка сети")
 
-    async def denoise_image(self, image_data: bytes, model: str = "Normal", output_format: str = "jpeg", **params) -> bytes:
+    async def denoise_image(self, image_data: Union[bytes, BinaryIO], model: str = "Normal", output_format: str = "jpeg", **params) -> bytes:
         session = await self._get_session()
         form = aiohttp.FormData()
         form.add_field('image', image_data, filename='image.jpg', content_type='image/jpeg')
@@ -164,7 +164,8 @@ class TopazClient:
         except aiohttp.ClientError as e:
             raise TopazAPIError(f"Network error: {e}", user_message="Ошибка сети")
 
-    async def upload_video_to_url(self, upload_url: str, video_data: bytes) -> str:
+    async def upload_video_to_url(self, upload_url: str, video_data: Union[bytes, BinaryIO]) -> str:
+        """Загрузка видео по presigned URL (открытый файл отправляется потоком)"""
         try:
             async with aiohttp.ClientSession() as temp_session:
                 async with temp_session.put(upload_url, data=video_data, headers={"Content-Type": "video/mp4"}) as response:
@@ -1,5 +1,11 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
 from datetime import datetime
+import logging
+from src.utils.disk_ledger import disk_ledger
+from src.db.engine import POOL_STATS
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -21,4 +27,57 @@ async def root():
         "status": "ok",
         "service": "Topaz Bot API",
         "version": "1.0.0"
-    }
\ No newline at end of file
+    }
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """Метрики в формате Prometheus"""
+    lines = []
+
+    executor = getattr(request.app.state, "executor", None)
+    if executor:
+        lines += [
+            "# HELP topaz_webhook_pending_updates Updates accepted by this process and not yet handled",
+            "# TYPE topaz_webhook_pending_updates gauge",
+            f"topaz_webhook_pending_updates {executor.pending}",
+            "# HELP topaz_webhook_updates_total Updates handled by this process",
+            "# TYPE topaz_webhook_updates_total counter",
+            f"topaz_webhook_updates_total {executor.processed}",
+        ]
+
+    # Соединений из пула на апдейт: rate(checkouts) / rate(updates)
+    lines += [
+        "# HELP topaz_db_pool_checkouts_total Connections checked out of the SQLAlchemy pool by this process",
+        "# TYPE topaz_db_pool_checkouts_total counter",
+        f"topaz_db_pool_checkouts_total {POOL_STATS['checkouts']}",
+    ]
+
+    bus = getattr(request.app.state, "bus", None)
+    if bus:
+        try:
+            lines += [
+                "# HELP topaz_update_stream_backlog Updates in Redis Streams not yet acknowledged",
+                "# TYPE topaz_update_stream_backlog gauge",
+                f"topaz_update_stream_backlog {await bus.backlog()}",
+            ]
+        except Exception as e:
+            logger.error(f"Update stream metrics error: {e}")
+    try:
+        disk = await disk_ledger.snapshot()
+        lines += [
+            "# HELP topaz_temp_disk_bytes Temp volume size, used and free bytes",
+            "# TYPE topaz_temp_disk_bytes gauge",
+            f'topaz_temp_disk_bytes{{kind="total"}} {disk["total_bytes"]}',
+            f'topaz_temp_disk_bytes{{kind="used"}} {disk["used_bytes"]}',
+            f'topaz_temp_disk_bytes{{kind="free"}} {disk["free_bytes"]}',
+            "# HELP topaz_temp_disk_reserved_bytes Bytes reserved by running jobs",
+            "# TYPE topaz_temp_disk_reserved_bytes gauge",
+            f"topaz_temp_disk_reserved_bytes {disk['reserved_bytes']}",
+            "# HELP topaz_temp_disk_reservations Active disk reservations",
+            "# TYPE topaz_temp_disk_reservations gauge",
+            f"topaz_temp_disk_reservations {disk['reservations']}",
+        ]
+    except Exception as e:
+        logger.error(f"Disk metrics error: {e}")
+
+    return "\n".join(lines) + "\n"
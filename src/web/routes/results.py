@@ -0,0 +1,116 @@
+import asyncio
+import os
+import re
+import logging
+from typing import Optional, Tuple
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import StreamingResponse
+from src.core.config import settings
+from src.services.result_links import result_links
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+CHUNK_SIZE = 1024 * 1024
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Один диапазон из заголовка Range
+
+    Returns:
+        (start, end) включительно или None - диапазон неудовлетворим
+
+    Raises:
+        ValueError: заголовок не разобран (отдаем файл целиком)
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        raise ValueError(header)
+
+    start, end = match.groups()
+    if not start and not end:
+        raise ValueError(header)
+
+    if not start:
+        # bytes=-N: последние N байт
+        length = int(end)
+        if length == 0:
+            return None
+        return max(0, size - length), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+async def _file_chunks(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@router.api_route("/results/{name}", methods=["GET", "HEAD"])
+async def download_result(name: str, expires: int, sig: str, request: Request):
+    """
+    Скачивание результата по подписанной ссылке
+    ✅ Range (докачка и перемотка в плеере)
+    ✅ С RESULT_LINK_ACCEL_PREFIX файл отдает nginx (X-Accel-Redirect, sendfile)
+    """
+    path = result_links.path(name)
+    if not path or not result_links.verify(name, expires, sig):
+        return Response(status_code=403)
+
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return Response(status_code=404)
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{name}"',
+        "Cache-Control": "private, max-age=3600",
+    }
+
+    if settings.RESULT_LINK_ACCEL_PREFIX:
+        # Nginx сам отдает файл (sendfile) и обрабатывает Range
+        headers["X-Accel-Redirect"] = f"{settings.RESULT_LINK_ACCEL_PREFIX.rstrip('/')}/{name}"
+        return Response(status_code=200, headers=headers, media_type="video/mp4")
+
+    start, end = 0, size - 1
+    status_code = 200
+    range_header = request.headers.get("range")
+    if range_header and size:
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            # Несколько диапазонов или мусор - отдаем файл целиком
+            byte_range = ()
+        if byte_range is None:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    length = end - start + 1 if size else 0
+    headers["Content-Length"] = str(length)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type="video/mp4")
+
+    return StreamingResponse(
+        _file_chunks(path, start, length),
+        status_code=status_code,
+        headers=headers,
+        media_type="video/mp4"
+    )
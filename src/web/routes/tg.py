@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Request, HTTPException
-from aiogram import Bot, Dispatcher
-from aiogram.types import Update
+from fastapi import APIRouter, Request, HTTPException, Response
 from src.core.config import settings
+from src.web.update_executor import UpdateExecutor
+from src.web.update_bus import UpdateBus
+from src.web.update_decoding import decode_update
+import asyncio
 import logging
+from urllib.parse import urlencode
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -13,6 +16,12 @@ async def telegram_webhook(request: Request):
     """
     Telegram webhook endpoint
     ✅ С проверкой секретного токена
+    ✅ orjson + одна валидация Update, ненужные типы апдейтов отбрасываются сразу
+    ✅ Отвечаем сразу, апдейт обрабатывается в фоне (по порядку внутри чата)
+    ✅ Очередь переполнена - 503, Telegram доставит апдейт повторно
+    ✅ Ждем не дольше WEBHOOK_REPLY_TIMEOUT: хендлер успел и вернул метод -
+       он уходит в теле ответа (Telegram выполнит его сам, без отдельного запроса к Bot API)
+    ✅ WEBHOOK_MODE=stream - апдейт уходит в Redis Streams, обработает любой процесс
     """
     # Проверяем секретный токен
     secret_token = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
@@ -21,18 +30,39 @@ async def telegram_webhook(request: Request):
         raise HTTPException(status_code=403, detail="Forbidden")
     
     try:
-        update_dict = await request.json()
-        
-        # Получаем bot и dispatcher из app state
-        bot: Bot = request.app.state.bot
-        dp: Dispatcher = request.app.state.dp
-        
-        # Обрабатываем update
-        update = Update(**update_dict)
-        await dp.feed_update(bot, update)
-        
-        return {"ok": True}
-        
+        raw = await request.body()
+        update = decode_update(raw, request.app.state.update_types)
     except Exception as e:
         logger.error(f"Telegram webhook error: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    if update is None:
+        # Тип апдейта без хендлеров - подтверждаем, не валидируя
+        return {"ok": True}
+
+    bus: UpdateBus = request.app.state.bus
+    if bus:
+        try:
+            await bus.publish(update, raw)
+        except Exception as e:
+            logger.error(f"Update bus publish error: {e}")
+            raise HTTPException(status_code=503, detail="Unavailable")
+        return {"ok": True}
+
+    # Получаем executor из app state
+    executor: UpdateExecutor = request.app.state.executor
+    reply = asyncio.get_running_loop().create_future() if settings.WEBHOOK_REPLY_TIMEOUT > 0 else None
+    if not executor.submit(update, reply=reply):
+        logger.warning(f"Update queue is full ({executor.pending}), shedding update {update.update_id}")
+        raise HTTPException(status_code=503, detail="Overloaded")
+
+    if reply is not None:
+        try:
+            # По таймауту future отменяется - метод отправит executor
+            fields = await asyncio.wait_for(reply, timeout=settings.WEBHOOK_REPLY_TIMEOUT)
+        except asyncio.TimeoutError:
+            fields = None
+        if fields:
+            return Response(content=urlencode(fields), media_type="application/x-www-form-urlencoded")
+
+    return {"ok": True}
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import JSONResponse
-from aiogram import Bot
+from src.services.bot_api import create_bot
 from src.db.engine import async_session_maker
 from src.db.models import User
 from src.services.users import UserService
@@ -82,7 +82,7 @@ async def yookassa_webhook(request: Request):
             logger.info(f"YooKassa payment processed: user_id={user_id}, credits={credits}")
             
             # Уведомление пользователю
-            bot = Bot(token=settings.BOT_TOKEN)
+            bot = create_bot()
             try:
                 await safe_send_text(
                         bot=bot,
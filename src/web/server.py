@@ -1,6 +1,6 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from aiogram import Bot, Dispatcher
+from aiogram import Dispatcher
 from aiogram.fsm.storage.redis import RedisStorage, DefaultKeyBuilder
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
@@ -10,6 +10,7 @@ import logging
 
 from src.core.config import settings
 from src.core.logging import setup_logging
+from src.services.bot_api import create_bot
 from src.bot.routers import get_routers
 from src.bot.middlewares import (
     DatabaseMiddleware,
@@ -19,7 +20,9 @@ from src.bot.middlewares import (
     ThrottlingMiddleware,
     ErrorHandlerMiddleware,
 )
-from src.web.routes import tg, yookassa, health
+from src.web.routes import tg, yookassa, health, results
+from src.web.update_executor import UpdateExecutor
+from src.web.update_bus import UpdateBus
 
 setup_logging()
 logger = logging.getLogger(__name__)
@@ -31,8 +34,7 @@ async def lifespan(app: FastAPI):
     logger.info("Starting bot...")
 
     # --- Создаем bot ---
-    bot = Bot(
-        token=settings.BOT_TOKEN,
+    bot = create_bot(
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
 
@@ -73,6 +75,21 @@ async def lifespan(app: FastAPI):
     router = get_routers()
     dp.include_router(router)
 
+    # --- Фоновая обработка апдейтов (webhook отвечает сразу) ---
+    executor = UpdateExecutor(
+        bot,
+        dp,
+        concurrency=settings.WEBHOOK_CONCURRENCY,
+        max_pending=settings.WEBHOOK_QUEUE_SIZE,
+    )
+    executor.start()
+
+    # --- Шина апдейтов: процесс читает свои партиции Redis Streams ---
+    bus = None
+    if settings.WEBHOOK_MODE == "stream":
+        bus = UpdateBus(redis_client, executor)
+        bus.start()
+
     # --- Устанавливаем webhook (с защитой от флуда) ---
     webhook_url = f"{settings.WEBHOOK_URL}{settings.WEBHOOK_PATH}"
 
@@ -110,6 +127,10 @@ async def lifespan(app: FastAPI):
     app.state.bot = bot
     app.state.dp = dp
     app.state.redis = redis_client
+    app.state.executor = executor
+    # Типы апдейтов с хендлерами: остальные webhook отбрасывает до валидации
+    app.state.update_types = frozenset(dp.resolve_used_update_types())
+    app.state.bus = bus
 
     try:
         # Передаём управление приложению
@@ -117,6 +138,17 @@ async def lifespan(app: FastAPI):
     finally:
         # ✅ Корректный shutdown
         logger.info("Stopping bot...")
+
+        # Дообрабатываем принятые апдейты, пока сессия бота открыта
+        if bus:
+            await bus.close()
+        await executor.close(timeout=settings.WEBHOOK_DRAIN_TIMEOUT)
+        if bus:
+            # Подтверждаем обработанное, партиции забирают другие процессы
+            try:
+                await bus.flush()
+            except Exception as e:
+                logger.warning(f"Ошибка при остановке шины апдейтов: {e}")
         try:
             # Не обязательно, но аккуратно пробуем убрать вебхук
             await bot.delete_webhook(drop_pending_updates=False)
@@ -150,3 +182,4 @@ app = FastAPI(
 app.include_router(health.router, tags=["Health"])
 app.include_router(tg.router, tags=["Telegram"])
 app.include_router(yookassa.router, tags=["Payments"])
+app.include_router(results.router, tags=["Results"])
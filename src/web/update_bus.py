@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import math
+import os
+import socket
+import time
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+from aiogram.types import Update
+from src.core.config import settings
+from src.web.update_executor import UpdateExecutor, update_chat_key
+from src.web.update_decoding import decode_update
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "tg:updates:{partition}"
+LEASE_KEY = "tg:updates:lease:{partition}"
+CONSUMERS_KEY = "tg:updates:consumers"
+GROUP_NAME = "dispatchers"
+
+# Продлить/снять аренду, только если она наша
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def update_partition(update: Update) -> int:
+    """Партиция апдейта: все апдейты одного чата - в одном stream"""
+    # crc32, а не hash(): hash строк различается между процессами
+    return zlib.crc32(str(update_chat_key(update)).encode()) % settings.UPDATE_STREAM_PARTITIONS
+
+
+class UpdateBus:
+    """
+    Шина апдейтов на Redis Streams (WEBHOOK_MODE=stream)
+    ✅ Webhook только дописывает апдейт в stream своей партиции
+    ✅ Процессы gunicorn - группа потребителей: каждая партиция арендована одним процессом,
+       поэтому порядок внутри чата сохраняется, а партиции делятся поровну между живыми
+    ✅ Апдейт подтверждается (XACK) после обработки - упавший процесс отдает партицию,
+       новый владелец забирает неподтвержденные апдейты (XAUTOCLAIM) и обрабатывает заново
+    ✅ Очередь видна снаружи: lag + pending группы (/metrics)
+    """
+
+    def __init__(self, redis: aioredis.Redis, executor: UpdateExecutor):
+        self.redis = redis
+        self.executor = executor
+        self.partitions = settings.UPDATE_STREAM_PARTITIONS
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_ms = settings.UPDATE_STREAM_LEASE * 1000
+        self.owned: Set[int] = set()
+        self._in_flight: Dict[int, int] = {}
+        self._acks: Dict[int, List[bytes]] = {}
+        # Не принятые executor (переполнен) - отправляются раньше новых
+        self._deferred: List[Tuple[int, bytes, Update]] = []
+        self._task = None
+        self._renew = self.redis.register_script(RENEW_SCRIPT)
+        self._release = self.redis.register_script(RELEASE_SCRIPT)
+
+    async def publish(self, update: Update, raw: bytes):
+        """Дописать апдейт в stream (вызывает webhook)"""
+        await self.redis.xadd(
+            STREAM_KEY.format(partition=update_partition(update)),
+            {"update": raw},
+            maxlen=settings.UPDATE_STREAM_MAXLEN,
+            approximate=True,
+        )
+
+    async def backlog(self) -> int:
+        """Апдейты, еще не обработанные группой (не прочитанные + не подтвержденные)"""
+        total = 0
+        for partition in range(self.partitions):
+            try:
+                groups = await self.redis.xinfo_groups(STREAM_KEY.format(partition=partition))
+            except ResponseError:
+                # Stream еще не создан
+                continue
+            for group in groups:
+                if group.get("name") in (GROUP_NAME, GROUP_NAME.encode()):
+                    total += (group.get("lag") or 0) + (group.get("pending") or 0)
+        return total
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Update bus consumer started: {self.consumer}, partitions={self.partitions}")
+
+    async def close(self):
+        """Остановить чтение; вызывать до executor.close(), затем flush()"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def flush(self):
+        """Подтвердить обработанное и отдать партиции другим процессам"""
+        await self._ack()
+        for partition in list(self.owned):
+            await self._release_partition(partition)
+        await self.redis.zrem(CONSUMERS_KEY, self.consumer)
+
+    async def _ensure_groups(self):
+        for partition in range(self.partitions):
+            try:
+                await self.redis.xgroup_create(STREAM_KEY.format(partition=partition), GROUP_NAME, id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    async def _run(self):
+        await self._ensure_groups()
+        next_rebalance = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_rebalance:
+                    await self._rebalance()
+                    next_rebalance = time.monotonic() + self.lease_ms / 3000
+
+                await self._ack()
+                await self._read()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Update bus error: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _rebalance(self):
+        """Продлить свои аренды и довести их число до справедливой доли"""
+        now = time.time()
+        await self.redis.zadd(CONSUMERS_KEY, {self.consumer: now})
+        await self.redis.zremrangebyscore(CONSUMERS_KEY, 0, now - self.lease_ms / 1000)
+        alive = max(await self.redis.zcard(CONSUMERS_KEY), 1)
+        share = math.ceil(self.partitions / alive)
+
+        for partition in list(self.owned):
+            if not await self._renew(keys=[LEASE_KEY.format(partition=partition)], args=[self.consumer, self.lease_ms]):
+                logger.warning(f"Lost lease of update partition {partition}")
+                self.owned.discard(partition)
+
+        # Лишние партиции отдаем только без апдейтов в обработке - иначе нарушится порядок
+        for partition in sorted(self.owned, reverse=True):
+            if len(self.owned) <= share:
+                break
+            deferred = any(item[0] == partition for item in self._deferred)
+            if not self._in_flight.get(partition) and not deferred:
+                await self._ack()
+                await self._release_partition(partition)
+
+        for partition in range(self.partitions):
+            if len(self.owned) >= share:
+                break
+            if partition in self.owned:
+                continue
+            acquired = await self.redis.set(
+                LEASE_KEY.format(partition=partition), self.consumer, nx=True, px=self.lease_ms
+            )
+            if acquired:
+                self.owned.add(partition)
+                await self._claim_pending(partition)
+
+    async def _release_partition(self, partition: int):
+        self.owned.discard(partition)
+        await self._release(keys=[LEASE_KEY.format(partition=partition)], args=[self.consumer])
+
+    async def _claim_pending(self, partition: int):
+        """Забрать неподтвержденные апдейты прежнего владельца партиции"""
+        stream = STREAM_KEY.format(partition=partition)
+        cursor = "0-0"
+        claimed = 0
+        while True:
+            response = await self.redis.xautoclaim(stream, GROUP_NAME, self.consumer, min_idle_time=0, start_id=cursor, count=100)
+            cursor, entries = response[0], response[1]
+            for entry_id, fields in entries:
+                self._submit(partition, entry_id, self._decode(partition, entry_id, fields))
+                claimed += 1
+            if cursor in (b"0-0", "0-0"):
+                break
+        if claimed:
+            logger.info(f"Replaying {claimed} unacknowledged updates of partition {partition}")
+
+    async def _read(self):
+        if self._deferred:
+            deferred, self._deferred = self._deferred, []
+            for partition, entry_id, update in deferred:
+                self._submit(partition, entry_id, update)
+            if self._deferred:
+                await asyncio.sleep(0.1)
+                return
+
+        free = self.executor.max_pending - self.executor.pending
+        if not self.owned or free <= 0:
+            await asyncio.sleep(0.1 if self.owned else 1)
+            return
+
+        streams = {STREAM_KEY.format(partition=partition): ">" for partition in self.owned}
+        response = await self.redis.xreadgroup(
+            GROUP_NAME, self.consumer, streams,
+            count=min(free, settings.UPDATE_STREAM_BATCH),
+            block=1000,
+        )
+        for stream, entries in response or []:
+            partition = int((stream.decode() if isinstance(stream, bytes) else stream).rsplit(":", 1)[1])
+            for entry_id, fields in entries:
+                self._submit(partition, entry_id, self._decode(partition, entry_id, fields))
+
+    def _decode(self, partition: int, entry_id: bytes, fields: dict) -> Optional[Update]:
+        raw = fields.get(b"update") or fields.get("update")
+        try:
+            return decode_update(raw)
+        except Exception as e:
+            # Битый апдейт не обработать и повторно - подтверждаем сразу
+            logger.error(f"Invalid update in stream {entry_id}: {e}")
+            self._acks.setdefault(partition, []).append(entry_id)
+            return None
+
+    def _submit(self, partition: int, entry_id: bytes, update: Optional[Update]):
+        if update is None:
+            return
+
+        def done():
+            self._in_flight[partition] -= 1
+            self._acks.setdefault(partition, []).append(entry_id)
+
+        # За отложенными апдейтами - в хвост, чтобы не обогнать их
+        if not self._deferred and self.executor.submit(update, on_done=done):
+            self._in_flight[partition] = self._in_flight.get(partition, 0) + 1
+        else:
+            self._deferred.append((partition, entry_id, update))
+
+    async def _ack(self):
+        acks, self._acks = self._acks, {}
+        for partition, entry_ids in acks.items():
+            if entry_ids:
+                await self.redis.xack(STREAM_KEY.format(partition=partition), GROUP_NAME, *entry_ids)
@@ -0,0 +1,43 @@
+import json
+import logging
+from typing import Any, Collection, Optional
+from aiogram.types import Update
+
+try:
+    import orjson
+except ImportError:  # orjson не установлен - стандартный json
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def loads(raw: bytes) -> Any:
+    """Разобрать JSON (orjson, если установлен)"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def decode_update(raw: bytes, update_types: Optional[Collection[str]] = None) -> Optional[Update]:
+    """
+    Апдейт из тела webhook
+    ✅ Один разбор JSON и одна валидация модели (без Update(**dict))
+    ✅ Типы апдейтов, на которые нет хендлеров, отбрасываются до валидации
+
+    Args:
+        update_types: типы, которые обрабатывает диспетчер (None - все)
+
+    Returns:
+        None - апдейт не нужен диспетчеру
+
+    Raises:
+        ValueError: тело не JSON или не Update
+    """
+    data = loads(raw)
+    if not isinstance(data, dict):
+        raise ValueError("Update payload is not an object")
+
+    if update_types is not None and not any(key in update_types for key in data if key != "update_id"):
+        return None
+
+    return Update.model_validate(data)
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple, Union
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_key(update: Update) -> Union[int, str]:
+    """
+    Ключ порядка обработки: чат (или пользователь) апдейта
+    ✅ Сообщения и нажатия кнопок одного чата - строго по очереди
+    ✅ Апдейты без чата и пользователя упорядочивать не нужно
+    ✅ Фото альбома (media_group_id) - без очереди: ведущий апдейт ждет остальные
+       (AlbumCollector), и они не должны стоять за ним
+    """
+    try:
+        event = update.event
+    except Exception:
+        return f"update:{update.update_id}"
+
+    if getattr(event, "media_group_id", None):
+        return f"update:{update.update_id}"
+
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        # callback_query: чат сообщения с кнопкой
+        message = getattr(event, "message", None)
+        chat = getattr(message, "chat", None)
+    if chat is not None:
+        return chat.id
+
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    return f"update:{update.update_id}"
+
+
+def build_webhook_reply(bot: Bot, method: TelegramMethod) -> Optional[Dict[str, str]]:
+    """
+    Поля ответа webhook с вызовом метода Bot API
+
+    Returns:
+        None - метод с файлами, его нужно отправить обычным запросом
+    """
+    fields = {"method": method.__api_method__}
+    files: Dict[str, Any] = {}
+    for key, value in method.model_dump(warnings=False).items():
+        # Как aiogram при обычном запросе: Default -> настройки бота, объекты -> JSON
+        value = bot.session.prepare_value(value, bot=bot, files=files)
+        if not value:
+            continue
+        fields[key] = value
+
+    if files:
+        return None
+    return fields
+
+
+class UpdateExecutor:
+    """
+    Фоновая обработка апдейтов webhook
+    ✅ HTTP-ответ Telegram не ждет хендлеров (БД, ЮKassa, ARQ)
+    ✅ Апдейты одного чата - по порядку, разных чатов - параллельно (WEBHOOK_CONCURRENCY)
+    ✅ Очередь ограничена WEBHOOK_QUEUE_SIZE: сверх нее submit() отказывает, Telegram повторит позже
+    ✅ Хендлер вернул метод (return message.answer(...)) - он уходит в ответе webhook,
+       если webhook еще ждет (reply), иначе отправляется обычным запросом
+    ✅ Ошибки такой отправки (бот заблокирован и т.п.) - только в лог, как в safe_send_text
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher, concurrency: int, max_pending: int):
+        self.bot = bot
+        self.dp = dp
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.pending = 0
+        self.processed = 0
+        self._chats: Dict[Union[int, str], Deque[Tuple[Update, Optional[Callable[[], None]], Optional[asyncio.Future]]]] = {}
+        self._scheduled: Set[Union[int, str]] = set()
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closed = False
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        logger.info(f"Update executor started: concurrency={self.concurrency}, queue={self.max_pending}")
+
+    def submit(
+        self,
+        update: Update,
+        on_done: Optional[Callable[[], None]] = None,
+        reply: Optional[asyncio.Future] = None,
+    ) -> bool:
+        """
+        Поставить апдейт в обработку
+
+        Args:
+            on_done: вызывается после обработки (в том числе с ошибкой)
+            reply: получит поля ответа webhook (build_webhook_reply) или None
+
+        Returns:
+            False - очередь переполнена или executor остановлен (апдейт не принят)
+        """
+        if self._closed or self.pending >= self.max_pending:
+            return False
+
+        key = update_chat_key(update)
+        self._chats.setdefault(key, deque()).append((update, on_done, reply))
+        self.pending += 1
+        self._idle.clear()
+
+        # Чат уже в очереди или обрабатывается - его воркер заберет апдейт сам
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            self._ready.put_nowait(key)
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            updates = self._chats[key]
+            update, on_done, reply = updates.popleft()
+            try:
+                result = await self.dp.feed_update(self.bot, update)
+                await self._reply(result, reply)
+            except Exception as e:
+                logger.error(f"Update {update.update_id} processing error: {e}", exc_info=True)
+            finally:
+                if reply is not None and not reply.done():
+                    reply.set_result(None)
+                self.pending -= 1
+                self.processed += 1
+                if on_done:
+                    on_done()
+                if updates:
+                    # По одному апдейту за раз: занятый чат не блокирует остальных
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                    self._scheduled.discard(key)
+                if not self.pending:
+                    self._idle.set()
+
+    async def _reply(self, result: Any, reply: Optional[asyncio.Future]):
+        """Отправить метод, который вернул хендлер"""
+        if not isinstance(result, TelegramMethod):
+            return
+
+        # Webhook еще ждет (не истек WEBHOOK_REPLY_TIMEOUT) - отвечаем в его HTTP-ответе
+        if reply is not None and not reply.done():
+            fields = build_webhook_reply(self.bot, result)
+            if fields:
+                reply.set_result(fields)
+                return
+
+        try:
+            await self.bot(result)
+        except TelegramForbiddenError:
+            logger.warning(f"Bot blocked by user: method={result.__api_method__}")
+        except TelegramAPIError as e:
+            logger.error(f"Telegram API error: method={result.__api_method__}, error={e}")
+
+    async def close(self, timeout: float):
+        """Перестать принимать апдейты и дообработать принятые (не дольше timeout)"""
+        self._closed = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update executor stopped with {self.pending} unprocessed updates")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetUnavailable(Exception):
+    """Не дождались свободного бюджета диска"""
+
+
+class Reservation:
+    """Зарезервированные задачей байты диска"""
+
+    def __init__(self, budget: "ByteBudget", disk: int):
+        self._budget = budget
+        self.disk = disk
+
+    async def release(self):
+        """Вернуть весь резерв"""
+        disk, self.disk = self.disk, 0
+        await self._budget._release(disk)
+
+
+class ByteBudget:
+    """
+    Бюджет байт диска воркера (вход + ожидаемый выход)
+    ✅ Задача резервирует нужный объем до скачивания, а не после
+    ✅ Нет бюджета - ждем, а не падаем без места
+    ✅ Маленькие клипы идут параллельно, огромный файл - в одиночку
+    ✅ Память не считаем: вход и результат идут потоком на диск, память задачи не зависит от размера
+    """
+
+    def __init__(self, disk_limit: int):
+        self.disk_limit = disk_limit
+        self.disk_used = 0
+        self._condition = asyncio.Condition()
+
+    def _fits(self, disk: int) -> bool:
+        # Задача больше всего бюджета пускается только в одиночку
+        if self.disk_used == 0:
+            return True
+        return self.disk_used + disk <= self.disk_limit
+
+    async def acquire(
+        self,
+        disk: int,
+        timeout: float,
+        on_wait: Optional[Callable[[], Awaitable]] = None
+    ) -> Reservation:
+        """
+        Зарезервировать байты, дождавшись свободного бюджета
+
+        Raises:
+            BudgetUnavailable: бюджет не освободился за timeout секунд
+        """
+        async with self._condition:
+            if self._fits(disk):
+                self.disk_used += disk
+                return Reservation(self, disk)
+
+        logger.info(
+            f"Waiting for byte budget: need disk={disk >> 20}MB, used disk={self.disk_used >> 20}MB"
+        )
+        if on_wait:
+            await on_wait()
+
+        async with self._condition:
+            try:
+                await asyncio.wait_for(
+                    self._condition.wait_for(lambda: self._fits(disk)),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                raise BudgetUnavailable(
+                    f"Byte budget unavailable after {timeout}s: need disk={disk >> 20}MB"
+                )
+            self.disk_used += disk
+
+        return Reservation(self, disk)
+
+    async def _release(self, disk: int):
+        async with self._condition:
+            self.disk_used = max(0, self.disk_used - disk)
+            self._condition.notify_all()
+
+
+video_budget = ByteBudget(disk_limit=settings.VIDEO_DISK_BUDGET)
@@ -0,0 +1,221 @@
+import logging
+from typing import Optional
+from aiogram import Bot
+from aiogram.types import Message
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.db.models import Task, TaskStatus, TaskType, User
+from src.db.sql import seconds_ago
+from src.core.config import settings
+from src.services.users import UserService
+from src.services.telegram_safe import safe_send_photo, safe_send_video, safe_send_text
+
+logger = logging.getLogger(__name__)
+
+# Как часто привязанная задача проверяет основную (секунды)
+PARENT_POLL_DEFER = 30
+
+
+def result_file_id(message: Optional[Message]) -> Optional[str]:
+    """Telegram file_id отправленного результата (для повторной отправки)"""
+    if not message:
+        return None
+    if message.video:
+        return message.video.file_id
+    if message.photo:
+        return message.photo[-1].file_id
+    if message.document:
+        return message.document.file_id
+    return None
+
+
+async def _claim(session: AsyncSession, task_id: int) -> bool:
+    """Атомарно забрать задачу PENDING -> PROCESSING (защита от двойной доставки)"""
+    result = await session.execute(
+        update(Task)
+        .where(Task.id == task_id, Task.status == TaskStatus.PENDING)
+        .values(status=TaskStatus.PROCESSING)
+    )
+    await session.commit()
+    return result.rowcount == 1
+
+
+async def claim_task(session: AsyncSession, task_id: int) -> bool:
+    """
+    Забрать задачу в работу перед запуском воркера
+    ✅ PENDING -> PROCESSING
+    ✅ PROCESSING без heartbeat дольше STUCK_TASK_TIMEOUT (прошлый запуск упал) - тоже
+    ✅ Живая (PROCESSING с heartbeat), COMPLETED и FAILED не забираются: повтор ARQ
+       после requeue reaper'а не выполнит и не вернет генерации второй раз
+    """
+    result = await session.execute(
+        update(Task)
+        .where(
+            Task.id == task_id,
+            or_(
+                Task.status == TaskStatus.PENDING,
+                and_(
+                    Task.status == TaskStatus.PROCESSING,
+                    Task.updated_at < seconds_ago(settings.STUCK_TASK_TIMEOUT)
+                )
+            )
+        )
+        .values(status=TaskStatus.PROCESSING, updated_at=func.now())
+    )
+    await session.commit()
+    if result.rowcount != 1:
+        logger.warning(f"Task is finished or running elsewhere, skipping: task={task_id}")
+        return False
+    return True
+
+
+async def _send_result(bot: Bot, task: Task, user: User, file_id: str) -> Optional[Message]:
+    """Отправить уже готовый результат по file_id"""
+    if task.task_type == TaskType.VIDEO_ENHANCE:
+        return await safe_send_video(
+            bot=bot,
+            chat_id=user.telegram_id,
+            video=file_id,
+            caption=(
+                f"✅ <b>Видео готово!</b>\n\n"
+                f"💰 Списано: {int(task.cost)} ген.\n"
+                f"⚡ Баланс: {int(user.balance)} ген."
+            ),
+            parse_mode="HTML"
+        )
+
+    return await safe_send_photo(
+        bot=bot,
+        chat_id=user.telegram_id,
+        photo=file_id,
+        caption=(
+            f"✅ <b>Фото готово!</b>\n\n"
+            f"💰 Списано: {int(task.cost)} ген.\n"
+            f"⚡ Баланс: {int(user.balance)} ген."
+        ),
+        parse_mode="HTML"
+    )
+
+
+async def _deliver(bot: Bot, session: AsyncSession, task: Task, file_id: str) -> bool:
+    """Доставить результат привязанной задаче (после успешного _claim)"""
+    user = await session.get(User, task.user_id)
+    if not user:
+        return False
+
+    message = await _send_result(bot, task, user, file_id)
+    if not message:
+        # Не смогли отправить - возвращаем задачу в ожидание, повторит отложенная проверка
+        task.status = TaskStatus.PENDING
+        await session.commit()
+        return False
+
+    task.status = TaskStatus.COMPLETED
+    task.output_file_id = file_id
+    await session.commit()
+
+    logger.info(f"Coalesced task delivered: task={task.id}, parent={task.parent_task_id}")
+    return True
+
+
+async def deliver_to_attached(bot: Bot, session: AsyncSession, parent: Task):
+    """
+    Разослать готовый результат всем задачам, привязанным к parent
+    ✅ Один запуск Topaz - несколько доставок
+    """
+    if not parent.output_file_id:
+        return
+
+    result = await session.execute(
+        select(Task).where(
+            Task.parent_task_id == parent.id,
+            Task.status == TaskStatus.PENDING
+        )
+    )
+
+    for child in result.scalars().all():
+        try:
+            if await _claim(session, child.id):
+                await session.refresh(child)
+                await _deliver(bot, session, child, parent.output_file_id)
+        except Exception as e:
+            logger.error(f"Attached delivery error: task={child.id}, error={e}")
+
+
+async def handle_attached_task(
+    ctx: dict,
+    bot: Bot,
+    session: AsyncSession,
+    task: Task,
+    function_name: str,
+    queue_name: str,
+    *job_args
+) -> bool:
+    """
+    Обработка задачи, привязанной к такой же задаче другого пользователя
+
+    Returns:
+        True - задача обработана (доставлена, отменена или отложена),
+        False - основная задача не удалась, обрабатываем самостоятельно
+    """
+    if task.status != TaskStatus.PENDING:
+        # Уже доставлена из основной задачи
+        return True
+
+    parent = await session.get(Task, task.parent_task_id) if task.parent_task_id else None
+
+    if parent and parent.status == TaskStatus.COMPLETED and parent.output_file_id:
+        if await _claim(session, task.id):
+            await session.refresh(task)
+            if not await _deliver(bot, session, task, parent.output_file_id):
+                await ctx["redis"].enqueue_job(
+                    function_name, *job_args,
+                    _queue_name=queue_name,
+                    _defer_by=PARENT_POLL_DEFER
+                )
+        return True
+
+    if parent and parent.status in (TaskStatus.PENDING, TaskStatus.PROCESSING):
+        # Основная задача еще в работе - проверим позже, не занимая слот воркера
+        await ctx["redis"].enqueue_job(
+            function_name, *job_args,
+            _queue_name=queue_name,
+            _defer_by=PARENT_POLL_DEFER
+        )
+        return True
+
+    # Основная задача упала или удалена - запускаем свою обработку
+    logger.info(f"Parent task unavailable, processing independently: task={task.id}, parent={task.parent_task_id}")
+    task.parent_task_id = None
+    await session.commit()
+    return False
+
+
+async def fail_attached_task(bot: Bot, session: AsyncSession, task: Task, user: User, reason: str):
+    """Отменить привязанную задачу с возвратом генераций"""
+    if not await _claim(session, task.id):
+        return
+
+    await session.refresh(task)
+    task.status = TaskStatus.FAILED
+    task.error_message = reason
+    await UserService.add_credits(
+        session=session,
+        user=user,
+        amount=task.cost,
+        description=f"Возврат: {reason}",
+        reference_type="refund",
+        reference_id=task.id
+    )
+    await session.commit()
+
+    await safe_send_text(
+        bot=bot,
+        chat_id=user.telegram_id,
+        text=(
+            f"❌ <b>{reason}</b>\n\n"
+            f"💰 Возврат: {int(task.cost)} ген.\n"
+            f"⚡ Баланс: {int(user.balance)} ген."
+        ),
+        parse_mode="HTML"
+    )
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import time
+from typing import Dict
+from arq import Worker, create_pool
+from src.core.config import settings
+from src.workers.settings import get_redis_settings
+from src.workers.drain import install_drain_handlers
+from src.workers import image_worker, video_worker
+
+logger = logging.getLogger(__name__)
+
+# Очереди комбинированного воркера: имя -> WorkerSettings
+QUEUES = {
+    "image": image_worker.WorkerSettings,
+    "video": video_worker.WorkerSettings,
+}
+
+
+def allocate_slots(total: int, weights: Dict[str, float], demand: Dict[str, int], minimum: int = 1) -> Dict[str, int]:
+    """
+    Распределить слоты между очередями
+    ✅ Каждой очереди не меньше minimum - ни одна не простаивает полностью
+    ✅ Остальное - пропорционально вес * спрос (очередь + в работе)
+    ✅ Спроса нет - по весам
+    """
+    slots = {name: minimum for name in weights}
+    free = total - minimum * len(weights)
+    if free <= 0:
+        return slots
+
+    scores = {name: weights[name] * demand.get(name, 0) for name in weights}
+    if not any(scores.values()):
+        scores = dict(weights)
+    total_score = sum(scores.values()) or 1
+
+    shares = {name: free * score / total_score for name, score in scores.items()}
+    for name, share in shares.items():
+        slots[name] += int(share)
+
+    # Остаток от округления - очередям с наибольшей дробной частью
+    rest = total - sum(slots.values())
+    for name in sorted(shares, key=lambda name: shares[name] - int(shares[name]), reverse=True)[:rest]:
+        slots[name] += 1
+    return slots
+
+
+def _create_worker(worker_settings, max_jobs: int) -> Worker:
+    return Worker(
+        functions=worker_settings.functions,
+        cron_jobs=getattr(worker_settings, "cron_jobs", None),
+        redis_settings=get_redis_settings(),
+        # Семафор ARQ создается по max_jobs - берем с запасом, реальный лимит задает ребалансировка
+        max_jobs=max_jobs,
+        job_timeout=worker_settings.job_timeout,
+        keep_result=worker_settings.keep_result,
+        max_tries=worker_settings.max_tries,
+        on_startup=worker_settings.on_startup,
+        on_shutdown=worker_settings.on_shutdown,
+        queue_name=worker_settings.queue_name,
+        handle_signals=False,
+        job_completion_wait=settings.WORKER_DRAIN_TIMEOUT,
+    )
+
+
+async def _rebalance(workers: Dict[str, Worker], weights: Dict[str, float]):
+    """Периодически перераспределять слоты по глубине очередей"""
+    pool = await create_pool(get_redis_settings())
+    try:
+        while True:
+            await asyncio.sleep(settings.COMBINED_REBALANCE_INTERVAL)
+            try:
+                now = int(time.time() * 1000)
+                demand = {}
+                for name, worker in workers.items():
+                    # Только готовые к запуску задачи (отложенные повторы не в счет)
+                    ready = await pool.zcount(worker.queue_name, "-inf", now)
+                    demand[name] = ready + worker.job_counter
+
+                slots = allocate_slots(settings.COMBINED_WORKER_SLOTS, weights, demand)
+                if any(workers[name].max_jobs != count for name, count in slots.items()):
+                    logger.info(f"Rebalanced worker slots: {slots}, demand={demand}")
+                # ARQ сверяет job_counter с max_jobs перед каждой выборкой задач
+                for name, count in slots.items():
+                    workers[name].max_jobs = count
+            except Exception as e:
+                logger.error(f"Rebalance error: {e}")
+    finally:
+        await pool.close()
+
+
+async def run_combined_worker():
+    """
+    Один процесс на обе очереди (image + video)
+    ✅ Общий пул слотов COMBINED_WORKER_SLOTS, доли по весам и спросу
+    ✅ Слоты перераспределяются каждые COMBINED_REBALANCE_INTERVAL секунд
+    ✅ Текущие задачи не прерываются - лимит влияет только на выборку новых
+    """
+    weights = {
+        "image": settings.COMBINED_IMAGE_WEIGHT,
+        "video": settings.COMBINED_VIDEO_WEIGHT,
+    }
+    total = settings.COMBINED_WORKER_SLOTS
+    workers = {name: _create_worker(worker_settings, total) for name, worker_settings in QUEUES.items()}
+
+    for name, count in allocate_slots(total, weights, {}).items():
+        workers[name].max_jobs = count
+
+    install_drain_handlers(*workers.values())
+
+    for worker in workers.values():
+        # main_task нужен ARQ, чтобы остановить цикл воркера по сигналу
+        worker.main_task = asyncio.ensure_future(worker.main())
+
+    rebalancer = asyncio.create_task(_rebalance(workers, weights))
+    try:
+        # Обе очереди дожидаются своих задач при остановке
+        await asyncio.gather(*(worker.main_task for worker in workers.values()), return_exceptions=True)
+    finally:
+        rebalancer.cancel()
+        for worker in workers.values():
+            await worker.close()
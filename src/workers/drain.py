@@ -0,0 +1,45 @@
+import asyncio
+import logging
+import signal
+from arq import Worker
+
+logger = logging.getLogger(__name__)
+
+_draining = False
+
+
+def is_draining() -> bool:
+    """Воркер останавливается - новые задачи не начинаем, текущие передаем"""
+    return _draining
+
+
+def install_drain_handlers(*workers: Worker):
+    """
+    Обработка SIGTERM/SIGINT: мягкая остановка воркера
+    ✅ Воркер перестает забирать задачи из очереди
+    ✅ Задачи видят is_draining() и передают работу другому воркеру
+    ✅ Ждем завершения до job_completion_wait, затем останавливаемся
+    ✅ Повторный сигнал - немедленная остановка
+
+    Worker должен быть создан с handle_signals=False
+    (комбинированный воркер передает сразу все свои Worker)
+    """
+    loop = asyncio.get_running_loop()
+
+    def _on_signal(signum: int):
+        global _draining
+        sig = signal.Signals(signum)
+
+        if _draining:
+            logger.warning(f"Received {sig.name} during drain, stopping immediately")
+            for worker in workers:
+                worker.handle_sig(signum)
+            return
+
+        logger.warning(f"Received {sig.name}, draining: in-flight jobs will be handed off")
+        _draining = True
+        for worker in workers:
+            worker.handle_sig_wait_for_completion(signum)
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, _on_signal, signum)
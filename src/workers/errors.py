@@ -0,0 +1,86 @@
+import asyncio
+import errno
+import logging
+from enum import Enum
+import aiohttp
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from src.core.config import settings
+from src.vendors.topaz import TopazAPIError
+from src.workers.budget import BudgetUnavailable
+from src.utils.disk_ledger import InsufficientDiskSpace
+
+logger = logging.getLogger(__name__)
+
+
+class ErrorKind(str, Enum):
+    TRANSIENT = "transient"  # Сеть, таймауты, обрыв соединения с БД - повторить скоро
+    UPSTREAM_OVERLOADED = "upstream_overloaded"  # Topaz/сервер перегружен - повторить позже
+    USER_INPUT = "user_input"  # Проблема во входных данных или отмена - повтор бесполезен
+    FATAL = "fatal"  # Ошибка конфигурации или баг - нужен разбор админом
+
+
+RETRYABLE_KINDS = {ErrorKind.TRANSIENT, ErrorKind.UPSTREAM_OVERLOADED}
+
+# Эти ошибки после исчерпания повторов попадают в dead-letter очередь
+DEAD_LETTER_KINDS = {ErrorKind.TRANSIENT, ErrorKind.UPSTREAM_OVERLOADED, ErrorKind.FATAL}
+
+
+def classify_error(error: BaseException) -> ErrorKind:
+    """Классификация исключения воркера"""
+    if isinstance(error, TopazAPIError):
+        status = error.status_code
+        if status in (429, 503):
+            return ErrorKind.UPSTREAM_OVERLOADED
+        if status is not None and status >= 500:
+            return ErrorKind.TRANSIENT
+        if status in (401, 403):
+            return ErrorKind.FATAL
+        if status is not None:
+            return ErrorKind.USER_INPUT
+        # Сетевые ошибки клиент оборачивает в TopazAPIError без статуса
+        if isinstance(error.__context__, (aiohttp.ClientError, asyncio.TimeoutError)):
+            return ErrorKind.TRANSIENT
+        # Отмена, слишком большой файл, ошибка обработки на стороне Topaz
+        return ErrorKind.USER_INPUT
+
+    if isinstance(error, (BudgetUnavailable, InsufficientDiskSpace)):
+        return ErrorKind.UPSTREAM_OVERLOADED
+
+    if isinstance(error, TelegramRetryAfter):
+        return ErrorKind.UPSTREAM_OVERLOADED
+    if isinstance(error, (TelegramNetworkError, TelegramServerError)):
+        return ErrorKind.TRANSIENT
+    if isinstance(error, (TelegramBadRequest, TelegramForbiddenError)):
+        return ErrorKind.USER_INPUT
+
+    if isinstance(error, (OperationalError, InterfaceError)):
+        return ErrorKind.TRANSIENT
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return ErrorKind.TRANSIENT
+
+    if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError)):
+        return ErrorKind.TRANSIENT
+    if isinstance(error, OSError) and error.errno == errno.ENOSPC:
+        return ErrorKind.UPSTREAM_OVERLOADED
+
+    return ErrorKind.FATAL
+
+
+def should_retry(ctx: dict, kind: ErrorKind) -> bool:
+    """Повторять ли задачу через ARQ Retry"""
+    return kind in RETRYABLE_KINDS and ctx.get("job_try", 1) < settings.WORKER_MAX_TRIES
+
+
+def retry_delay(ctx: dict, kind: ErrorKind) -> int:
+    """Задержка перед повтором (секунды), растет с номером попытки"""
+    job_try = ctx.get("job_try", 1)
+    if kind == ErrorKind.UPSTREAM_OVERLOADED:
+        return 60 * job_try
+    return 10 * 2 ** (job_try - 1)
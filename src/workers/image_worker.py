@@ -1,15 +1,27 @@
+import asyncio
 import logging
 import json
+from typing import Dict, List, Optional, Tuple
 from aiogram import Bot
-from aiogram.types import BufferedInputFile
+from src.services.bot_api import create_bot
+from arq import Retry
+from aiogram.types import BufferedInputFile, InputMediaPhoto
 from src.db.engine import async_session_maker
 from src.db.models import Task, TaskStatus, User
 from src.vendors.topaz import topaz_client, TopazAPIError
 from src.services.users import UserService
 from src.core.config import settings
 from src.workers.settings import get_redis_settings
-from src.services.telegram_safe import safe_send_photo, safe_send_text
+from src.services.telegram_safe import safe_send_photo, safe_send_text, safe_send_media_group
+from src.services.result_cache import result_cache, content_hasher
 from src.utils.file_manager import disk_manager, DiskManager
+from src.utils.disk_ledger import disk_ledger
+from src.utils.temp_janitor import temp_janitor
+from src.services.estimator import processing_estimator, StageTimer
+from src.workers.coalescing import claim_task, handle_attached_task, deliver_to_attached, result_file_id
+from src.workers.errors import ErrorKind, DEAD_LETTER_KINDS, classify_error, should_retry, retry_delay
+from src.services.dead_letters import dead_letters
+from src.workers.video_worker import process_video_preview
 
 logger = logging.getLogger(__name__)
 
@@ -35,11 +47,130 @@ async def _safe_refund(session, user, task, reason):
         logger.error(f"Refund error: task={task.id}, error={e}")
 
 
+async def _call_topaz(image_path: str, params: dict) -> bytes:
+    """Запрос в Topaz по endpoint из параметров задачи (фото отправляется потоком из файла)"""
+    endpoint = params.get("endpoint", "enhance")
+
+    with open(image_path, "rb") as image_file:
+        if endpoint == "enhance":
+            return await topaz_client.enhance_image(image_file, **params)
+        if endpoint == "sharpen":
+            return await topaz_client.sharpen_image(image_file, **params)
+        if endpoint == "denoise":
+            return await topaz_client.denoise_image(image_file, **params)
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+def _cache_parameters(params: dict) -> Optional[str]:
+    """Параметры фото в виде, как они хранятся в задаче (ключ кэша результатов)"""
+    return json.dumps(params, sort_keys=True) if params else None
+
+
+async def _handle_error(
+    ctx: dict,
+    bot: Bot,
+    session,
+    task: Optional[Task],
+    user: Optional[User],
+    error: Exception,
+    function_name: str,
+    job_args: list
+):
+    """
+    Ошибка задачи
+    ✅ Временная - ARQ Retry без возврата генераций
+    ✅ Окончательная - FAILED + возврат, фатальные и исчерпавшие повторы - в DLQ
+    """
+    kind = classify_error(error)
+    retry = should_retry(ctx, kind)
+    task_id = job_args[0]
+    logger.error(
+        f"Image task error: task={task_id}, kind={kind.value}, "
+        f"try={ctx.get('job_try', 1)}, retry={retry}, error={error}",
+        exc_info=kind == ErrorKind.FATAL
+    )
+
+    if task is None or user is None:
+        if retry:
+            raise Retry(defer=retry_delay(ctx, kind)) from error
+        return
+
+    try:
+        await session.rollback()
+        await session.refresh(task)
+        await session.refresh(user)
+    except Exception as db_error:
+        logger.error(f"Session recovery error: task={task_id}, error={db_error}")
+        if retry:
+            raise Retry(defer=retry_delay(ctx, kind)) from error
+        return
+
+    if retry:
+        # Временная ошибка - повтор через ARQ, генерации не возвращаем
+        if task.status == TaskStatus.PROCESSING:
+            task.status = TaskStatus.PENDING
+            await session.commit()
+        raise Retry(defer=retry_delay(ctx, kind)) from error
+
+    # Окончательная ошибка - FAILED + возврат генераций
+    task.status = TaskStatus.FAILED
+    task.error_message = f"{kind.value}: {error}"[:1000]
+    await session.flush()
+    await session.commit()
+
+    user_msg = error.user_message if isinstance(error, TopazAPIError) else "Произошла ошибка обработки"
+    await _safe_refund(session, user, task, user_msg)
+
+    if kind in DEAD_LETTER_KINDS:
+        await dead_letters.push(
+            task_id=task_id,
+            function=function_name,
+            queue_name=WorkerSettings.queue_name,
+            args=job_args,
+            error=str(error),
+            kind=kind.value,
+            tries=ctx.get("job_try", 1)
+        )
+
+    await safe_send_text(
+        bot=bot,
+        chat_id=user.telegram_id,
+        text=(
+            f"❌ <b>{user_msg}</b>\n\n"
+            f"💰 Возврат: {int(task.cost)} ген.\n"
+            f"⚡ Баланс: {int(user.balance)} ген."
+        ),
+        parse_mode="HTML"
+    )
+
+
 async def process_image_task(ctx: dict, task_id: int, user_telegram_id: int, image_file_id: str):
-    bot = Bot(token=settings.BOT_TOKEN)
+    bot = create_bot()
+    timer = StageTimer()
+
+    task = user = None
+    temp_input = None
+    disk_reservation = None
 
     async with async_session_maker() as session:
         try:
+            task = await session.get(Task, task_id)
+            if not task:
+                return
+            user = await session.get(User, task.user_id)
+            if not user:
+                return
+            
+            # Такая же задача уже выполняется - ждем ее результат
+            if task.parent_task_id:
+                handled = await handle_attached_task(
+                    ctx, bot, session, task,
+                    "process_image_task", WorkerSettings.queue_name,
+                    task_id, user_telegram_id, image_file_id
+                )
+                if handled:
+                    return
+            
             # Проверка диска
             if not DiskManager.check_disk_space():
                 await safe_send_text(
@@ -48,43 +179,56 @@ async def process_image_task(ctx: dict, task_id: int, user_telegram_id: int, ima
                     "⚠️ Сервер перегружен, попробуйте через 5 минут"
                 )
                 return
-            
-            task = await session.get(Task, task_id)
-            if not task:
-                return
-            user = await session.get(User, task.user_id)
-            if not user:
-                return
 
-            task.status = TaskStatus.PROCESSING
-            await session.flush()
-            await session.commit()
+            if not await claim_task(session, task_id):
+                return
+            await session.refresh(task)
 
             file = await bot.get_file(image_file_id)
-            image_data = await bot.download_file(file.file_path)
-            image_bytes = image_data.read()
+            disk_reservation = await disk_ledger.reserve(file.file_size or 0, ttl=WorkerSettings.job_timeout)
+            hasher = content_hasher()
+            temp_input, input_size = await disk_manager.download_to_temp(
+                bot, file.file_path, ".jpg", hasher, reservation=disk_reservation
+            )
+            content_hash = hasher.hexdigest()
+            timer.lap("download")
+            
+            # ✅ Такое же фото уже обрабатывалось этой моделью - отправляем готовый результат
+            cached_file_id = await result_cache.get(content_hash, task.model, task.parameters)
+            if cached_file_id:
+                sent_message = await safe_send_photo(
+                    bot=bot,
+                    chat_id=user.telegram_id,
+                    photo=cached_file_id,
+                    caption=(
+                        f"✅ <b>Фото готово!</b>\n\n"
+                        f"💰 Списано: {int(task.cost)} ген.\n"
+                        f"⚡ Баланс: {int(user.balance)} ген."
+                    ),
+                    parse_mode="HTML"
+                )
+                if sent_message:
+                    task.status = TaskStatus.COMPLETED
+                    task.output_file_id = cached_file_id
+                    await session.commit()
+                    await deliver_to_attached(bot, session, task)
+                    logger.info(f"Image task served from cache: task={task_id}")
+                    return
 
             params = json.loads(task.parameters) if task.parameters else {}
-            endpoint = params.get("endpoint", "enhance")
 
-            logger.info(f"Processing image: task={task_id}, endpoint={endpoint}, model={task.model}")
+            logger.info(f"Processing image: task={task_id}, endpoint={params.get('endpoint', 'enhance')}, model={task.model}")
 
-            if endpoint == "enhance":
-                result = await topaz_client.enhance_image(image_bytes, **params)
-            elif endpoint == "sharpen":
-                result = await topaz_client.sharpen_image(image_bytes, **params)
-            elif endpoint == "denoise":
-                result = await topaz_client.denoise_image(image_bytes, **params)
-            else:
-                raise ValueError(f"Unknown endpoint: {endpoint}")
+            result = await _call_topaz(temp_input, params)
 
             logger.info(f"Image processed: task={task_id}, size={len(result)}")
+            timer.lap("processing")
 
             # 🔥 УБРАНО: deduct_credits - баланс УЖЕ списан при создании задачи!
             # Просто отправляем результат пользователю
 
             img_file = BufferedInputFile(result, filename="result.jpg")
-            await safe_send_photo(
+            sent_message = await safe_send_photo(
                 bot=bot,
                 chat_id=user.telegram_id,
                 photo=img_file,
@@ -97,75 +241,225 @@ async def process_image_task(ctx: dict, task_id: int, user_telegram_id: int, ima
             )
 
             task.status = TaskStatus.COMPLETED
+            task.output_file_id = result_file_id(sent_message)
             await session.flush()
             await session.commit()
+            timer.lap("delivery")
             
-            logger.info(f"Image task completed: task={task_id}")
-
-        except TopazAPIError as e:
-            logger.error(f"Topaz API error: {e}, task={task_id}")
+            # Доставляем результат задачам-дублям других пользователей
+            await deliver_to_attached(bot, session, task)
+            await result_cache.put(content_hash, task.model, task.parameters, task.output_file_id, len(result))
             
-            task.status = TaskStatus.FAILED
-            task.error_message = str(e)
-            await session.flush()
-            await session.commit()
+            await processing_estimator.record(session, task, timer, input_size=input_size)
+            
+            logger.info(f"Image task completed: task={task_id}, total={timer.total:.1f}s")
 
-            # 🔥 ВОЗВРАТ - баланс был списан при создании, теперь возвращаем
-            await _safe_refund(session, user, task, e.user_message or str(e))
+        except Exception as e:
+            await _handle_error(
+                ctx, bot, session, task, user, e,
+                "process_image_task", [task_id, user_telegram_id, image_file_id]
+            )
 
-            user_msg = e.user_message or "Ошибка обработки фото"
-            await safe_send_text(
-                bot=bot,
-                chat_id=user.telegram_id,
-                text=(
-                    f"❌ <b>{user_msg}</b>\n\n"
-                    f"💰 Возврат: {int(task.cost)} ген.\n"
-                    f"⚡ Баланс: {int(user.balance)} ген."
-                ),
-                parse_mode="HTML"
+        finally:
+            disk_manager.cleanup_file(temp_input)
+            await disk_ledger.release(disk_reservation)
+            await bot.session.close()
+
+
+async def process_image_batch(ctx: dict, task_id: int, user_telegram_id: int, image_file_ids: List[str]):
+    """
+    Альбом или сравнение моделей: одна задача и один резерв на все фото
+    ✅ Фото обрабатываются в Topaz параллельно (IMAGE_BATCH_CONCURRENCY)
+    ✅ Сравнение: одно фото (скачивается один раз) x несколько моделей
+    ✅ Результаты уходят одним sendMediaGroup
+    ✅ Не обработанные фото возвращаются генерациями, остальные доставляются
+    """
+    bot = create_bot()
+    task = user = None
+    temp_files: List[str] = []
+    disk_reservations: List[Optional[str]] = []
+
+    async with async_session_maker() as session:
+        try:
+            task = await session.get(Task, task_id)
+            if not task:
+                return
+            user = await session.get(User, task.user_id)
+            if not user:
+                return
+
+            if not await claim_task(session, task_id):
+                return
+            await session.refresh(task)
+
+            params = json.loads(task.parameters) if task.parameters else {}
+            params.pop("files", None)
+            compare = params.pop("compare", None)
+
+            # (file_id, модель, параметры, цена, подпись) на каждое фото результата
+            if compare:
+                items = [
+                    (image_file_ids[0], entry["model"], entry["parameters"], entry["cost"], entry["description"])
+                    for entry in compare
+                ]
+            else:
+                cost_per_photo = task.cost / len(image_file_ids)
+                items = [(file_id, task.model, params, cost_per_photo, None) for file_id in image_file_ids]
+
+            semaphore = asyncio.Semaphore(settings.IMAGE_BATCH_CONCURRENCY)
+            downloads: Dict[str, asyncio.Future] = {}
+
+            async def download(file_id: str) -> Tuple[str, str]:
+                file = await bot.get_file(file_id)
+                reservation = await disk_ledger.reserve(file.file_size or 0, ttl=WorkerSettings.job_timeout)
+                disk_reservations.append(reservation)
+                hasher = content_hasher()
+                path, _ = await disk_manager.download_to_temp(
+                    bot, file.file_path, ".jpg", hasher, reservation=reservation
+                )
+                temp_files.append(path)
+                return path, hasher.hexdigest()
+
+            async def process_item(file_id: str, model: str, item_params: dict) -> Tuple[Optional[str], Optional[bytes], str]:
+                """(file_id из кэша, новый результат, хэш входа)"""
+                async with semaphore:
+                    # Одно фото на несколько моделей скачиваем один раз
+                    if file_id not in downloads:
+                        downloads[file_id] = asyncio.ensure_future(download(file_id))
+                    image_path, content_hash = await downloads[file_id]
+
+                    # Параметры одного фото - ключ кэша совпадает с обычной задачей
+                    cached_file_id = await result_cache.get(content_hash, model, _cache_parameters(item_params))
+                    if cached_file_id:
+                        return cached_file_id, None, content_hash
+
+                    return None, await _call_topaz(image_path, item_params), content_hash
+
+            logger.info(
+                f"Processing image batch: task={task_id}, photos={len(items)}, "
+                f"model={task.model}, downloads={len(set(image_file_ids))}"
             )
 
-        except Exception as e:
-            logger.exception(f"Unexpected error: task={task_id}, error={e}")
-            
-            task.status = TaskStatus.FAILED
-            task.error_message = f"Internal error: {str(e)}"
-            await session.flush()
+            results = await asyncio.gather(
+                *(process_item(file_id, model, item_params) for file_id, model, item_params, _, _ in items),
+                return_exceptions=True
+            )
+            done = [
+                (item, result) for item, result in zip(items, results)
+                if not isinstance(result, BaseException)
+            ]
+            errors = [result for result in results if isinstance(result, BaseException)]
+
+            if not done:
+                # Не удалось ни одно фото - общая обработка ошибки (повтор или возврат)
+                raise errors[0]
+
+            for error in errors:
+                logger.warning(f"Batch item failed: task={task_id}, error={error}")
+
+            refund = round(task.cost - sum(item[3] for item, _ in done), 2)
+            caption = (
+                f"✅ <b>Фото готовы: {len(done)} из {len(items)}</b>\n\n"
+                f"💰 Списано: {int(task.cost - refund)} ген.\n"
+                f"⚡ Баланс: {int(user.balance + refund)} ген."
+            )
+
+            media = []
+            for index, (item, (cached_file_id, result, _)) in enumerate(done, start=1):
+                label = item[4]
+                item_caption = caption if index == 1 else None
+                if label:
+                    # Сравнение: у каждого фото подпись с моделью
+                    item_caption = f"📊 {label}\n\n{caption}" if index == 1 else f"📊 {label}"
+                media.append(InputMediaPhoto(
+                    media=cached_file_id or BufferedInputFile(result, filename=f"result_{index}.jpg"),
+                    caption=item_caption,
+                    parse_mode="HTML"
+                ))
+
+            if len(media) == 1:
+                sent_message = await safe_send_photo(
+                    bot=bot,
+                    chat_id=user.telegram_id,
+                    photo=media[0].media,
+                    caption=media[0].caption,
+                    parse_mode="HTML"
+                )
+                sent_messages = [sent_message] if sent_message else []
+            else:
+                sent_messages = await safe_send_media_group(bot, user.telegram_id, media) or []
+
+            if not sent_messages:
+                # Результаты не доставлены - задача не выполнена, общая обработка ошибки вернет генерации
+                raise TopazAPIError("Album delivery failed", user_message="Не удалось отправить результат")
+
+            task.status = TaskStatus.COMPLETED
+            task.output_file_id = result_file_id(sent_messages[0]) if sent_messages else None
             await session.commit()
 
-            # 🔥 ВОЗВРАТ - баланс был списан при создании, теперь возвращаем
-            await _safe_refund(session, user, task, "Внутренняя ошибка")
+            if refund:
+                await UserService.add_credits(
+                    session=session,
+                    user=user,
+                    amount=refund,
+                    description=f"Возврат: {len(errors)} фото из альбома не обработаны",
+                    reference_type="refund",
+                    reference_id=task.id
+                )
+                await session.commit()
+                await safe_send_text(
+                    bot=bot,
+                    chat_id=user.telegram_id,
+                    text=(
+                        f"⚠️ Не удалось обработать фото: {len(errors)}\n"
+                        f"💰 Возврат: {int(refund)} ген."
+                    ),
+                    parse_mode="HTML"
+                )
 
-            await safe_send_text(
-                bot=bot,
-                chat_id=user.telegram_id,
-                text=(
-                    f"❌ <b>Произошла ошибка обработки</b>\n\n"
-                    f"💰 Возврат: {int(task.cost)} ген.\n"
-                    f"⚡ Баланс: {int(user.balance)} ген."
-                ),
-                parse_mode="HTML"
+            # Новые результаты - в кэш (file_id берем из отправленного альбома)
+            for (item, (cached_file_id, result, content_hash)), message in zip(done, sent_messages):
+                if result is not None:
+                    await result_cache.put(
+                        content_hash, item[1], _cache_parameters(item[2]), result_file_id(message), len(result)
+                    )
+
+            logger.info(f"Image batch completed: task={task_id}, done={len(done)}, failed={len(errors)}")
+
+        except Exception as e:
+            await _handle_error(
+                ctx, bot, session, task, user, e,
+                "process_image_batch", [task_id, user_telegram_id, image_file_ids]
             )
 
         finally:
+            for path in temp_files:
+                disk_manager.cleanup_file(path)
+            for reservation in disk_reservations:
+                await disk_ledger.release(reservation)
             await bot.session.close()
 
 
 async def startup(ctx):
+    ctx["janitor"] = asyncio.create_task(temp_janitor.run())
     logger.info("✅ Image worker started")
 
 
 async def shutdown(ctx):
+    janitor = ctx.get("janitor")
+    if janitor:
+        janitor.cancel()
     await topaz_client.close()
     logger.info("🛑 Image worker stopped")
 
 
 class WorkerSettings:
-    functions = [process_image_task]
+    functions = [process_image_task, process_image_batch, process_video_preview]
     redis_settings = get_redis_settings()
     max_jobs = 10
     job_timeout = 3600
     keep_result = 3600
+    max_tries = settings.WORKER_MAX_TRIES
     on_startup = startup
     on_shutdown = shutdown
     queue_name = "arq:image_queue"
\ No newline at end of file
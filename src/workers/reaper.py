@@ -0,0 +1,187 @@
+import json
+import logging
+from typing import List, Tuple
+from src.services.bot_api import create_bot
+from sqlalchemy import select, update, func
+from src.core.config import settings
+from src.db.engine import async_session_maker
+from src.db.sql import seconds_ago
+from src.db.models import Task, TaskStatus, TaskType, User
+from src.vendors.topaz import topaz_client, TopazAPIError
+from src.services.users import UserService
+from src.services.telegram_safe import safe_send_text
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+REAP_BATCH_SIZE = 100
+ATTEMPTS_KEY = "reaper:attempts:{task_id}"
+
+# Статусы Topaz, после которых задачу не вернуть
+TOPAZ_FAILED_STATUSES = {"failed", "canceled", "cancelled", "canceling"}
+
+
+async def _next_attempt(redis: aioredis.Redis, task_id: int) -> int:
+    """Счетчик перезапусков задачи reaper'ом"""
+    key = ATTEMPTS_KEY.format(task_id=task_id)
+    attempt = await redis.incr(key)
+    await redis.expire(key, 86400)
+    return attempt
+
+
+def _requeue_job_id(task: Task) -> str:
+    """
+    Детерминированный _job_id перезапуска
+    ✅ Один и тот же зависший запуск (тот же updated_at) ставится в очередь один раз,
+       даже если reaper'ов несколько
+    ✅ Следующее зависание - новый updated_at, новый job
+    """
+    return f"reaper:{task.id}:{int(task.updated_at.timestamp())}"
+
+
+async def _topaz_status(request_id: str) -> str:
+    """Статус запроса в Topaz: complete / failed / processing / unknown"""
+    try:
+        status_data = await topaz_client.get_video_status(request_id)
+    except TopazAPIError as e:
+        if e.status_code == 404:
+            return "failed"
+        logger.warning(f"Reaper status check error: request={request_id}, error={e}")
+        return "unknown"
+
+    status = status_data.get("status", "").lower()
+    if status in TOPAZ_FAILED_STATUSES:
+        return "failed"
+    if status == "complete":
+        return "complete"
+    return "processing"
+
+
+async def reap_stuck_tasks(ctx: dict):
+    """
+    Периодическая сверка зависших задач (воркер упал, задача осталась PROCESSING)
+    ✅ Видео с запросом в Topaz - продолжаем опрос/доставку или возвращаем генерации
+    ✅ Остальные - перезапускаем (до STUCK_TASK_MAX_REQUEUES раз), затем возврат
+    """
+    # Время считает MySQL: updated_at выставляется NOW() сервера БД
+    cutoff = seconds_ago(settings.STUCK_TASK_TIMEOUT)
+
+    redis = await aioredis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB_CACHE
+    )
+
+    requeue: List[Tuple[Task, int, str]] = []
+    failed: List[Task] = []
+
+    try:
+        async with async_session_maker() as session:
+            # Использует индекс idx_tasks_status_updated (status, updated_at)
+            result = await session.execute(
+                select(Task, User.telegram_id)
+                .join(User, User.id == Task.user_id)
+                .where(Task.status == TaskStatus.PROCESSING, Task.updated_at < cutoff)
+                .order_by(Task.updated_at)
+                .limit(REAP_BATCH_SIZE)
+            )
+            rows = result.all()
+
+            if not rows:
+                return
+
+            logger.warning(f"Reaper found {len(rows)} stuck tasks")
+
+            for task, telegram_id in rows:
+                if task.task_type == TaskType.VIDEO_ENHANCE and task.topaz_request_id:
+                    topaz_status = await _topaz_status(task.topaz_request_id)
+                    if topaz_status == "unknown":
+                        continue
+                    if topaz_status == "failed":
+                        failed.append(task)
+                        continue
+                    # complete / processing - новый воркер продолжит опрос и доставит результат
+                    requeue.append((task, telegram_id, _requeue_job_id(task)))
+                    continue
+
+                if await _next_attempt(redis, task.id) > settings.STUCK_TASK_MAX_REQUEUES:
+                    failed.append(task)
+                else:
+                    requeue.append((task, telegram_id, _requeue_job_id(task)))
+
+            # Пачкой: возвращаем в ожидание - новый запуск заберет задачу через claim_task,
+            # а повтор старого job'а ARQ получит отказ
+            if requeue:
+                requeue_ids = [task.id for task, _, _ in requeue]
+                await session.execute(
+                    update(Task)
+                    .where(Task.id.in_(requeue_ids), Task.status == TaskStatus.PROCESSING)
+                    .values(status=TaskStatus.PENDING, updated_at=func.now())
+                )
+
+            # Пачкой: FAILED + возврат генераций в одной транзакции
+            refunded: List[Tuple[Task, User]] = []
+            for task in failed:
+                user = await session.get(User, task.user_id)
+                task.status = TaskStatus.FAILED
+                task.error_message = "Reaper: processing interrupted"
+                if user:
+                    await UserService.add_credits(
+                        session=session,
+                        user=user,
+                        amount=task.cost,
+                        description="Возврат: обработка прервана",
+                        reference_type="refund",
+                        reference_id=task.id
+                    )
+                    refunded.append((task, user))
+
+            await session.commit()
+
+        for task, telegram_id, job_id in requeue:
+            params = json.loads(task.parameters) if task.parameters else {}
+            input_files = task.input_file_id
+            if task.task_type == TaskType.VIDEO_ENHANCE:
+                function_name, queue_name = "process_video_task", "arq:video_queue"
+            elif params.get("files"):
+                # Альбом - одна задача на все фото
+                function_name, queue_name = "process_image_batch", "arq:image_queue"
+                input_files = params["files"]
+            else:
+                function_name, queue_name = "process_image_task", "arq:image_queue"
+
+            job = await ctx["redis"].enqueue_job(
+                function_name,
+                task.id,
+                telegram_id,
+                input_files,
+                _job_id=job_id,
+                _queue_name=queue_name
+            )
+            if job is None:
+                logger.info(f"Reaper requeue already queued: task={task.id}, job={job_id}")
+                continue
+            logger.info(f"Reaper requeued task: task={task.id}, queue={queue_name}")
+
+        if refunded:
+            bot = create_bot()
+            try:
+                for task, user in refunded:
+                    await safe_send_text(
+                        bot=bot,
+                        chat_id=user.telegram_id,
+                        text=(
+                            f"❌ <b>Обработка прервана</b>\n\n"
+                            f"💰 Возврат: {int(task.cost)} ген.\n"
+                            f"⚡ Баланс: {int(user.balance)} ген.\n\n"
+                            f"Попробуйте еще раз или напишите в поддержку."
+                        ),
+                        parse_mode="HTML"
+                    )
+            finally:
+                await bot.session.close()
+
+        logger.info(f"Reaper done: requeued={len(requeue)}, failed={len(refunded)}")
+
+    finally:
+        await redis.close()
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+from typing import List
+from arq import create_pool
+from src.core.config import settings
+from src.workers.settings import get_redis_settings
+
+logger = logging.getLogger(__name__)
+
+QUEUE_NAMES = ("arq:image_queue", "arq:video_queue")
+WORKER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "run_combined_worker.py"
+)
+
+
+class WorkerSupervisor:
+    """
+    Процессы комбинированного воркера
+    ✅ Держит target процессов, упавшие перезапускает
+    ✅ Очередь долго глубже SUPERVISOR_SCALE_UP_DEPTH на процесс - добавляет процесс
+    ✅ Очереди долго пусты - лишний процесс получает SIGTERM и дренируется
+    ✅ SIGTERM супервизору - пересылается всем процессам, ждем их завершения
+    """
+
+    def __init__(self):
+        self.target = settings.SUPERVISOR_MIN_PROCESSES
+        self.processes: List[asyncio.subprocess.Process] = []
+        self.retiring: List[asyncio.subprocess.Process] = []
+        self.stopping = asyncio.Event()
+        self._busy_checks = 0
+        self._idle_checks = 0
+
+    async def _spawn(self):
+        process = await asyncio.create_subprocess_exec(sys.executable, WORKER_SCRIPT)
+        self.processes.append(process)
+        logger.info(f"Combined worker started: pid={process.pid}, processes={len(self.processes)}")
+
+    def _reap(self):
+        """Убрать завершившиеся процессы"""
+        for process in list(self.processes):
+            if process.returncode is not None:
+                self.processes.remove(process)
+                logger.error(f"Combined worker exited unexpectedly: pid={process.pid}, code={process.returncode}")
+
+        for process in list(self.retiring):
+            if process.returncode is not None:
+                self.retiring.remove(process)
+                logger.info(f"Combined worker drained: pid={process.pid}")
+
+    async def _queue_depth(self, pool) -> int:
+        """Готовые к запуску задачи во всех очередях (отложенные повторы не в счет)"""
+        now = int(time.time() * 1000)
+        depth = 0
+        for queue_name in QUEUE_NAMES:
+            depth += await pool.zcount(queue_name, "-inf", now)
+        return depth
+
+    def _scale(self, depth: int):
+        """Изменить target, если нагрузка держится SUPERVISOR_SCALE_SUSTAIN проверок подряд"""
+        per_process = depth / max(len(self.processes), 1)
+        self._busy_checks = self._busy_checks + 1 if per_process > settings.SUPERVISOR_SCALE_UP_DEPTH else 0
+        self._idle_checks = self._idle_checks + 1 if depth == 0 else 0
+
+        if self._busy_checks >= settings.SUPERVISOR_SCALE_SUSTAIN and self.target < settings.SUPERVISOR_MAX_PROCESSES:
+            self.target += 1
+            self._busy_checks = 0
+            logger.warning(f"Queue depth {depth} is high, scaling up to {self.target} processes")
+
+        if self._idle_checks >= settings.SUPERVISOR_SCALE_SUSTAIN and self.target > settings.SUPERVISOR_MIN_PROCESSES:
+            self.target -= 1
+            self._idle_checks = 0
+            logger.info(f"Queues are empty, scaling down to {self.target} processes")
+
+    async def _apply_target(self):
+        while len(self.processes) < self.target:
+            await self._spawn()
+
+        while len(self.processes) > self.target:
+            # Самый новый процесс: SIGTERM - дренирование, задачи не теряются
+            process = self.processes.pop()
+            process.send_signal(signal.SIGTERM)
+            self.retiring.append(process)
+
+    async def _shutdown(self):
+        children = self.processes + self.retiring
+        logger.warning(f"Supervisor stopping, draining {len(children)} workers")
+        for process in children:
+            if process.returncode is None:
+                process.send_signal(signal.SIGTERM)
+        await asyncio.gather(*(process.wait() for process in children))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stopping.set)
+
+        pool = await create_pool(get_redis_settings())
+        try:
+            await self._apply_target()
+            while not self.stopping.is_set():
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), timeout=settings.SUPERVISOR_CHECK_INTERVAL)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+
+                self._reap()
+                try:
+                    self._scale(await self._queue_depth(pool))
+                except Exception as e:
+                    logger.error(f"Queue depth check error: {e}")
+                await self._apply_target()
+        finally:
+            await self._shutdown()
+            await pool.close()
+
+
+async def run_supervisor():
+    await WorkerSupervisor().run()
@@ -1,11 +1,14 @@
 import asyncio
 import os
-import signal
 import sys
 import logging
 import json
-from aiogram import Bot
-from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+import html
+from typing import List, Optional, Tuple
+from src.services.bot_api import create_bot, local_input_file, max_upload_size
+from src.services.result_links import result_links
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from sqlalchemy import update, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.db.engine import async_session_maker
 from src.db.models import Task, TaskStatus, User
@@ -13,25 +16,33 @@ from src.vendors.topaz import topaz_client, TopazAPIError
 from src.services.users import UserService
 from src.core.config import settings
 from src.workers.settings import get_redis_settings
-from src.services.telegram_safe import safe_send_video, safe_send_text, safe_edit_text
-from src.utils.file_manager import disk_manager, DiskManager
+from src.services.telegram_safe import safe_send_video, safe_send_text, safe_edit_text, safe_delete_message
+from src.services.result_cache import result_cache, content_hasher
+from src.utils.file_manager import disk_manager, DOWNLOAD_CHUNK_SIZE
+from src.utils.disk_ledger import disk_ledger
+from src.utils.temp_janitor import temp_janitor
 from src.utils.file_validator import file_validator
+from src.utils.video_segments import split_video, concat_segments, probe_duration, cut_clip
+from src.services.estimator import processing_estimator, StageTimer
+from src.workers.coalescing import (
+    claim_task,
+    handle_attached_task,
+    deliver_to_attached,
+    fail_attached_task,
+    result_file_id,
+)
+from src.workers.reaper import reap_stuck_tasks
+from src.workers.drain import is_draining
+from src.workers.budget import video_budget
+from src.workers.errors import ErrorKind, DEAD_LETTER_KINDS, classify_error, should_retry, retry_delay
+from src.services.dead_letters import dead_letters
+from arq import cron, Retry
 import redis.asyncio as aioredis
 
 logger = logging.getLogger(__name__)
 
-_shutdown_flag = False
-
-
-def signal_handler(signum, frame):
-    global _shutdown_flag
-    logger.warning(f"Received signal {signum}, graceful shutdown...")
-    _shutdown_flag = True
-
-
-signal.signal(signal.SIGTERM, signal_handler)
-signal.signal(signal.SIGINT, signal_handler)
-
+# Видео, скачанное для превью, - его берет полная обработка вместо повторного скачивания
+PREVIEW_INPUT_KEY = "video_input:{file_unique_id}"
 
 async def _safe_refund(session: AsyncSession, user: User, task: Task, reason: str):
     """Безопасный возврат генераций - только при ошибках"""
@@ -70,31 +81,343 @@ async def _check_cancel_flag(task_id: int) -> bool:
         return False
 
 
+async def _update_task(task_id: int, **values):
+    """Обновить задачу по id в короткой транзакции (соединение сразу возвращается в пул)"""
+    async with async_session_maker() as session:
+        await session.execute(update(Task).where(Task.id == task_id).values(**values))
+        await session.commit()
+
+
+async def _touch_task(task_id: int):
+    """Обновить updated_at задачи (heartbeat для reaper)"""
+    try:
+        await _update_task(task_id, updated_at=func.now())
+    except Exception as e:
+        logger.warning(f"Heartbeat error: task={task_id}, error={e}")
+
+
+async def _heartbeat(task_id: int):
+    """
+    Heartbeat для reaper на все время задачи
+    ✅ Скачивание/загрузка больших файлов и ожидание бюджета не выглядят зависанием
+    """
+    while True:
+        await asyncio.sleep(settings.TASK_HEARTBEAT_INTERVAL)
+        await _touch_task(task_id)
+
+
+async def _keep_preview_input(file_unique_id: str, path: str) -> bool:
+    """Оставить скачанное для превью видео полной обработке"""
+    if not file_unique_id:
+        return False
+    try:
+        redis = await aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB_CACHE
+        )
+        try:
+            await redis.setex(
+                PREVIEW_INPUT_KEY.format(file_unique_id=file_unique_id),
+                settings.VIDEO_PREVIEW_KEEP_INPUT,
+                path
+            )
+        finally:
+            await redis.close()
+    except Exception as e:
+        logger.error(f"Keep preview input error: {e}")
+        return False
+
+    # Файл больше не в работе: не заберут - удалит janitor по возрасту
+    temp_janitor.release(path)
+    return True
+
+
+async def _take_preview_input(file_unique_id: Optional[str]) -> Optional[str]:
+    """Забрать видео, скачанное для превью (ключ удаляется - файл у одной задачи)"""
+    if not file_unique_id:
+        return None
+    try:
+        redis = await aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB_CACHE,
+            decode_responses=True
+        )
+        try:
+            path = await redis.getdel(PREVIEW_INPUT_KEY.format(file_unique_id=file_unique_id))
+        finally:
+            await redis.close()
+    except Exception as e:
+        logger.error(f"Take preview input error: {e}")
+        return None
+
+    if not path or not os.path.exists(path):
+        return None
+    disk_manager.adopt_temp_file(path)
+    return path
+
+
+async def _requeue(ctx: dict, task_id: int, user_telegram_id: int, video_file_id: str):
+    """Вернуть задачу в очередь - ее подхватит другой (или перезапущенный) воркер"""
+    await ctx["redis"].enqueue_job(
+        "process_video_task",
+        task_id,
+        user_telegram_id,
+        video_file_id,
+        _queue_name=WorkerSettings.queue_name
+    )
+
+
+async def _hand_off(
+    ctx: dict,
+    task: Task,
+    progress_message,
+    user_telegram_id: int,
+    video_file_id: str
+):
+    """
+    Передача задачи при остановке воркера
+    ✅ Запрос в Topaz уже сохранен в task.topaz_request_id - новый воркер продолжит опрос
+    ✅ Без отмены в Topaz и без возврата генераций
+    """
+    await _update_task(task.id, status=TaskStatus.PENDING)
+    await _requeue(ctx, task.id, user_telegram_id, video_file_id)
+
+    if progress_message:
+        await safe_edit_text(
+            progress_message,
+            "🔄 <b>Сервер обновляется</b>\n\n"
+            "Обработка продолжится автоматически, ничего делать не нужно",
+            parse_mode="HTML"
+        )
+
+    logger.info(f"Video task handed off: task={task.id}, request={task.topaz_request_id}")
+
+
+async def _download_result(download_url: str, task_id: int, disk_reservation: Optional[str] = None) -> Tuple[str, int]:
+    """
+    Скачать результат из Topaz потоком во временный файл
+
+    Returns:
+        (путь, размер в байтах)
+    """
+    try:
+        session_dl = await topaz_client._get_session()
+        async with session_dl.get(download_url) as resp:
+                if resp.status == 200:
+                    return await disk_manager.stream_to_temp(
+                        resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE), ".mp4", reservation=disk_reservation
+                    )
+                else:
+                    raise TopazAPIError("Download failed", user_message="Ошибка скачивания результата")
+    except Exception as e:
+        logger.error(f"Download error: {e}, task={task_id}")
+        raise TopazAPIError(f"Download error: {e}", user_message="Ошибка скачивания результата")
+
+
+def _should_segment(duration_seconds: Optional[float]) -> bool:
+    """Резать ли видео на сегменты для параллельной обработки"""
+    return (
+        settings.VIDEO_SEGMENT_ENABLED
+        and (duration_seconds or 0) >= settings.VIDEO_SEGMENT_MIN_DURATION
+    )
+
+
+async def _process_segment(
+    task_id: int,
+    segment_path: str,
+    params: dict,
+    request_ids: List[str],
+    progress: List[int],
+    index: int,
+    disk_reservation: Optional[str] = None,
+    timeout: int = 3600
+) -> str:
+    """
+    Один сегмент: запрос в Topaz, загрузка, опрос, скачивание результата
+
+    Args:
+        timeout: секунд ждать результат Topaz
+
+    Returns:
+        путь к результату сегмента (временный файл)
+    """
+    source = params.get("source", {})
+    duration = await probe_duration(segment_path) or settings.VIDEO_SEGMENT_SECONDS
+    segment_source = dict(
+        source,
+        duration=duration,
+        frameCount=int(duration * source.get("frameRate", 30)),
+        size=os.path.getsize(segment_path)
+    )
+    # Звук в сегментах не нужен - при склейке берем его из оригинала
+    output = dict(params.get("output", {}), audioTransfer="None")
+    output.pop("audioCodec", None)
+
+    create_resp = await topaz_client.create_video_request(
+        source=segment_source,
+        filters=params.get("filters", []),
+        output=output
+    )
+    request_id = create_resp["requestId"]
+    request_ids.append(request_id)
+
+    accept_resp = await topaz_client.accept_video_request(request_id)
+    upload_urls = accept_resp.get("urls", [])
+    if not upload_urls:
+        raise TopazAPIError("No upload URLs", user_message="Не получены ссылки для загрузки")
+
+    with open(segment_path, "rb") as f:
+        etag = await topaz_client.upload_video_to_url(upload_urls[0], f)
+    await topaz_client.complete_video_upload(request_id, [{"partNum": 1, "eTag": etag}])
+    logger.info(f"Segment uploaded: task={task_id}, segment={index}, request={request_id}")
+
+    for _ in range(timeout // 10):
+        await asyncio.sleep(10)
+
+        try:
+            status_data = await topaz_client.get_video_status(request_id)
+        except TopazAPIError as e:
+            logger.warning(f"Segment status check error: {e}")
+            continue
+
+        status = status_data.get("status", "").lower()
+        progress[index] = status_data.get("progress", 0)
+
+        if status == "complete":
+            download_url = status_data.get("download", {}).get("url")
+            if not download_url:
+                raise TopazAPIError("No download URL", user_message="Не получена ссылка на результат")
+            result_path, _ = await _download_result(download_url, task_id, disk_reservation)
+            return result_path
+        elif status == "failed":
+            error_msg = status_data.get("message", "Processing failed")
+            raise TopazAPIError(f"Segment processing failed: {error_msg}", user_message="Обработка не удалась")
+        elif status in ["canceled", "cancelled", "canceling"]:
+            raise TopazAPIError("Segment processing canceled", user_message="Обработка отменена")
+
+    raise TopazAPIError("Segment processing timeout", user_message=f"Превышено время обработки ({timeout // 60} мин)")
+
+
+async def _process_segmented(
+    task_id: int,
+    temp_input: str,
+    params: dict,
+    progress_message,
+    cancel_kb: InlineKeyboardMarkup,
+    request_ids: List[str],
+    temp_files: List[str],
+    disk_reservation: Optional[str] = None
+) -> Optional[str]:
+    """
+    Параллельная обработка длинного видео
+    ✅ Нарезка по ключевым кадрам без перекодирования
+    ✅ Сегменты - отдельные запросы в Topaz (до VIDEO_SEGMENT_MAX_PARALLEL одновременно)
+    ✅ Результаты сегментов - потоком на диск
+    ✅ Склейка без перекодирования, звук из оригинала один раз
+    ✅ Остановка воркера - новые сегменты не начинаем, задачу передаем
+
+    Returns:
+        путь к склеенному результату или None - воркер останавливается
+    """
+    segments = await split_video(temp_input, settings.VIDEO_SEGMENT_SECONDS)
+    for path in segments:
+        disk_manager.adopt_temp_file(path)
+        temp_files.append(path)
+
+    logger.info(f"Video split: task={task_id}, segments={len(segments)}")
+
+    semaphore = asyncio.Semaphore(settings.VIDEO_SEGMENT_MAX_PARALLEL)
+    progress = [0] * len(segments)
+
+    async def run(index: int, path: str) -> Optional[str]:
+        async with semaphore:
+            if is_draining():
+                return None
+            result_path = await _process_segment(task_id, path, params, request_ids, progress, index, disk_reservation)
+        temp_files.append(result_path)
+        return result_path
+
+    jobs = [asyncio.create_task(run(index, path)) for index, path in enumerate(segments)]
+    pending = set(jobs)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=30, return_when=asyncio.FIRST_EXCEPTION)
+            for job in done:
+                if job.exception():
+                    raise job.exception()
+
+            # Остановка воркера: запросы сегментов не сохранены - повтор начнет заново
+            if is_draining():
+                for job in pending:
+                    job.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                return None
+
+            if await _check_cancel_flag(task_id):
+                logger.info(f"User canceled task: {task_id}")
+                raise TopazAPIError("Canceled by user", user_message="Отменено пользователем")
+
+            total_progress = sum(progress) // len(progress)
+            progress_bar = "▰" * (total_progress // 10) + "▱" * (10 - total_progress // 10)
+            await safe_edit_text(
+                progress_message,
+                f"🎬 <b>Обработка видео...</b>\n\n"
+                f"{progress_bar} {total_progress}%\n\n"
+                f"🧩 Частей готово: {len(jobs) - len(pending)} из {len(jobs)}",
+                reply_markup=cancel_kb,
+                parse_mode="HTML"
+            )
+    except BaseException:
+        for job in pending:
+            job.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        raise
+
+    output_path = disk_manager.new_temp_path(".mp4")
+    temp_files.append(output_path)
+    await concat_segments([job.result() for job in jobs], temp_input, output_path)
+    await disk_ledger.consume(disk_reservation, os.path.getsize(output_path))
+    logger.info(f"Video segments stitched: task={task_id}, segments={len(jobs)}")
+    return output_path
+
+
+async def _cancel_requests(request_ids: List[str]):
+    """Отменить запросы сегментов в Topaz"""
+    for request_id in request_ids:
+        try:
+            await topaz_client.cancel_video_request(request_id)
+        except Exception as cancel_error:
+            logger.error(f"Cancel request failed: {cancel_error}")
+
+
 async def process_video_task(ctx: dict, task_id: int, user_telegram_id: int, video_file_id: str):
-    global _shutdown_flag
-    
-    if _shutdown_flag:
-        logger.warning(f"Shutdown in progress, skipping task {task_id}")
+    if is_draining():
+        # Задачу взяли перед остановкой - возвращаем в очередь, а не теряем
+        logger.warning(f"Worker draining, requeueing task {task_id}")
+        await _requeue(ctx, task_id, user_telegram_id, video_file_id)
         return
     
-    bot = Bot(token=settings.BOT_TOKEN)
+    bot = create_bot()
     temp_input = None
     temp_output = None
     request_id = None
     progress_message = None
+    uploaded = False
+    reservation = None
+    disk_reservation = None
+    segmented = False
+    segment_requests: List[str] = []
+    segment_files: List[str] = []
+    task = user = None
+    heartbeat = None
+    timer = StageTimer()
 
-    async with async_session_maker() as session:
-        try:
-            # Проверка диска
-            if not DiskManager.check_disk_space():
-                await safe_send_text(
-                    bot,
-                    user_telegram_id,
-                    "⚠️ <b>Сервер перегружен</b>\n\nПопробуйте через 5-10 минут",
-                    parse_mode="HTML"
-                )
-                return
-            
+    try:
+        # Короткие транзакции по id: соединение из пула не держим, пока ждем Telegram и Topaz.
+        # Дальше task и user - отсоединенные снимки, изменения в БД только через _update_task.
+        async with async_session_maker() as session:
             task = await session.get(Task, task_id)
             if not task:
                 logger.error(f"Task {task_id} not found")
@@ -104,141 +427,258 @@ async def process_video_task(ctx: dict, task_id: int, user_telegram_id: int, vid
             if not user:
                 logger.error(f"User {task.user_id} not found")
                 return
-
-            task.status = TaskStatus.PROCESSING
-            await session.flush()
-            await session.commit()
-
-            # Клавиатура с отменой
-            cancel_kb = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="❌ Отменить", callback_data=f"cancel_task:{task_id}")]
-            ])
             
-            progress_message = await bot.send_message(
-                user_telegram_id,
-                "⏳ <b>Загружаю видео...</b>\n\n"
-                "Это может занять 1-2 минуты",
-                reply_markup=cancel_kb,
-                parse_mode="HTML"
-            )
+            # Такая же задача уже выполняется - ждем ее результат
+            if task.parent_task_id:
+                if await _check_cancel_flag(task_id):
+                    await fail_attached_task(bot, session, task, user, "Отменено пользователем")
+                    return
+                handled = await handle_attached_task(
+                    ctx, bot, session, task,
+                    "process_video_task", WorkerSettings.queue_name,
+                    task_id, user_telegram_id, video_file_id
+                )
+                if handled:
+                    return
+            
+            if not await claim_task(session, task_id):
+                return
+            await session.refresh(task)
+
+        # Задача жива, пока работает воркер: reaper ее не трогает
+        heartbeat = asyncio.create_task(_heartbeat(task_id))
 
-            # Скачиваем видео
+        # Клавиатура с отменой
+        cancel_kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="❌ Отменить", callback_data=f"cancel_task:{task_id}")]
+        ])
+        
+        params = json.loads(task.parameters) if task.parameters else {}
+        source = params.get("source", {})
+        duration_seconds = source.get("duration")
+        resolution = source.get("resolution", {})
+        pixels = resolution.get("width", 0) * resolution.get("height", 0) or None
+        await processing_estimator.ensure_fresh()
+        estimate_seconds = processing_estimator.estimate(task.model, duration_seconds, pixels)
+        
+        resumed = bool(task.topaz_request_id)
+        file_size = None
+        content_hash = None
+        
+        progress_message = await bot.send_message(
+            user_telegram_id,
+            "⏳ <b>Возобновляю обработку...</b>" if resumed else
+            "⏳ <b>Загружаю видео...</b>\n\n"
+            "Это может занять 1-2 минуты",
+            reply_markup=cancel_kb,
+            parse_mode="HTML"
+        )
+        
+        input_size = source.get("size")
+        if not resumed:
             file = await bot.get_file(video_file_id)
-            
+        
             # Проверка размера ДО скачивания
             valid, error_msg = file_validator.validate_video_size(file.file_size)
             if not valid:
                 raise TopazAPIError("File too large", user_message=error_msg)
-            
-            video_data = await bot.download_file(file.file_path)
-            video_bytes = video_data.read()
-            
-            temp_input = disk_manager.save_temp_file(video_bytes, '.mp4')
-            file_size = os.path.getsize(temp_input)
-            
-            logger.info(f"Video downloaded: size={file_size}, task={task_id}")
-
-            # Обновление прогресса
+            input_size = file.file_size
+        elif not input_size:
+            input_size = (await bot.get_file(video_file_id)).file_size
+        
+        # ✅ Бюджет байт: вход и результат идут потоком через диск, память не нужна;
+        # на диске - вход (если качаем) + ожидаемый выход
+        expected_output = int((input_size or 0) * settings.VIDEO_OUTPUT_SIZE_RATIO)
+        disk_needed = expected_output if resumed else (input_size or 0) + expected_output
+        # Сегменты - вторая копия входа и выхода на диске до склейки
+        if not resumed and _should_segment(duration_seconds):
+            disk_needed *= 2
+        
+        async def _notify_budget_wait():
             await safe_edit_text(
                 progress_message,
-                "📤 <b>Загружаю на сервер обработки...</b>\n\n"
-                "Подготовка видео...",
+                "⏳ <b>В очереди</b>\n\n"
+                "Сервер занят другими видео, начну как только освободятся ресурсы",
                 reply_markup=cancel_kb,
                 parse_mode="HTML"
             )
+        
+        reservation = await video_budget.acquire(
+            disk=disk_needed,
+            timeout=settings.VIDEO_BUDGET_WAIT_TIMEOUT,
+            on_wait=_notify_budget_wait
+        )
+        
+        # ✅ Резерв места на общем томе temp_inputs (с учетом задач других контейнеров)
+        disk_reservation = await disk_ledger.reserve(disk_needed, ttl=settings.VIDEO_JOB_TIMEOUT)
+        
+        if resumed:
+            # ✅ Запрос в Topaz уже создан прошлым запуском - просто продолжаем опрос
+            request_id = task.topaz_request_id
+            uploaded = True
+            logger.info(f"Video task resumed: request={request_id}, task={task_id}")
+        else:
+            # Скачиваем видео потоком на диск (если было превью - оно уже на диске)
+            temp_input = await _take_preview_input(task.input_file_unique_id)
+            if temp_input:
+                file_size = os.path.getsize(temp_input)
+                content_hash = await asyncio.to_thread(disk_manager.hash_file, temp_input, content_hasher())
+                # Файл уже на диске - резерв под вход не нужен
+                await disk_ledger.consume(disk_reservation, file_size)
+                logger.info(f"Video input reused from preview: task={task_id}")
+            else:
+                hasher = content_hasher()
+                temp_input, file_size = await disk_manager.download_to_temp(
+                    bot, file.file_path, ".mp4", hasher, reservation=disk_reservation
+                )
+                content_hash = hasher.hexdigest()
+        
+            logger.info(f"Video downloaded: size={file_size}, task={task_id}")
+            timer.lap("download")
+        
+            # ✅ Такое же видео уже обрабатывалось этой моделью - отправляем готовый результат
+            cached_file_id = await result_cache.get(content_hash, task.model, task.parameters)
+            if cached_file_id:
+                sent_message = await safe_send_video(
+                    bot=bot,
+                    chat_id=user.telegram_id,
+                    video=cached_file_id,
+                    caption=(
+                        f"✅ <b>Видео готово!</b>\n\n"
+                        f"💰 Списано: {int(task.cost)} ген.\n"
+                        f"⚡ Баланс: {int(user.balance)} ген."
+                    ),
+                    parse_mode="HTML"
+                )
+                if sent_message:
+                    task.status = TaskStatus.COMPLETED
+                    task.output_file_id = cached_file_id
+                    await _update_task(task_id, status=TaskStatus.COMPLETED, output_file_id=cached_file_id)
+                    await safe_delete_message(bot, user_telegram_id, progress_message.message_id)
+                    async with async_session_maker() as session:
+                        await deliver_to_attached(bot, session, task)
+                    logger.info(f"Video task served from cache: task={task_id}")
+                    return
 
-            params = json.loads(task.parameters) if task.parameters else {}
-            
-            # Шаг 1: Создать запрос
-            source = params.get("source", {})
-            source["size"] = file_size
-            
-            output = params.get("output", {})
-            filters = params.get("filters", [])
-            
-            create_resp = await topaz_client.create_video_request(
-                source=source,
-                filters=filters,
-                output=output
-            )
-            request_id = create_resp["requestId"]
-            task.topaz_request_id = request_id
-            await session.flush()
-            await session.commit()
-            
-            logger.info(f"Video request created: {request_id}, task={task_id}")
+            # Длинное видео - параллельно по сегментам
+            segmented = _should_segment(duration_seconds)
+            if not segmented:
+                # Обновление прогресса
+                await safe_edit_text(
+                    progress_message,
+                    "📤 <b>Загружаю на сервер обработки...</b>\n\n"
+                    "Подготовка видео...",
+                    reply_markup=cancel_kb,
+                    parse_mode="HTML"
+                )
+
+                # Шаг 1: Создать запрос
+                source["size"] = file_size
+                output = params.get("output", {})
+                filters = params.get("filters", [])
+        
+                create_resp = await topaz_client.create_video_request(
+                    source=source,
+                    filters=filters,
+                    output=output
+                )
+                request_id = create_resp["requestId"]
+                task.topaz_request_id = request_id
+                await _update_task(task_id, topaz_request_id=request_id)
+        
+                logger.info(f"Video request created: {request_id}, task={task_id}")
 
-            # Шаг 2: Accept
-            accept_resp = await topaz_client.accept_video_request(request_id)
-            upload_urls = accept_resp.get("urls", [])  # ← ИСПРАВЛЕНО с uploadUrls
-            if not upload_urls:
-                raise TopazAPIError("No upload URLs", user_message="Не получены ссылки для загрузки")
+                # Шаг 2: Accept
+                accept_resp = await topaz_client.accept_video_request(request_id)
+                upload_urls = accept_resp.get("urls", [])  # ← ИСПРАВЛЕНО с uploadUrls
+                if not upload_urls:
+                    raise TopazAPIError("No upload URLs", user_message="Не получены ссылки для загрузки")
 
-            # Проверка отмены
-            if await _check_cancel_flag(task_id):
-                raise TopazAPIError("Canceled by user", user_message="Отменено пользователем")
+                # Проверка отмены
+                if await _check_cancel_flag(task_id):
+                    raise TopazAPIError("Canceled by user", user_message="Отменено пользователем")
 
-            # Шаг 3: Upload
-            etag = await topaz_client.upload_video_to_url(upload_urls[0], video_bytes)
-            logger.info(f"Video uploaded: etag={etag}, task={task_id}")
-            
-            # Шаг 4: Complete
-            await topaz_client.complete_video_upload(request_id, [{"partNum": 1, "eTag": etag}])
-            
-            await safe_edit_text(
-                progress_message,
-                "🎬 <b>Обработка началась!</b>\n\n"
-                "⏳ Это займет несколько минут...\n"
-                "📊 Прогресс: 0%",
-                reply_markup=cancel_kb,
-                parse_mode="HTML"
-            )
-            
-            logger.info(f"Video processing started: request={request_id}")
+                # Шаг 3: Upload (потоком из файла)
+                with open(temp_input, "rb") as f:
+                    etag = await topaz_client.upload_video_to_url(upload_urls[0], f)
+                logger.info(f"Video uploaded: etag={etag}, task={task_id}")
+        
+                # Шаг 4: Complete
+                await topaz_client.complete_video_upload(request_id, [{"partNum": 1, "eTag": etag}])
+                uploaded = True
+                timer.lap("upload")
+        
+                await safe_edit_text(
+                    progress_message,
+                    "🎬 <b>Обработка началась!</b>\n\n"
+                    "⏳ Это займет несколько минут...\n"
+                    "📊 Прогресс: 0%",
+                    reply_markup=cancel_kb,
+                    parse_mode="HTML"
+                )
+        
+                logger.info(f"Video processing started: request={request_id}")
 
+        if segmented:
+            # ✅ Сегменты обрабатываются параллельно отдельными запросами в Topaz
+            temp_output = await _process_segmented(
+                task_id, temp_input, params, progress_message, cancel_kb,
+                segment_requests, segment_files, disk_reservation
+            )
+            if temp_output is None:
+                # Остановка воркера: незаконченные сегменты отменяем, повтор начнет заново
+                await _cancel_requests(segment_requests)
+                await _hand_off(ctx, task, progress_message, user_telegram_id, video_file_id)
+                return
+            timer.lap("processing")
+        else:
             # Шаг 5: Polling
             download_url = None
             last_progress = -1
-            
+        
             for i in range(360):  # 1 час
                 await asyncio.sleep(10)
-                
+            
                 # Проверка отмены
                 if await _check_cancel_flag(task_id):
                     logger.info(f"User canceled task: {task_id}")
                     await topaz_client.cancel_video_request(request_id)
                     raise TopazAPIError("Canceled by user", user_message="Отменено пользователем")
-                
-                # Проверка shutdown
-                if _shutdown_flag:
-                    logger.warning(f"Shutdown during processing: task={task_id}")
-                    break
-                
+            
+                # Остановка воркера: передаем опрос другому воркеру
+                if is_draining():
+                    await _hand_off(ctx, task, progress_message, user_telegram_id, video_file_id)
+                    return
+            
                 try:
                     status_data = await topaz_client.get_video_status(request_id)
                 except TopazAPIError as e:
                     logger.warning(f"Status check error: {e}")
                     continue
-                
+            
                 status = status_data.get("status", "").lower()
                 progress = status_data.get("progress", 0)
-                
+            
                 # Обновление прогресса каждые 30 секунд
                 if i % 3 == 0 and progress != last_progress and progress_message:
                     try:
                         progress_bar = "▰" * (progress // 10) + "▱" * (10 - progress // 10)
+                        if estimate_seconds:
+                            remaining_minutes = max(1, int(estimate_seconds * (100 - progress) / 100) // 60)
+                        else:
+                            remaining_minutes = (100 - progress) // 10
                         await safe_edit_text(
                             progress_message,
                             f"🎬 <b>Обработка видео...</b>\n\n"
                             f"{progress_bar} {progress}%\n\n"
-                            f"⏱ Осталось примерно {(100 - progress) // 10} мин",
+                            f"⏱ Осталось примерно {remaining_minutes} мин",
                             reply_markup=cancel_kb,
                             parse_mode="HTML"
                         )
                         last_progress = progress
                     except Exception:
                         pass
-                
+            
                 # Обработка статусов
                 if status == "complete":
                     download_url = status_data.get("download", {}).get("url")
@@ -247,18 +687,18 @@ async def process_video_task(ctx: dict, task_id: int, user_telegram_id: int, vid
                         break
                     else:
                         raise TopazAPIError("No download URL", user_message="Не получена ссылка на результат")
-                
+            
                 elif status == "failed":
                     error_msg = status_data.get("message", "Processing failed")
                     logger.error(f"Video processing failed: {error_msg}, task={task_id}")
                     raise TopazAPIError(f"Processing failed: {error_msg}", user_message="Обработка не удалась")
-                
+            
                 elif status in ["canceled", "cancelled"]:
                     raise TopazAPIError("Processing canceled", user_message="Обработка отменена")
-                
+            
                 elif status == "canceling":
                     raise TopazAPIError("Processing being canceled", user_message="Обработка отменяется")
-            
+        
             if not download_url:
                 logger.error(f"Video processing timeout: task={task_id}")
                 try:
@@ -266,6 +706,8 @@ async def process_video_task(ctx: dict, task_id: int, user_telegram_id: int, vid
                 except Exception as e:
                     logger.error(f"Cancel after timeout failed: {e}")
                 raise TopazAPIError("Processing timeout", user_message="Превышено время обработки (1 час)")
+        
+            timer.lap("processing")
 
             # Шаг 6: Download
             await safe_edit_text(
@@ -274,27 +716,19 @@ async def process_video_task(ctx: dict, task_id: int, user_telegram_id: int, vid
                 "Почти готово!",
                 parse_mode="HTML"
             )
-            
-            try:
-                session_dl = await topaz_client._get_session()
-                async with session_dl.get(download_url) as resp:
-                        if resp.status == 200:
-                            result_data = await resp.read()
-                        else:
-                            raise TopazAPIError("Download failed", user_message="Ошибка скачивания результата")
-            except Exception as e:
-                logger.error(f"Download error: {e}, task={task_id}")
-                raise TopazAPIError(f"Download error: {e}", user_message="Ошибка скачивания результата")
-
-            temp_output = disk_manager.save_temp_file(result_data, '.mp4')
-            logger.info(f"Video downloaded: size={len(result_data)}, task={task_id}")
+        
+            temp_output, output_size = await _download_result(download_url, task_id, disk_reservation)
+            logger.info(f"Video downloaded: size={output_size}, task={task_id}")
 
-            # 🔥 УБРАНО: deduct_credits - баланс УЖЕ списан при создании задачи!
-            # Просто отправляем результат пользователю
+        # 🔥 УБРАНО: deduct_credits - баланс УЖЕ списан при создании задачи!
+        # Просто отправляем результат пользователю
 
-            # Отправка результата
-            video_file = FSInputFile(temp_output)
-            await safe_send_video(
+        # Отправка результата
+        output_size = os.path.getsize(temp_output)
+        sent_message = None
+        if output_size <= max_upload_size():
+            video_file = local_input_file(temp_output)
+            sent_message = await safe_send_video(
                 bot=bot,
                 chat_id=user.telegram_id,
                 video=video_file,
@@ -306,86 +740,299 @@ async def process_video_task(ctx: dict, task_id: int, user_telegram_id: int, vid
                 parse_mode="HTML"
             )
 
-            task.status = TaskStatus.COMPLETED
-            await session.flush()
-            await session.commit()
-            
-            logger.info(f"Video task completed: task={task_id}")
+        if not sent_message:
+            # Больше лимита Bot API или Telegram не принял файл - отдаем ссылкой, работа не теряется
+            logger.warning(f"Video result served by link: task={task_id}, size={output_size}")
+            task.output_file_url = result_links.publish(temp_output, task_id)
+            await safe_send_text(
+                bot=bot,
+                chat_id=user.telegram_id,
+                text=(
+                    f"✅ <b>Видео готово!</b>\n\n"
+                    f"Файл слишком большой для Telegram ({output_size // 1024 // 1024} МБ), "
+                    f"скачайте по ссылке (действует {settings.RESULT_LINK_TTL // 3600} ч):\n"
+                    f"<a href=\"{html.escape(task.output_file_url)}\">⬇️ Скачать видео</a>\n\n"
+                    f"💰 Списано: {int(task.cost)} ген.\n"
+                    f"⚡ Баланс: {int(user.balance)} ген."
+                ),
+                parse_mode="HTML"
+            )
 
-        except TopazAPIError as e:
-            logger.error(f"Topaz API error: {e}, task={task_id}")
+        task.status = TaskStatus.COMPLETED
+        task.output_file_id = result_file_id(sent_message)
+        await _update_task(
+            task_id,
+            status=TaskStatus.COMPLETED,
+            output_file_id=task.output_file_id,
+            output_file_url=task.output_file_url
+        )
+        timer.lap("delivery")
+        
+        if content_hash and task.output_file_id:
+            await result_cache.put(content_hash, task.model, task.parameters, task.output_file_id, file_size)
+        
+        async with async_session_maker() as session:
+            # Доставляем результат задачам-дублям других пользователей
+            await deliver_to_attached(bot, session, task)
             
-            if request_id:
+            if not resumed and not segmented:
+                await processing_estimator.record(
+                    session,
+                    task,
+                    timer,
+                    duration_seconds=duration_seconds,
+                    pixels=pixels,
+                    input_size=file_size
+                )
+        
+        logger.info(f"Video task completed: task={task_id}, total={timer.total:.1f}s")
+
+    except asyncio.CancelledError:
+        # Воркер остановлен принудительно (истек job_completion_wait)
+        if request_id and not uploaded:
+            # Видео не догрузили - запрос бесполезен, повтор начнет заново
+            logger.warning(f"Video task cancelled before upload: task={task_id}, request={request_id}")
+            try:
+                await topaz_client.cancel_video_request(request_id)
+                await _update_task(task_id, topaz_request_id=None)
+            except Exception as cancel_error:
+                logger.error(f"Cancel request failed: {cancel_error}")
+        # Сегментированную задачу не продолжить - повтор начнет заново
+        await _cancel_requests(segment_requests)
+        raise
+
+    except Exception as e:
+        kind = classify_error(e)
+        retry = should_retry(ctx, kind)
+        logger.error(
+            f"Video task error: task={task_id}, kind={kind.value}, "
+            f"try={ctx.get('job_try', 1)}, retry={retry}, error={e}",
+            exc_info=kind == ErrorKind.FATAL
+        )
+
+        if task is None or user is None:
+            if retry:
+                raise Retry(defer=retry_delay(ctx, kind)) from e
+            return
+
+        if retry:
+            # Временная ошибка - повтор через ARQ, генерации не возвращаем
+            delay = retry_delay(ctx, kind)
+            values = {"status": TaskStatus.PENDING}
+            if request_id and not uploaded:
+                # Видео не успели загрузить - повтор начнет с создания нового запроса
                 try:
                     await topaz_client.cancel_video_request(request_id)
                 except Exception as cancel_error:
                     logger.error(f"Cancel request failed: {cancel_error}")
-            
-            task.status = TaskStatus.FAILED
-            task.error_message = str(e)
-            await session.flush()
-            await session.commit()
+                values["topaz_request_id"] = None
+            await _cancel_requests(segment_requests)
+            # Если видео загружено - topaz_request_id сохраняем, повтор продолжит опрос
+            try:
+                async with async_session_maker() as session:
+                    await session.execute(
+                        update(Task)
+                        .where(Task.id == task_id, Task.status == TaskStatus.PROCESSING)
+                        .values(**values)
+                    )
+                    await session.commit()
+            except Exception as db_error:
+                logger.error(f"Retry state update error: task={task_id}, error={db_error}")
 
-            # 🔥 ВОЗВРАТ - баланс был списан при создании, теперь возвращаем
-            await _safe_refund(session, user, task, e.user_message or str(e))
+            if progress_message:
+                await safe_edit_text(
+                    progress_message,
+                    f"⏳ <b>Временная ошибка</b>\n\n"
+                    f"Повторю автоматически через {max(1, delay // 60)} мин",
+                    parse_mode="HTML"
+                )
+            raise Retry(defer=delay) from e
 
-            user_msg = e.user_message or "Ошибка обработки видео"
-            await safe_send_text(
-                bot=bot,
-                chat_id=user.telegram_id,
-                text=(
-                    f"❌ <b>{user_msg}</b>\n\n"
-                    f"💰 Возврат: {int(task.cost)} ген.\n"
-                    f"⚡ Баланс: {int(user.balance)} ген.\n\n"
-                    f"Попробуйте другое видео или напишите в поддержку."
-                ),
-                parse_mode="HTML"
+        # Окончательная ошибка - отменяем запрос, FAILED + возврат генераций
+        if request_id:
+            try:
+                await topaz_client.cancel_video_request(request_id)
+            except Exception as cancel_error:
+                logger.error(f"Cancel request failed: {cancel_error}")
+        await _cancel_requests(segment_requests)
+
+        user_msg = e.user_message if isinstance(e, TopazAPIError) else "Произошла ошибка обработки"
+        try:
+            async with async_session_maker() as session:
+                task = await session.get(Task, task_id)
+                user = await session.get(User, task.user_id)
+                task.status = TaskStatus.FAILED
+                task.error_message = f"{kind.value}: {e}"[:1000]
+                await session.commit()
+                await _safe_refund(session, user, task, user_msg)
+        except Exception as db_error:
+            # Задача останется PROCESSING - ее подберет reaper
+            logger.error(f"Failure state update error: task={task_id}, error={db_error}")
+            return
+
+        if kind in DEAD_LETTER_KINDS:
+            await dead_letters.push(
+                task_id=task_id,
+                function="process_video_task",
+                queue_name=WorkerSettings.queue_name,
+                args=[task_id, user_telegram_id, video_file_id],
+                error=str(e),
+                kind=kind.value,
+                tries=ctx.get("job_try", 1)
             )
 
-        except Exception as e:
-            logger.exception(f"Unexpected error: task={task_id}, error={e}")
-            
-            task.status = TaskStatus.FAILED
-            task.error_message = f"Internal error: {str(e)}"
-            await session.flush()
-            await session.commit()
+        hint = (
+            "Попробуйте другое видео или напишите в поддержку."
+            if kind == ErrorKind.USER_INPUT else
+            "Попробуйте позже или напишите в поддержку."
+        )
+        await safe_send_text(
+            bot=bot,
+            chat_id=user.telegram_id,
+            text=(
+                f"❌ <b>{user_msg}</b>\n\n"
+                f"💰 Возврат: {int(task.cost)} ген.\n"
+                f"⚡ Баланс: {int(user.balance)} ген.\n\n"
+                f"{hint}"
+            ),
+            parse_mode="HTML"
+        )
 
-            # 🔥 ВОЗВРАТ - баланс был списан при создании, теперь возвращаем
-            await _safe_refund(session, user, task, "Внутренняя ошибка")
+    finally:
+        if heartbeat:
+            heartbeat.cancel()
+        disk_manager.cleanup_file(temp_input)
+        disk_manager.cleanup_file(temp_output)
+        for path in segment_files:
+            disk_manager.cleanup_file(path)
+        await disk_ledger.release(disk_reservation)
+        if reservation:
+            await reservation.release()
+        await bot.session.close()
 
-            await safe_send_text(
-                bot=bot,
-                chat_id=user.telegram_id,
-                text=(
-                    f"❌ <b>Произошла ошибка обработки</b>\n\n"
-                    f"💰 Возврат: {int(task.cost)} ген.\n"
-                    f"⚡ Баланс: {int(user.balance)} ген.\n\n"
-                    f"Попробуйте позже или напишите в поддержку."
-                ),
-                parse_mode="HTML"
+
+async def process_video_preview(
+    ctx,
+    user_telegram_id: int,
+    video_file_id: str,
+    file_unique_id: str,
+    model: str,
+    parameters: dict
+):
+    """
+    Превью: несколько секунд из середины видео выбранной моделью
+    ✅ Выполняется в image worker - короткие задачи, превью не ждет длинные видео
+    ✅ Topaz ждем не дольше VIDEO_PREVIEW_TIMEOUT - слот image worker не занят надолго
+    ✅ Бесплатно, без задачи в БД; ошибка - просто сообщение пользователю
+    ✅ Скачанное видео остается для полной обработки (VIDEO_PREVIEW_KEEP_INPUT)
+    """
+    bot = create_bot()
+    temp_input = None
+    clip_path = None
+    result_path = None
+    disk_reservation = None
+    request_ids: List[str] = []
+
+    try:
+        # Повторное превью другой моделью - видео уже скачано
+        temp_input = await _take_preview_input(file_unique_id)
+        if not temp_input:
+            file = await bot.get_file(video_file_id)
+            # Резерв под вход на общем томе (фрагмент и результат превью - единицы МБ)
+            disk_reservation = await disk_ledger.reserve(file.file_size or 0, ttl=settings.VIDEO_JOB_TIMEOUT)
+            temp_input, _ = await disk_manager.download_to_temp(
+                bot, file.file_path, ".mp4", reservation=disk_reservation
             )
 
-        finally:
-            disk_manager.cleanup_file(temp_input)
-            disk_manager.cleanup_file(temp_output)
-            await bot.session.close()
+        duration = parameters.get("source", {}).get("duration") or await probe_duration(temp_input) or 0
+        seconds = settings.VIDEO_PREVIEW_SECONDS
+        clip_path = disk_manager.new_temp_path(".mp4")
+        await cut_clip(temp_input, clip_path, max(0.0, duration / 2 - seconds / 2), seconds)
+        disk_manager.adopt_temp_file(clip_path)
+
+        # Задачи нет - в логах фрагмента task=0
+        result_path = await _process_segment(
+            0, clip_path, parameters, request_ids, [0], 0, disk_reservation,
+            timeout=settings.VIDEO_PREVIEW_TIMEOUT
+        )
+
+        await safe_send_video(
+            bot=bot,
+            chat_id=user_telegram_id,
+            video=local_input_file(result_path),
+            caption=f"👁 <b>Превью</b> ({seconds} сек., без звука)",
+            parse_mode="HTML"
+        )
+        await safe_send_text(
+            bot=bot,
+            chat_id=user_telegram_id,
+            text="Обработать всё видео этой моделью?",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="✅ Обработать всё видео", callback_data=f"vid_model:{model}")],
+                [InlineKeyboardButton(text="◀️ Другая модель", callback_data="vid_models")],
+                [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")]
+            ])
+        )
+
+        if await _keep_preview_input(file_unique_id, temp_input):
+            temp_input = None
+
+        logger.info(f"Video preview sent: user={user_telegram_id}, model={model}")
+
+    except asyncio.CancelledError:
+        await _cancel_requests(request_ids)
+        raise
+
+    except Exception as e:
+        logger.error(f"Video preview error: user={user_telegram_id}, model={model}, error={e}")
+        await _cancel_requests(request_ids)
+        await safe_send_text(
+            bot=bot,
+            chat_id=user_telegram_id,
+            text="❌ Не удалось сделать превью. Можно выбрать модель и обработать видео целиком.",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="◀️ К выбору модели", callback_data="vid_models")]
+            ])
+        )
+
+    finally:
+        disk_manager.cleanup_file(result_path)
+        disk_manager.cleanup_file(clip_path)
+        disk_manager.cleanup_file(temp_input)
+        await disk_ledger.release(disk_reservation)
+        await bot.session.close()
+
+
+async def cleanup_result_links(ctx):
+    await asyncio.to_thread(result_links.cleanup_expired)
 
 
 async def startup(ctx):
+    ctx["janitor"] = asyncio.create_task(temp_janitor.run())
     logger.info("✅ Video worker started")
 
 
 async def shutdown(ctx):
+    janitor = ctx.get("janitor")
+    if janitor:
+        janitor.cancel()
     await topaz_client.close()
     logger.info("🛑 Video worker stopped")
 
 
 class WorkerSettings:
     functions = [process_video_task]
+    cron_jobs = [
+        # Сверка зависших задач каждые 5 минут
+        cron(reap_stuck_tasks, minute=set(range(0, 60, 5))),
+        # Просроченные результаты-ссылки раз в час
+        cron(cleanup_result_links, minute=17)
+    ]
     redis_settings = get_redis_settings()
-    max_jobs = 3
-    job_timeout = 7200
+    max_jobs = settings.VIDEO_WORKER_MAX_JOBS
+    job_timeout = settings.VIDEO_JOB_TIMEOUT
     keep_result = 3600
+    max_tries = settings.WORKER_MAX_TRIES
     on_startup = startup
     on_shutdown = shutdown
     queue_name = "arq:video_queue"
\ No newline at end of file
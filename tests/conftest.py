@@ -0,0 +1,17 @@
+import os
+
+# Обязательные настройки (src.core.config) - тесты не ходят ни в БД, ни в Telegram
+for name, value in {
+    "BOT_TOKEN": "123456:test",
+    "WEBHOOK_URL": "https://example.com",
+    "WEBHOOK_SECRET": "test",
+    "DB_HOST": "localhost",
+    "DB_NAME": "test",
+    "DB_USER": "test",
+    "DB_PASSWORD": "test",
+    "TOPAZ_API_KEY": "test",
+    "YOOKASSA_SHOP_ID": "test",
+    "YOOKASSA_SECRET_KEY": "test",
+    "YOOKASSA_RETURN_URL": "https://example.com",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,112 @@
+"""
+Порядок обработки апдейтов webhook (UpdateExecutor)
+
+Диспетчер подменен: хендлер повторяет сборку альбома (ведущий апдейт ждет остальные фото).
+"""
+import asyncio
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import SendMessage
+from aiogram.types import Update
+from src.web.update_executor import UpdateExecutor, update_chat_key
+
+CHAT_ID = 1001
+ALBUM_ID = "13724529876312345"
+COLLECT_DELAY = 0.05
+
+
+def _message_update(update_id: int, media_group_id: str = None) -> Update:
+    message = {
+        "message_id": update_id,
+        "date": 1718000000,
+        "chat": {"id": CHAT_ID, "type": "private"},
+        "from": {"id": CHAT_ID, "is_bot": False, "first_name": "Test"},
+        "text": f"message {update_id}",
+    }
+    if media_group_id:
+        message["media_group_id"] = media_group_id
+    return Update.model_validate({"update_id": update_id, "message": message})
+
+
+class AlbumDispatcher:
+    """Как album_received: первый апдейт альбома ждет и забирает все фото"""
+
+    def __init__(self):
+        self.items = []
+        self.leaders = set()
+        self.collected = []
+        self.handled = []
+
+    async def feed_update(self, bot, update: Update):
+        message = update.message
+        self.handled.append(message.message_id)
+        if not message.media_group_id:
+            return None
+
+        self.items.append(message.message_id)
+        if message.media_group_id in self.leaders:
+            return None
+        self.leaders.add(message.media_group_id)
+
+        await asyncio.sleep(COLLECT_DELAY)
+        self.collected.append(sorted(self.items))
+        return None
+
+
+async def _run(updates):
+    dp = AlbumDispatcher()
+    executor = UpdateExecutor(bot=None, dp=dp, concurrency=8, max_pending=100)
+    executor.start()
+    for update in updates:
+        assert executor.submit(update)
+    await executor.close(timeout=5)
+    return dp
+
+
+def test_album_updates_are_collected_by_leader():
+    dp = asyncio.run(_run([_message_update(update_id, ALBUM_ID) for update_id in range(1, 6)]))
+
+    assert dp.collected == [[1, 2, 3, 4, 5]]
+
+
+def test_chat_messages_keep_order():
+    dp = asyncio.run(_run([_message_update(update_id) for update_id in range(1, 6)]))
+
+    assert dp.handled == [1, 2, 3, 4, 5]
+    assert update_chat_key(_message_update(1)) == CHAT_ID
+    assert update_chat_key(_message_update(1, ALBUM_ID)) != update_chat_key(_message_update(2, ALBUM_ID))
+
+
+class ReplyDispatcher:
+    """Как cmd_help: хендлер возвращает метод вместо вызова"""
+
+    async def feed_update(self, bot, update: Update):
+        return SendMessage(chat_id=update.message.chat.id, text="help")
+
+
+class BlockedBot:
+    """Пользователь заблокировал бота"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, method):
+        self.calls += 1
+        raise TelegramForbiddenError(method=method, message="Forbidden: bot was blocked by the user")
+
+
+def test_returned_method_to_blocked_user_is_logged(caplog):
+    bot = BlockedBot()
+
+    async def run():
+        executor = UpdateExecutor(bot=bot, dp=ReplyDispatcher(), concurrency=1, max_pending=10)
+        executor.start()
+        assert executor.submit(_message_update(1))
+        await executor.close(timeout=5)
+        return executor
+
+    executor = asyncio.run(run())
+
+    assert bot.calls == 1
+    assert executor.processed == 1
+    assert [record.levelname for record in caplog.records] == ["WARNING"]
+    assert "Bot blocked by user" in caplog.records[0].getMessage()
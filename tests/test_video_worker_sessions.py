@@ -0,0 +1,205 @@
+"""
+Видео-воркер не держит соединение с БД, пока ждет Telegram и Topaz
+
+Фабрика сессий подменена счетчиком открытых сессий, клиент Topaz -
+заглушкой, которая проверяет счетчик при каждом вызове.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+from src.db.models import Task, TaskStatus, User
+from src.workers import video_worker
+
+TASK_ID = 1
+USER_TELEGRAM_ID = 1001
+
+
+class SessionCounter:
+    def __init__(self):
+        self.open = 0
+        self.checkouts = 0
+
+
+class FakeSession:
+    def __init__(self, counter: SessionCounter, rows: dict):
+        self.counter = counter
+        self.rows = rows
+
+    async def __aenter__(self):
+        self.counter.open += 1
+        self.counter.checkouts += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.counter.open -= 1
+
+    async def get(self, model, ident):
+        return self.rows.get(model)
+
+    async def execute(self, statement):
+        # claim_task: условный UPDATE забрал задачу
+        return SimpleNamespace(rowcount=1)
+
+    async def refresh(self, instance):
+        pass
+
+    async def commit(self):
+        pass
+
+
+class FakeTopaz:
+    """Каждый сетевой вызов - только без открытой сессии"""
+
+    def __init__(self, counter: SessionCounter):
+        self.counter = counter
+        self.calls = []
+
+    def _call(self, name: str):
+        assert self.counter.open == 0, f"DB session is held during topaz_client.{name}"
+        self.calls.append(name)
+
+    async def create_video_request(self, **kwargs):
+        self._call("create_video_request")
+        return {"requestId": "req-1"}
+
+    async def accept_video_request(self, request_id):
+        self._call("accept_video_request")
+        return {"urls": ["https://upload"]}
+
+    async def upload_video_to_url(self, upload_url, video_data):
+        self._call("upload_video_to_url")
+        return "etag"
+
+    async def complete_video_upload(self, request_id, upload_results):
+        self._call("complete_video_upload")
+        return {}
+
+    async def get_video_status(self, request_id):
+        self._call("get_video_status")
+        return {"status": "complete", "progress": 100, "download": {"url": "https://download"}}
+
+    async def cancel_video_request(self, request_id):
+        self._call("cancel_video_request")
+        return {}
+
+
+class FakeBot:
+    def __init__(self, counter: SessionCounter):
+        self.counter = counter
+        self.session = SimpleNamespace(close=self._noop)
+
+    async def _noop(self, *args, **kwargs):
+        pass
+
+    async def send_message(self, *args, **kwargs):
+        assert self.counter.open == 0, "DB session is held during bot.send_message"
+        return SimpleNamespace(message_id=1)
+
+    async def get_file(self, file_id):
+        assert self.counter.open == 0, "DB session is held during bot.get_file"
+        return SimpleNamespace(file_path="videos/file.mp4", file_size=1000)
+
+
+class FakeReservation:
+    async def release(self):
+        pass
+
+
+async def _noop(*args, **kwargs):
+    return None
+
+
+@pytest.fixture
+def worker(monkeypatch, tmp_path):
+    counter = SessionCounter()
+    task = SimpleNamespace(
+        id=TASK_ID,
+        user_id=1,
+        model="prob-4",
+        cost=10,
+        status=TaskStatus.PENDING,
+        parameters=json.dumps({
+            "source": {"duration": 10, "resolution": {"width": 1920, "height": 1080}, "size": 1000},
+            "output": {},
+            "filters": []
+        }),
+        parent_task_id=None,
+        topaz_request_id=None,
+        input_file_unique_id="unique",
+        output_file_id=None,
+        output_file_url=None
+    )
+    user = SimpleNamespace(id=1, telegram_id=USER_TELEGRAM_ID, balance=100)
+    rows = {Task: task, User: user}
+    topaz = FakeTopaz(counter)
+
+    async def download_to_temp(bot, file_path, suffix, hasher=None, reservation=None):
+        assert counter.open == 0, "DB session is held during the Telegram download"
+        path = tmp_path / f"input{suffix}"
+        path.write_bytes(b"input")
+        return str(path), 5
+
+    async def download_result(download_url, task_id, disk_reservation=None):
+        assert counter.open == 0, "DB session is held during the result download"
+        path = tmp_path / "output.mp4"
+        path.write_bytes(b"result")
+        return str(path), 6
+
+    async def send_video(*args, **kwargs):
+        assert counter.open == 0, "DB session is held during the result upload"
+        return SimpleNamespace(video=SimpleNamespace(file_id="result-file"), photo=None, document=None)
+
+    async def acquire(**kwargs):
+        return FakeReservation()
+
+    real_sleep = asyncio.sleep
+
+    async def fast_sleep(delay, *args, **kwargs):
+        await real_sleep(0)
+
+    monkeypatch.setattr(video_worker, "async_session_maker", lambda: FakeSession(counter, rows))
+    monkeypatch.setattr(video_worker, "topaz_client", topaz)
+    monkeypatch.setattr(video_worker, "create_bot", lambda: FakeBot(counter))
+    monkeypatch.setattr(video_worker, "is_draining", lambda: False)
+    # Heartbeat - отдельная короткая транзакция параллельно с задачей, здесь не нужен
+    monkeypatch.setattr(video_worker, "_heartbeat", _noop)
+    monkeypatch.setattr(video_worker, "_check_cancel_flag", _noop)
+    monkeypatch.setattr(video_worker, "_take_preview_input", _noop)
+    monkeypatch.setattr(video_worker, "_download_result", download_result)
+    monkeypatch.setattr(video_worker, "video_budget", SimpleNamespace(acquire=acquire))
+    monkeypatch.setattr(video_worker, "disk_ledger", SimpleNamespace(reserve=_noop, consume=_noop, release=_noop))
+    monkeypatch.setattr(video_worker, "processing_estimator", SimpleNamespace(
+        ensure_fresh=_noop, estimate=lambda *args: None, record=_noop
+    ))
+    monkeypatch.setattr(video_worker, "file_validator", SimpleNamespace(validate_video_size=lambda size: (True, None)))
+    monkeypatch.setattr(video_worker, "disk_manager", SimpleNamespace(
+        download_to_temp=download_to_temp,
+        cleanup_file=lambda path: None
+    ))
+    monkeypatch.setattr(video_worker, "result_cache", SimpleNamespace(get=_noop, put=_noop))
+    monkeypatch.setattr(video_worker, "safe_send_video", send_video)
+    monkeypatch.setattr(video_worker, "safe_send_text", _noop)
+    monkeypatch.setattr(video_worker, "safe_edit_text", _noop)
+    monkeypatch.setattr(video_worker, "safe_delete_message", _noop)
+    monkeypatch.setattr(video_worker, "deliver_to_attached", _noop)
+    monkeypatch.setattr(video_worker, "max_upload_size", lambda: 1024 ** 3)
+    monkeypatch.setattr(video_worker, "local_input_file", lambda path: path)
+    monkeypatch.setattr(video_worker.asyncio, "sleep", fast_sleep)
+    monkeypatch.setattr(video_worker.settings, "VIDEO_SEGMENT_ENABLED", False)
+
+    return SimpleNamespace(counter=counter, topaz=topaz, task=task)
+
+
+def test_no_session_held_during_network_waits(worker):
+    ctx = {"job_try": 1, "redis": None}
+    asyncio.run(video_worker.process_video_task(ctx, TASK_ID, USER_TELEGRAM_ID, "video-file"))
+
+    assert worker.task.status == TaskStatus.COMPLETED
+    assert worker.topaz.calls[:4] == [
+        "create_video_request", "accept_video_request", "upload_video_to_url", "complete_video_upload"
+    ]
+    assert "get_video_status" in worker.topaz.calls
+    # Сессии были (короткие транзакции), но ни одна не осталась открытой
+    assert worker.counter.checkouts > 0
+    assert worker.counter.open == 0